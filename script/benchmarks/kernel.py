@@ -0,0 +1,59 @@
+"""
+Benchmark of the QTY rounding of `convert_file`: per-row `normal_round` against `round_half_up`.
+
+Run from the `script` folder:
+    python -m benchmarks.kernel --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.tools import normal_round
+from utils.convert_kernel import round_half_up
+
+
+def sample_values(rows: int, seed: int = 0) -> np.ndarray:
+    """
+    Random quantities mixed with the values where rounding is delicate: exact halves, negative
+    numbers, integers, values right below or above .5 and large magnitudes.
+    """
+    rng = np.random.default_rng(seed)
+    edges = np.array([0.5, -0.5, 1.5, -1.5, 2.5, -2.5, 0.0, -0.0, 0.49999999999999994,
+                      -0.49999999999999994, 0.5000000000000001, 1e15 + 0.5, -1e15 - 0.5, 2.0**52 + 1])
+    values = np.concatenate([
+        rng.uniform(-1000, 1000, rows),
+        rng.integers(-1000, 1000, rows) + 0.5,
+        rng.integers(-1000, 1000, rows).astype(float),
+        np.nextafter(rng.integers(-1000, 1000, rows) + 0.5, 0),
+        edges,
+    ])
+    return rng.permutation(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=250000)
+    args = parser.parse_args()
+
+    qty = pd.Series(sample_values(args.rows))
+
+    start = time.perf_counter()
+    expected = qty.apply(lambda x: int(normal_round(x)))
+    apply_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = pd.Series(round_half_up(qty.to_numpy()))
+    vectorized_time = time.perf_counter() - start
+
+    # Equivalence with the per-row path, value by value
+    pd.testing.assert_series_equal(result, expected)
+    print(f"values: {len(qty)}, all equal to normal_round")
+    print(f"apply:      {apply_time:8.3f} s")
+    print(f"vectorized: {vectorized_time:8.3f} s")
+    print(f"speedup:    {apply_time / vectorized_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
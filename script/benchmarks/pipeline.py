@@ -0,0 +1,226 @@
+"""
+Benchmark of the whole download and tag pipeline on a synthetic SharePoint tree.
+
+Each stage is timed separately: release discovery, tree scanning, workbook parsing, rounding,
+per-file writes, aggregation, the whole `find_and_convert_files` and `put_tag`. The throughput
+(files/s, rows/s) and the peak traced memory of each stage are printed and saved as JSON, so
+that runs can be compared across commits.
+
+Run from the `script` folder:
+    python -m benchmarks.pipeline --regions 5 --matching 20 --rows 2000 --output before.json
+    python -m benchmarks.pipeline --regions 5 --matching 20 --rows 2000 --compare before.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from benchmarks.tree import add_spec_arguments, make_tree, spec_from_args
+from core.config_loader import ConfigLoader
+from core.release_manager import ReleaseManager
+from core.tree_index import SharePointIndex
+from utils.aggregate import AggregateSink
+from utils.convert_kernel import COLUMNS, normalize_text_columns, round_qty
+from utils.tools import find_and_convert_files, put_tag, rollback_tag
+from utils.writers import get_writers
+from utils.xlsx_reader import read_budget_workbook
+
+
+def quiet(message: str):
+    pass
+
+
+def measure(func: Callable[[], Any], reset: Optional[Callable[[], None]] = None,
+            memory: bool = True) -> tuple[Any, float, Optional[int]]:
+    """
+    Run `func` returning its result, the elapsed seconds and the peak traced memory in bytes.
+
+    The time and the memory are measured in two separate runs, since tracing slows the run down;
+    `reset` is called between the two, to undo the side effects of the first one.
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    if not memory:
+        return result, elapsed, None
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def stage_result(elapsed: float, peak: Optional[int], files: int, rows: int) -> dict:
+    return {
+        "seconds": round(elapsed, 4),
+        "files": files,
+        "rows": rows,
+        "files_per_second": round(files / elapsed, 2) if elapsed > 0 else None,
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "peak_mib": round(peak / 2**20, 2) if peak is not None else None,
+    }
+
+
+def read_workbook(file_path: Path, reader: str) -> pd.DataFrame:
+    """Parse a workbook as `convert_file` does, without rounding the QTY."""
+    if reader == "streaming":
+        df, _ = read_budget_workbook(file_path, round_func=lambda qty: qty)
+        return df
+    df = pd.read_excel(
+        file_path,
+        usecols="A:F",
+        dtype={"A": "str", "B": "str", "C": "str", "D": "str", "E": "str", "F": "float"},
+        engine="openpyxl"
+    )
+    df = df.dropna()
+    df.columns = COLUMNS
+    return df
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(root: Path, out: Path, tree: dict, config: ConfigLoader, reader: str, workers: int,
+                 memory: bool = True) -> dict[str, dict]:
+    """Time each stage on the first release of the tree and return the results by stage."""
+    regions = tree["regions"]
+    budget_folder = tree["budget_folder"]
+    file_pattern = config.get('pattern file')
+    release = tree["releases"][0]
+    outputs = config.get('outputs')
+    stages = {}
+
+    release_manager = ReleaseManager(root, config.get('pattern release'), regions=regions,
+                                     budget_folder=budget_folder, file_pattern=file_pattern)
+    releases, elapsed, peak = measure(release_manager.discover_releases, memory=memory)
+    stages["releases"] = stage_result(elapsed, peak, sum(info.files for info in releases), 0)
+
+    def scan():
+        index = SharePointIndex(root, regions=regions, budget_folder=budget_folder,
+                                file_pattern=file_pattern, releases=[release])
+        return [(region, file.path) for region in regions for file in index.get_files(region, release)]
+
+    files, elapsed, peak = measure(scan, memory=memory)
+    stages["scan"] = stage_result(elapsed, peak, len(files), 0)
+
+    frames, elapsed, peak = measure(lambda: [read_workbook(path, reader) for _, path in files], memory=memory)
+    rows = sum(len(df) for df in frames)
+    stages["parse"] = stage_result(elapsed, peak, len(files), rows)
+
+    def convert():
+        converted = []
+        for df in frames:
+            df = df.copy()
+            df["QTY"] = round_qty(df["QTY"])
+            converted.append(normalize_text_columns(df))
+        return converted
+
+    converted, elapsed, peak = measure(convert, memory=memory)
+    stages["round"] = stage_result(elapsed, peak, len(files), rows)
+
+    def write():
+        for (region, path), df in zip(files, converted):
+            save_path = out / "files" / region
+            save_path.mkdir(parents=True, exist_ok=True)
+            for writer in get_writers(outputs):
+                writer.write(df, save_path / f"{path.stem}{writer.extension}")
+
+    _, elapsed, peak = measure(write, memory=memory)
+    stages["write"] = stage_result(elapsed, peak, len(files), rows)
+
+    def aggregate():
+        sink = AggregateSink(out / "aggregate", "aggregate", outputs=config.get('aggregate_outputs'))
+        for (_, path), df in zip(files, converted):
+            sink.append(df, path)
+        sink.close()
+
+    _, elapsed, peak = measure(aggregate, memory=memory)
+    stages["aggregate"] = stage_result(elapsed, peak, len(files), rows)
+
+    save_path = out / "download"
+
+    def download():
+        return find_and_convert_files(release, file_pattern, root, regions, budget_folder, save_path,
+                                      log_func=quiet, workers=workers, reader=reader, outputs=outputs,
+                                      aggregate_outputs=config.get('aggregate_outputs'))
+
+    (summaries, errors), elapsed, peak = measure(download, memory=memory)
+    stages["download"] = stage_result(elapsed, peak, len(summaries), sum(summary.rows for summary in summaries))
+
+    def tag():
+        return put_tag(release, file_pattern, save_path, root, regions, budget_folder, log_func=quiet)
+
+    renamed, elapsed, peak = measure(tag, reset=lambda: rollback_tag(save_path, root, log_func=quiet), memory=memory)
+    stages["tag"] = stage_result(elapsed, peak, len(renamed), 0)
+    return stages
+
+
+def print_stages(stages: dict[str, dict], previous: Optional[dict[str, dict]] = None):
+    header = f"{'stage':<10} {'seconds':>9} {'files/s':>10} {'rows/s':>12} {'peak MiB':>9}"
+    print(header + ("  vs previous" if previous else ""))
+    for name, stage in stages.items():
+        line = (f"{name:<10} {stage['seconds']:>9.3f} {stage['files_per_second'] or 0:>10.1f} "
+                f"{stage['rows_per_second'] or 0:>12.0f} {stage['peak_mib'] if stage['peak_mib'] is not None else '-':>9}")
+        if previous and name in previous and stage['seconds'] > 0:
+            line += f"  {previous[name]['seconds'] / stage['seconds']:.2f}x faster"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_spec_arguments(parser)
+    parser.add_argument("--reader", choices=["pandas", "streaming"], default="streaming")
+    parser.add_argument("--workers", type=int, default=1, help="Conversion processes of the download stage")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced runs measuring the peak memory")
+    parser.add_argument("--root", help="Folder where the tree and the outputs are created, kept after the run")
+    parser.add_argument("--output", help="JSON file of the results (default: pipeline_{commit}_{timestamp}.json)")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    config = ConfigLoader(config_path=Path(__file__).parents[1] / "config.yaml")
+    spec = spec_from_args(args)
+    commit = git_commit()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(args.root) if args.root else Path(tmp_dir)
+        tree = make_tree(work_dir / "sharepoint", spec)
+        stages = run_pipeline(work_dir / "sharepoint", work_dir / "out", tree, config,
+                              reader=args.reader, workers=args.workers, memory=not args.no_memory)
+
+    result = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "reader": args.reader,
+        "workers": args.workers,
+        "tree": {key: value for key, value in tree.items() if key != "root"},
+        "spec": vars(spec),
+        "stages": stages,
+    }
+    output = Path(args.output or f"pipeline_{commit or 'nocommit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.write_text(json.dumps(result, indent=2))
+
+    previous = json.loads(Path(args.compare).read_text())["stages"] if args.compare else None
+    print_stages(stages, previous)
+    print(f"Results saved in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of the local staging prefetch on a folder simulating the latency of OneDrive.
+
+Run from the `script` folder:
+    python -m benchmarks.prefetch --files 12 --rows 2000 --latency 0.3 --locked 1
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.tree import write_budget_workbook
+from utils.prefetch import StagingPrefetcher
+from utils.tools import convert_file
+
+
+class LatentCopy:
+    """
+    Copy function simulating a cloud-synced folder: every copy first waits `latency` seconds,
+    as the download of the file, and the first `locked` attempts on each file fail as if the
+    file were locked by the sync client.
+    """
+    def __init__(self, latency: float, locked: int = 0):
+        self.latency = latency
+        self.locked = locked
+        self.attempts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, source: Path, target: Path):
+        with self._lock:
+            self.attempts[source] += 1
+            attempt = self.attempts[source]
+        time.sleep(self.latency)
+        if attempt <= self.locked:
+            raise PermissionError(f"'{source.name}' is being used by another process")
+        shutil.copyfile(source, target)
+
+
+def convert_staged(files: list[Path], out: Path, copy_func: LatentCopy, ahead: int, backoff: float) -> float:
+    """
+    Convert the files reading them through `copy_func` and return the elapsed seconds.
+
+    With `ahead` 0 each file is fetched only when the previous one is converted, as when reading in place.
+    """
+    start = time.perf_counter()
+    if ahead:
+        with StagingPrefetcher(files, ahead=ahead, copy_func=copy_func, backoff=backoff) as prefetcher:
+            for source, path in prefetcher:
+                if isinstance(path, OSError):
+                    raise path
+                convert_file(path, out, log_func=lambda message: None, reader="streaming")
+                prefetcher.release(path)
+    else:
+        for file in files:
+            with StagingPrefetcher([file], ahead=1, copy_func=copy_func, backoff=backoff) as prefetcher:
+                for source, path in prefetcher:
+                    if isinstance(path, OSError):
+                        raise path
+                    convert_file(path, out, log_func=lambda message: None, reader="streaming")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds to download each file")
+    parser.add_argument("--locked", type=int, default=0, help="Failed attempts on each file before it can be copied")
+    parser.add_argument("--ahead", type=int, default=4)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = Path(tmp_dir) / "sharepoint"
+        source_dir.mkdir()
+        rng = random.Random(0)
+        files = []
+        for i in range(args.files):
+            files.append(source_dir / f"USA_SKU_{i:03d}.xlsx")
+            write_budget_workbook(files[-1], "USA", args.rows, rng)
+
+        results = {}
+        for ahead in (0, args.ahead):
+            out = Path(tmp_dir) / f"out_{ahead}"
+            elapsed = convert_staged(files, out, LatentCopy(args.latency, args.locked), ahead, args.backoff)
+            results[ahead] = (elapsed, {path.name: path.read_bytes() for path in out.glob("*.txt")})
+
+        assert results[0][1] == results[args.ahead][1], "The staged conversion differs"
+        leftovers = list(Path(tempfile.gettempdir()).glob("download_bgt_staging_*"))
+
+    baseline, prefetched = results[0][0], results[args.ahead][0]
+    print(f"files: {args.files}, rows: {args.rows}, latency: {args.latency} s, locked attempts: {args.locked}")
+    print(f"in place:          {baseline:8.2f} s  {args.files / baseline:6.1f} files/s")
+    print(f"prefetch ahead {args.ahead}: {prefetched:8.2f} s  {args.files / prefetched:6.1f} files/s")
+    print(f"speedup:           {baseline / prefetched:8.2f}x")
+    print(f"staging folders left: {len(leftovers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of the workbook readers used by `convert_file` on synthetic large files.
+
+Run from the `script` folder:
+    python -m benchmarks.reader --rows 50000 --empty-rows 200000
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+from openpyxl.styles import PatternFill
+
+from utils.tools import normal_round
+from utils.xlsx_reader import read_budget_workbook
+
+
+def make_workbook(file_path: str | Path, rows: int, empty_rows: int, extra_columns: int = 10, seed: int = 0):
+    """
+    Write a synthetic budget workbook.
+
+    The sheet has `rows` budget rows (with a few incomplete ones that are dropped), `extra_columns`
+    unused columns on the right and `empty_rows` formatted but empty rows at the bottom, as in the
+    templates shared on SharePoint.
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["REGION", "MODEL", "SIZE", "COLOR", "P", "QTY"] + [f"NOTE{i}" for i in range(extra_columns)])
+    for i in range(rows):
+        qty = rng.choice([rng.randint(0, 50), rng.uniform(-5, 50), rng.randint(0, 50) + 0.5, None])
+        sheet.append(["USA", f"0RB{i % 5000:04d}", rng.choice([50, 52, 54]), f"{rng.randint(1, 999):03d}", "P", qty]
+                     + ["x"] * extra_columns)
+
+    fill = PatternFill("solid", fgColor="DDEBF7")
+    for row in range(rows + 2, rows + 2 + empty_rows):
+        for column in range(1, 7):
+            sheet.cell(row=row, column=column).fill = fill
+    workbook.save(file_path)
+
+
+def read_pandas(file_path: str | Path) -> pd.DataFrame:
+    """The reader of `convert_file` with `reader="pandas"`."""
+    df = pd.read_excel(
+        file_path,
+        usecols="A:F",
+        dtype={"A": "str", "B": "str", "C": "str", "D": "str", "E": "str", "F": "float"},
+        engine="openpyxl"
+    )
+    df = df.dropna()
+    df.columns = ['REGION', 'MODEL', 'SIZE', 'COLOR', 'P', 'QTY']
+    df["QTY"] = df["QTY"].apply(lambda x: int(normal_round(x)))
+    return df
+
+
+def read_streaming(file_path: str | Path) -> pd.DataFrame:
+    """The reader of `convert_file` with `reader="streaming"`."""
+    df, _ = read_budget_workbook(file_path, round_func=lambda qty: qty.apply(lambda x: int(normal_round(x))))
+    return df
+
+
+def measure(func, *args) -> tuple[object, float, int]:
+    """
+    Run `func` returning its result, the elapsed seconds and the peak traced memory in bytes.
+
+    The time and the memory are measured in two separate runs, since tracing slows the run down.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--empty-rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = Path(tmp_dir) / "USA_SKU_BENCH.xlsx"
+        make_workbook(file_path, rows=args.rows, empty_rows=args.empty_rows)
+
+        expected, pandas_time, pandas_peak = measure(read_pandas, file_path)
+        result, streaming_time, streaming_peak = measure(read_streaming, file_path)
+
+    pd.testing.assert_frame_equal(result, expected)
+    print(f"rows: {args.rows}, empty rows: {args.empty_rows}, kept rows: {len(result)}")
+    print(f"pandas:    {pandas_time:8.2f} s  peak {pandas_peak / 2**20:8.1f} MiB")
+    print(f"streaming: {streaming_time:8.2f} s  peak {streaming_peak / 2**20:8.1f} MiB")
+    print(f"speedup:   {pandas_time / streaming_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the GUI startup, up to the point where the window can be drawn.
+
+The imports of `main.py` are timed in a fresh interpreter, listing the heavy modules they load
+(pandas and openpyxl should only be loaded by the first job), then the release list is built
+as `main.py` does on a synthetic tree, with and without the release cache. The time to the
+first paint itself is logged by the GUI ("Window shown in ... s") and in `logs/download_bgt.log`.
+
+Run from the `script` folder:
+    python -m benchmarks.startup --regions 5 --releases 4 --matching 50
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.tree import add_spec_arguments, make_tree, spec_from_args
+from core.config_loader import ConfigLoader
+from core.release_manager import ReleaseManager
+
+HEAVY_MODULES = ["pandas", "openpyxl", "numpy", "pyarrow"]
+
+# Run in a fresh interpreter, so that nothing is imported yet; the GUI module needs customtkinter
+IMPORT_PROBE = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+import core.config_loader, core.sharepoint, core.release_manager, utils.resources
+gui = importlib.util.find_spec("customtkinter") is not None
+if gui:
+    import gui.app
+print(json.dumps({"seconds": time.perf_counter() - start, "gui": gui,
+                  "heavy": [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def time_imports() -> dict:
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=Path(__file__).parents[1],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def time_releases(root: Path, tree: dict, config: ConfigLoader, cache_path: Path) -> dict:
+    """Time a scan of the releases, as done by the GUI in the background, and a read of the cache it writes, as done by `main.py`."""
+    def release_manager() -> ReleaseManager:
+        return ReleaseManager(root, config.get('pattern release'), regions=tree["regions"],
+                              budget_folder=tree["budget_folder"], file_pattern=config.get('pattern file'),
+                              cache_path=cache_path)
+
+    start = time.perf_counter()
+    release_manager().discover_releases()
+    scan = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cached = release_manager().get_cached_releases(allow_stale=True)
+    from_cache = time.perf_counter() - start
+    return {"scan_seconds": scan, "cache_seconds": from_cache, "cached_releases": len(cached or [])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    config = ConfigLoader(config_path=Path(__file__).parents[1] / "config.yaml")
+    imports = time_imports()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tree = make_tree(Path(tmp_dir) / "sharepoint", spec_from_args(args))
+        releases = time_releases(Path(tmp_dir) / "sharepoint", tree, config, Path(tmp_dir) / "releases.json")
+
+    print(f"imports of main.py:   {imports['seconds']:8.3f} s{'' if imports['gui'] else ' (without gui.app, customtkinter missing)'}")
+    print(f"heavy modules loaded: {', '.join(imports['heavy']) or 'none'}")
+    print(f"release scan:         {releases['scan_seconds']:8.3f} s (in the background, not before the first paint)")
+    print(f"release cache:        {releases['cache_seconds']:8.3f} s ({releases['cached_releases']} releases)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Benchmark of the storage backends: the local folder against the Graph backend, on the same tree.
+
+A minimal stand-in of the Microsoft Graph drive API serves a synthetic tree over HTTP/1.1 with
+keep-alive: the paged delta listing (`/root/delta`, `@odata.nextLink`, `@odata.deltaLink`),
+the file contents (redirected to a download URL, as Graph does) and the renames (PATCH). An
+optional latency is added to each request. The listing of the releases, a full and an
+incremental scan, the downloads and a rename round trip are timed, with the requests and the
+connections they took.
+
+Run from the `script` folder:
+    python -m benchmarks.storage --regions 5 --matching 20 --latency 0.02
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.tree import add_spec_arguments, make_tree, spec_from_args
+from core.config_loader import ConfigLoader
+from core.storage import GraphBackend, LocalBackend, StorageBackend
+from core.tree_index import SharePointIndex
+
+PREFIX = "/v1.0/drives/bench"
+
+
+class GraphStub(ThreadingHTTPServer):
+    """
+    HTTP server serving the folder `root` as a Graph drive; item ids are the inode numbers.
+
+    Each delta token is the state of the tree when it was issued, so a later delta request
+    returns the items changed or removed since then.
+    """
+    daemon_threads = True
+
+    def __init__(self, root: Path, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _GraphHandler)
+        self.root = root
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._states: list[dict[str, dict]] = []
+        # Delta token -> the items of the changes being paged and the token that follows them
+        self.pages: dict[str, tuple[list[dict], str]] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{PREFIX}"
+
+    def item(self, path: Path) -> dict:
+        stat = os.stat(path)
+        item = {
+            "id": str(stat.st_ino),
+            "name": path.name,
+            "lastModifiedDateTime": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+        }
+        if path == self.root:
+            item["root"] = {}
+            item["folder"] = {}
+        else:
+            item["parentReference"] = {"id": str(os.stat(path.parent).st_ino)}
+            if path.is_dir():
+                item["folder"] = {}
+            else:
+                item["size"] = stat.st_size
+                item["file"] = {"hashes": {"sha256Hash": f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}"}}
+        return item
+
+    def snapshot(self) -> dict[str, dict]:
+        items = {}
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            for path in [Path(dir_path)] + [Path(dir_path) / name for name in dir_names + file_names]:
+                item = self.item(path)
+                items[item["id"]] = item
+        return items
+
+    def changes(self, token: str | None) -> tuple[list[dict], str]:
+        """Return the items changed since the state of `token` (all of them without one) and the new token."""
+        current = self.snapshot()
+        with self.lock:
+            previous = self._states[int(token)] if token is not None else {}
+            self._states.append(current)
+            new_token = str(len(self._states) - 1)
+        changed = [item for item_id, item in current.items() if previous.get(item_id) != item]
+        removed = [{"id": item_id, "deleted": {}} for item_id in previous.keys() - current.keys()]
+        # Parents before children, as Graph returns them
+        changed.sort(key=lambda item: "root" not in item)
+        return changed + removed, new_token
+
+    def path_of(self, item_id: str) -> Path | None:
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            for name in dir_names + file_names:
+                path = Path(dir_path) / name
+                if str(os.stat(path).st_ino) == item_id:
+                    return path
+        return None
+
+
+class _GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: GraphStub
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start(self) -> tuple[str, dict]:
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        return parts.path, parse_qs(parts.query)
+
+    def do_GET(self):
+        path, query = self._start()
+        if path == f"{PREFIX}/root/delta":
+            self._delta(query)
+        elif path.startswith(f"{PREFIX}/items/") and path.endswith("/content"):
+            item_id = path[len(f"{PREFIX}/items/"):-len("/content")]
+            self.send_response(302)
+            self.send_header("Location", f"/download/{item_id}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif path.startswith("/download/"):
+            file_path = self.server.path_of(path[len("/download/"):])
+            if file_path is None:
+                self._send_json(404, {"error": {"code": "itemNotFound"}})
+                return
+            data = file_path.read_bytes()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {"error": {"code": "itemNotFound"}})
+
+    def _delta(self, query: dict):
+        top = int(query.get("$top", ["200"])[0])
+        if "skiptoken" in query:
+            token, skip = query["skiptoken"][0].split(":")
+            items, new_token = self.server.pages[token]
+        else:
+            items, new_token = self.server.changes(query.get("token", [None])[0])
+            token, skip = new_token, "0"
+            self.server.pages[token] = (items, new_token)
+        skip = int(skip)
+        body = {"value": items[skip:skip + top]}
+        if skip + top < len(items):
+            body["@odata.nextLink"] = f"{self.server.base_url}/root/delta?$top={top}&skiptoken={token}:{skip + top}"
+        else:
+            body["@odata.deltaLink"] = f"{self.server.base_url}/root/delta?token={new_token}"
+        self._send_json(200, body)
+
+    def do_PATCH(self):
+        path, _ = self._start()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        source = self.server.path_of(path[len(f"{PREFIX}/items/"):])
+        if source is None:
+            self._send_json(404, {"error": {"code": "itemNotFound"}})
+            return
+        parent = source.parent
+        if "parentReference" in body:
+            parent = self.server.path_of(body["parentReference"]["id"])
+        target = parent / body.get("name", source.name)
+        if target.exists():
+            self._send_json(409, {"error": {"code": "nameAlreadyExists"}})
+            return
+        os.rename(source, target)
+        self._send_json(200, self.server.item(target))
+
+
+def start_stub(root: Path, latency: float = 0.0) -> GraphStub:
+    server = GraphStub(root, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_backend(backend: StorageBackend, root: Path, tree: dict, config: ConfigLoader) -> dict:
+    """Time a full scan, a rescan, the downloads and a rename round trip of the first release."""
+    release = tree["releases"][0]
+    results = {}
+
+    def scan() -> list:
+        backend.refresh()
+        index = SharePointIndex(root, regions=tree["regions"], budget_folder=tree["budget_folder"],
+                                file_pattern=config.get('pattern file'), releases=[release], backend=backend)
+        return [file for region in tree["regions"] for file in index.get_files(region, release)]
+
+    start = time.perf_counter()
+    files = scan()
+    results["scan_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    scan()
+    results["rescan_seconds"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        for number, file in enumerate(files):
+            backend.download(file.path, Path(tmp_dir) / f"{number}.xlsx")
+        results["download_seconds"] = time.perf_counter() - start
+        results["bytes"] = sum(file.stat().st_size for file in Path(tmp_dir).iterdir())
+
+    source = files[0].path
+    target = source.with_name(f"{source.stem}_renamed{source.suffix}")
+    start = time.perf_counter()
+    backend.rename(source, target)
+    backend.rename(target, source)
+    results["rename_seconds"] = time.perf_counter() - start
+    results["files"] = len(files)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_spec_arguments(parser)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to each request of the Graph stub")
+    parser.add_argument("--page-size", type=int, default=200, help="Items per page of the delta listing")
+    args = parser.parse_args()
+
+    config = ConfigLoader(config_path=Path(__file__).parents[1] / "config.yaml")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "sharepoint"
+        tree = make_tree(root, spec_from_args(args))
+        local = run_backend(LocalBackend(root), root, tree, config)
+
+        server = start_stub(root, args.latency)
+        try:
+            backend = GraphBackend(server.base_url, token="bench", page_size=args.page_size)
+            graph = run_backend(backend, backend.root, tree, config)
+        finally:
+            server.shutdown()
+
+    print(f"{'':<10} {'scan s':>8} {'rescan s':>9} {'download s':>11} {'rename s':>9}")
+    for name, result in [("local", local), ("graph", graph)]:
+        print(f"{name:<10} {result['scan_seconds']:>8.3f} {result['rescan_seconds']:>9.3f} "
+              f"{result['download_seconds']:>11.3f} {result['rename_seconds']:>9.3f}")
+    print(f"{graph['files']} files, {graph['bytes'] / 2**20:.1f} MiB downloaded; "
+          f"graph: {server.requests} requests on {server.connections} connections "
+          f"({args.latency * 1000:.0f} ms latency each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Generator of synthetic SharePoint trees on local disk, laid out as the real one:
+{region}/{budget folder}/{release}/[nested folders]/{workbooks}.
+
+Run from the `script` folder:
+    python -m benchmarks.tree /tmp/sharepoint --regions 5 --releases 2 --matching 20 --rows 2000
+"""
+import argparse
+import json
+import random
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import openpyxl
+
+# The real regions first, then generated names
+REGION_NAMES = ["BRA", "FIL", "JPN", "LATAM", "USA"]
+
+
+@dataclass
+class TreeSpec:
+    """
+    Shape of a synthetic SharePoint tree.
+
+    Attributes:
+        regions (int): Number of region folders.
+        releases (int): Number of release folders in each region, named 'S1 2025', 'S2 2025', 'S1 2026'...
+        depth (int): Number of nested folders inside each release folder; the workbooks are spread over all the levels.
+        matching (int): Workbooks matching the file pattern, per region and release.
+        non_matching (int): Workbooks not matching it (other names or already tagged), per region and release.
+        rows (int): Budget rows per workbook.
+        templates (int): Distinct workbooks generated per region, then copied, since writing them is slow.
+        budget_folder (str): Name of the budget folder inside each region.
+        seed (int): Seed of the generated values.
+    """
+    regions: int = 3
+    releases: int = 2
+    depth: int = 1
+    matching: int = 5
+    non_matching: int = 2
+    rows: int = 1000
+    templates: int = 3
+    budget_folder: str = "BUDGET DEFINITION"
+    seed: int = 0
+
+    def region_names(self) -> list[str]:
+        return [REGION_NAMES[i] if i < len(REGION_NAMES) else f"R{i:03d}" for i in range(self.regions)]
+
+    def release_names(self) -> list[str]:
+        return [f"S{i % 2 + 1} {2025 + i // 2}" for i in range(self.releases)]
+
+
+def write_budget_workbook(file_path: str | Path, region: str, rows: int, rng: random.Random):
+    """
+    Write a budget workbook with `rows` rows: text colors with leading zeros, numeric sizes and
+    quantities with halves, negative values and a few missing ones (rows dropped by the conversion).
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(["REGION", "MODEL", "SIZE", "COLOR", "P", "QTY"])
+    for i in range(rows):
+        qty = rng.choice([rng.randint(0, 200), rng.uniform(-5, 200), rng.randint(0, 200) + 0.5, None])
+        sheet.append([region, f"0RB{rng.randint(0, 4999):04d}", rng.choice([50, 52, 54, 56]),
+                      f"{rng.randint(1, 999):03d}", rng.choice(["P", "S"]), qty])
+    workbook.save(file_path)
+
+
+def make_tree(root: str | Path, spec: TreeSpec) -> dict:
+    """
+    Create the tree described by `spec` under `root` (removing whatever is there) and return
+    its description: regions, releases and number of files.
+    """
+    root = Path(root)
+    shutil.rmtree(root, ignore_errors=True)
+    rng = random.Random(spec.seed)
+    templates_dir = root / ".templates"
+    templates_dir.mkdir(parents=True)
+
+    files = matching = 0
+    for region in spec.region_names():
+        templates = []
+        for t in range(max(1, spec.templates)):
+            template = templates_dir / f"{region}_{t}.xlsx"
+            write_budget_workbook(template, region, spec.rows, rng)
+            templates.append(template)
+
+        for release in spec.release_names():
+            release_dir = root / region / spec.budget_folder / release
+            levels = [release_dir]
+            for level in range(spec.depth):
+                levels.append(levels[-1] / f"LEVEL {level + 1}")
+            for folder in levels:
+                folder.mkdir(parents=True, exist_ok=True)
+
+            names = [f"{region}_SKU_{k:03d}.xlsx" for k in range(spec.matching)]
+            names += [f"{region}_NOTES_{k:03d}.xlsx" if k % 2 == 0 else f"UPLOADED_{region}_SKU_{k:03d}.xlsx"
+                      for k in range(spec.non_matching)]
+            for k, name in enumerate(names):
+                shutil.copyfile(templates[k % len(templates)], levels[k % len(levels)] / name)
+            files += len(names)
+            matching += spec.matching
+
+    shutil.rmtree(templates_dir)
+    return {
+        "root": str(root),
+        "regions": spec.region_names(),
+        "releases": spec.release_names(),
+        "budget_folder": spec.budget_folder,
+        "files": files,
+        "matching_files": matching,
+    }
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    """Add one option per `TreeSpec` field."""
+    for name, value in asdict(TreeSpec()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+
+def spec_from_args(args: argparse.Namespace) -> TreeSpec:
+    return TreeSpec(**{name: getattr(args, name) for name in asdict(TreeSpec())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("root", help="Folder where the tree is created, replacing its content")
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    print(json.dumps(make_tree(args.root, spec_from_args(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Headless entry point, to run the download and tag jobs from a scheduler or over SSH.
+
+Examples (from the `script` folder):
+    python cli.py releases
+    python cli.py plan --release latest
+    python cli.py download --release latest --workers 4
+    python cli.py tag --release "S1 2025"
+    python cli.py watch --release latest --interval 30
+
+Logs go to stderr, the JSON summary of the run to stdout. pandas and openpyxl are imported
+only by the commands that convert files, and Tk is never imported.
+"""
+# Standard imports
+import argparse
+import json
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+# Local Imports
+from core.config_loader import ConfigLoader
+from core.sharepoint import SharePointPathResolver
+from core.release_manager import ReleaseManager
+from core.tree_index import SharePointIndex
+from utils.profiling import PROFILE_MODES
+from utils.resources import get_release_cache_path, get_save_path
+
+
+def log(message: str):
+    print(message, file=sys.stderr)
+
+
+def _resolve_releases(requested: list[str], config: ConfigLoader,
+                      release_manager: ReleaseManager) -> tuple[list[str], SharePointIndex]:
+    """
+    Map the requested releases to the available ones, 'latest' being the most recent, and return
+    them with the index of their folders.
+
+    The named releases are checked against that index, which walks their folders only; the whole
+    tree is discovered (unless the release cache is valid) only to find the 'latest' release.
+    """
+    named = [release for release in requested if release != "latest"]
+    index = _build_index(config, release_manager, named) if named else None
+    available = index.get_releases() if index is not None else []
+    releases = []
+    for release in requested:
+        if release == "latest":
+            release = release_manager.get_latest_release()
+            if release is None:
+                raise SystemExit("No release available")
+        elif release not in available:
+            cached = release_manager.get_cached_releases(allow_stale=True)
+            known = f" Available releases: {', '.join(info.name for info in cached)}" if cached else ""
+            raise SystemExit(f"Release not available: {release}.{known}")
+        if release not in releases:
+            releases.append(release)
+    if index is None or any(release not in available for release in releases):
+        index = _build_index(config, release_manager, releases)
+    return releases, index
+
+
+def _build_index(config: ConfigLoader, release_manager: ReleaseManager, releases: list[str]) -> SharePointIndex:
+    return SharePointIndex(
+        release_manager.sharepoint_path,
+        regions=config.get('regions'),
+        budget_folder=config.get('budget_folder'),
+        file_pattern=config.get('pattern file'),
+        release_pattern=config.get('pattern release'),
+        releases=releases,
+        backend=release_manager.backend
+    )
+
+
+def run_releases(args, config: ConfigLoader, release_manager: ReleaseManager) -> dict:
+    releases = release_manager.get_release_info(refresh=args.refresh)
+    return {"releases": [asdict(release) for release in releases]}
+
+
+def run_download(args, config: ConfigLoader, release_manager: ReleaseManager) -> dict:
+    from utils.tools import find_and_convert_releases
+
+    releases, index = _resolve_releases(args.release, config, release_manager)
+    save_paths = {release: get_save_path(release, base_path=args.save_path) for release in releases}
+    results = find_and_convert_releases(
+        releases=releases,
+        pattern=config.get('pattern file'),
+        search_path=release_manager.sharepoint_path,
+        regions=config.get('regions'),
+        budget_definition_folder=config.get('budget_folder'),
+        save_paths=save_paths,
+        log_func=log,
+        workers=args.workers if args.workers is not None else config.get('workers'),
+        index=index,
+        cache=bool(config.get('cache')) and not args.no_cache,
+        reader=config.get('reader') or 'pandas',
+        profile=args.profile or config.get('profile'),
+        prefetch=args.prefetch if args.prefetch is not None else config.get('prefetch'),
+        outputs=config.get('outputs'),
+        aggregate_outputs=config.get('aggregate_outputs'),
+        consolidate=bool(config.get('consolidate')),
+        delta=bool(config.get('delta')),
+        backend=release_manager.backend,
+        release_func=lambda release: log(f"Starting download process for release: {release}")
+    )
+    summary = []
+    for release, (files, errors) in results.items():
+        summary.append({
+            "release": release,
+            "save_path": str(save_paths[release]),
+            "files": len(files),
+            "rows": sum(file.rows for file in files),
+            "total": sum(file.total for file in files),
+            "errors": [str(error) for error in errors],
+        })
+    return {"releases": summary}
+
+
+def run_plan(args, config: ConfigLoader, release_manager: ReleaseManager) -> dict:
+    from utils.planner import plan_releases
+
+    releases, _ = _resolve_releases(args.release, config, release_manager)
+    save_paths = {release: get_save_path(release, base_path=args.save_path) for release in releases}
+    plans = plan_releases(
+        releases=releases,
+        pattern=config.get('pattern file'),
+        search_path=release_manager.sharepoint_path,
+        regions=config.get('regions'),
+        budget_definition_folder=config.get('budget_folder'),
+        save_paths=save_paths,
+        tag=args.tag,
+        log_func=log,
+        workers=args.workers if args.workers is not None else config.get('workers'),
+        cache=bool(config.get('cache')) and not args.no_cache,
+        backend=release_manager.backend,
+        release_pattern=config.get('pattern release')
+    )
+    summary = []
+    for release, plan in plans.items():
+        summary.append({
+            "release": release,
+            "save_path": str(plan.save_path),
+            "files": [{"region": file.region, "path": str(file.path), "size": file.size, "status": file.status}
+                      for file in plan.files],
+            "renames": [{"region": rename.region, "source": str(rename.source), "target": str(rename.target),
+                         "status": rename.status} for rename in plan.renames],
+            "anomalies": plan.anomalies,
+            "download_seconds": plan.download_seconds,
+            "tag_seconds": plan.tag_seconds,
+        })
+    return {"releases": summary}
+
+
+def run_watch(args, config: ConfigLoader, release_manager: ReleaseManager) -> dict:
+    from utils.tools import watch_releases
+
+    if not release_manager.backend.local:
+        raise SystemExit("The watch command needs the OneDrive folder, not a remote storage_url")
+    releases, _ = _resolve_releases(args.release, config, release_manager)
+    save_paths = {release: get_save_path(release, base_path=args.save_path) for release in releases}
+    cancel_event = threading.Event()
+    # Ctrl+C stops the watch at the next poll instead of interrupting a conversion
+    signal.signal(signal.SIGINT, lambda *_: cancel_event.set())
+    converted = watch_releases(
+        releases=releases,
+        pattern=config.get('pattern file'),
+        search_path=release_manager.sharepoint_path,
+        regions=config.get('regions'),
+        budget_definition_folder=config.get('budget_folder'),
+        save_paths=save_paths,
+        log_func=log,
+        interval=args.interval if args.interval is not None else config.get('watch_interval') or 10,
+        settle=args.settle if args.settle is not None else config.get('watch_settle') or 30,
+        cancel_event=cancel_event,
+        max_polls=args.max_polls,
+        workers=args.workers if args.workers is not None else config.get('workers'),
+        reader=config.get('reader') or 'pandas',
+        outputs=config.get('outputs'),
+        aggregate_outputs=config.get('aggregate_outputs'),
+        consolidate=bool(config.get('consolidate')),
+        delta=bool(config.get('delta')),
+        release_pattern=config.get('pattern release')
+    )
+    return {"releases": [{"release": release, "save_path": str(save_paths[release]), "converted": count}
+                         for release, count in converted.items()]}
+
+
+def run_tag(args, config: ConfigLoader, release_manager: ReleaseManager) -> dict:
+    from utils.tools import put_tag, resume_tag, rollback_tag
+
+    releases, _ = _resolve_releases(args.release, config, release_manager)
+    summary = []
+    for release in releases:
+        save_path = get_save_path(release, base_path=args.save_path)
+        errors = []
+        error_func = lambda path, error: errors.append(f"{path}: {error}")
+        if args.resume:
+            log(f"Resuming label process for release: {release}")
+            renamed = resume_tag(save_path, release_manager.sharepoint_path, log_func=log, backend=release_manager.backend,
+                                 error_func=error_func)
+        elif args.rollback:
+            log(f"Rolling back label process for release: {release}")
+            renamed = rollback_tag(save_path, release_manager.sharepoint_path, log_func=log, backend=release_manager.backend,
+                                   error_func=error_func)
+        else:
+            log(f"Starting label process for release: {release}")
+            renamed = put_tag(
+                release=release,
+                pattern=config.get('pattern file'),
+                search_path=save_path,
+                sharepoint_path=release_manager.sharepoint_path,
+                regions=config.get('regions'),
+                budget_definition_folder=config.get('budget_folder'),
+                tag=args.tag,
+                log_func=log,
+                profile=args.profile or config.get('profile'),
+                backend=release_manager.backend,
+                error_func=error_func
+            )
+        summary.append({"release": release, "renamed": [str(path) for path in renamed], "errors": errors})
+    return {"releases": summary}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Download and tag the budget files of SharePoint without the GUI.")
+    parser.add_argument("--config", default=Path(__file__).parents[0] / "config.yaml", help="Path of config.yaml")
+    parser.add_argument("--sharepoint-path", help="SharePoint folder, instead of the one of the OneDrive client")
+    parser.add_argument("--storage-url", help="URL of the SharePoint drive on Microsoft Graph, to read it without "
+                                              "the OneDrive client (token in GRAPH_TOKEN, default from config)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    releases = subparsers.add_parser("releases", help="List the available releases, with their regions and files")
+    releases.add_argument("--refresh", action="store_true", help="Scan SharePoint even if the release cache is valid")
+
+    download = subparsers.add_parser("download", help="Download and convert the files of the releases")
+    download.add_argument("--release", action="append", required=True,
+                          help="Release to process, or 'latest'. Can be repeated")
+    download.add_argument("--workers", type=int, help="Number of conversion processes (default from config)")
+    download.add_argument("--no-cache", action="store_true", help="Convert every file, ignoring the conversion cache")
+    download.add_argument("--save-path", help="Folder containing the {year}/{release} folders")
+    download.add_argument("--prefetch", type=int, help="Files staged locally ahead of the conversion, 0 to read in place (default from config)")
+    download.add_argument("--profile", choices=PROFILE_MODES, help="Time the stages of the run (default from config)")
+
+    plan = subparsers.add_parser("plan", help="Preview the files a download and a tag would process, "
+                                              "with an estimate of their duration, without opening any workbook")
+    plan.add_argument("--release", action="append", required=True,
+                      help="Release to plan, or 'latest'. Can be repeated")
+    plan.add_argument("--workers", type=int, help="Number of conversion processes the estimate is for (default from config)")
+    plan.add_argument("--no-cache", action="store_true", help="Plan as if every file was converted")
+    plan.add_argument("--tag", default="UPLOADED", help="Tag prepended to the file names")
+    plan.add_argument("--save-path", help="Folder containing the {year}/{release} folders")
+
+    watch = subparsers.add_parser("watch", help="Convert the files of the releases as they land, until Ctrl+C")
+    watch.add_argument("--release", action="append", required=True,
+                       help="Release to watch, or 'latest'. Can be repeated")
+    watch.add_argument("--interval", type=float, help="Seconds between two polls (default from config)")
+    watch.add_argument("--settle", type=float, help="Seconds a file must stay unchanged before it is converted (default from config)")
+    watch.add_argument("--max-polls", type=int, help="Stop after this many polls")
+    watch.add_argument("--workers", type=int, help="Number of conversion processes (default from config)")
+    watch.add_argument("--save-path", help="Folder containing the {year}/{release} folders")
+
+    tag = subparsers.add_parser("tag", help="Tag the downloaded files on SharePoint")
+    tag.add_argument("--release", action="append", required=True,
+                     help="Release to process, or 'latest'. Can be repeated")
+    tag.add_argument("--tag", default="UPLOADED", help="Tag prepended to the file names")
+    tag.add_argument("--save-path", help="Folder containing the {year}/{release} folders")
+    tag.add_argument("--profile", choices=PROFILE_MODES, help="Time the renames (default from config)")
+    journal = tag.add_mutually_exclusive_group()
+    journal.add_argument("--resume", action="store_true", help="Complete the last interrupted tag run")
+    journal.add_argument("--rollback", action="store_true", help="Undo the renames of the last tag run")
+    return parser
+
+
+COMMANDS = {"releases": run_releases, "plan": run_plan, "download": run_download, "watch": run_watch, "tag": run_tag}
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    start = time.perf_counter()
+
+    config = ConfigLoader(config_path=args.config)
+    if args.sharepoint_path:
+        resolver = SharePointPathResolver(path=args.sharepoint_path)
+    else:
+        resolver = SharePointPathResolver(storage_url=args.storage_url or config.get('storage_url'))
+    release_manager = ReleaseManager(
+        sharepoint_path=resolver.path,
+        pattern=config.get("pattern release"),
+        regions=config.get('regions'),
+        budget_folder=config.get('budget_folder'),
+        file_pattern=config.get('pattern file'),
+        cache_path=get_release_cache_path(),
+        backend=resolver.backend
+    )
+
+    result = COMMANDS[args.command](args, config, release_manager)
+    result = {"command": args.command, **result, "elapsed": round(time.perf_counter() - start, 3)}
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if any(release.get("errors") for release in result.get("releases", []) if isinstance(release, dict)) else 0
+
+
+if __name__ == "__main__":
+    # Needed by the conversion process pool in the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
+    sys.exit(main())
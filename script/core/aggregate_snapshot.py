@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.convert_kernel import TEXT_COLUMNS
+
+# Bump whenever the snapshot layout changes, so that older snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+
+class AggregateSnapshot:
+    """
+    Snapshot of the consolidated aggregate last uploaded to SAP, the base of the delta outputs.
+
+    The keys are stored as a NumPy structured array (one int32 code per REGION/MODEL/SIZE/COLOR/P
+    column and the int64 QTY), memory-mapped when loaded, with the values of the codes in a JSON
+    file. The codes of each column follow the sorted values, so the array, sorted by code, is
+    sorted by key. `find_and_convert_files` diffs each download against the current snapshot and
+    stages its own as pending; `put_tag` (or `resume_tag`) promotes it once every downloaded file
+    is tagged, i.e. once the upload is confirmed. The snapshot it replaces is kept as the previous
+    one, so that `rollback_tag` can restore it when it undoes the tag run that confirmed the upload.
+
+    Attributes:
+        path (Path): Folder of the current snapshot.
+        pending_path (Path): Folder of the snapshot of the last download, until it is uploaded.
+        previous_path (Path): Folder of the snapshot the current one replaced.
+    """
+    DIR_NAME = ".aggregate_snapshot"
+    KEYS_FILE = "keys.npy"
+    VALUES_FILE = "values.json"
+    # Id of the tag run that confirmed the snapshot, see `TagJournal`
+    RUN_FILE = "tag_run"
+    DTYPE = np.dtype([(column, np.int32) for column in TEXT_COLUMNS] + [("QTY", np.int64)])
+
+    def __init__(self, save_path: str | Path):
+        self.path = Path(save_path) / self.DIR_NAME
+        self.pending_path = Path(save_path) / f"{self.DIR_NAME}.pending"
+        self.previous_path = Path(save_path) / f"{self.DIR_NAME}.previous"
+
+    def stage(self, df: pd.DataFrame):
+        """Write the consolidated aggregate `df` (one row per key) as the pending snapshot."""
+        keys = np.empty(len(df), dtype=self.DTYPE)
+        values = {}
+        for column in TEXT_COLUMNS:
+            uniques, codes = np.unique(df[column].astype(str).to_numpy(dtype=object), return_inverse=True)
+            keys[column] = codes
+            values[column] = uniques.tolist()
+        keys["QTY"] = df["QTY"].to_numpy(dtype=np.int64)
+        keys.sort(order=TEXT_COLUMNS)
+
+        # Written aside and renamed, so that the pending snapshot is always complete
+        tmp_path = self.pending_path.with_name(self.pending_path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+        np.save(tmp_path / self.KEYS_FILE, keys)
+        with open(tmp_path / self.VALUES_FILE, "w") as file:
+            json.dump({"version": SNAPSHOT_VERSION, "rows": len(keys), "values": values}, file)
+        shutil.rmtree(self.pending_path, ignore_errors=True)
+        os.replace(tmp_path, self.pending_path)
+
+    def has_pending(self) -> bool:
+        return (self.pending_path / self.VALUES_FILE).exists()
+
+    def commit(self, run: Optional[str] = None) -> bool:
+        """
+        Make the pending snapshot the current one, confirmed by the tag run `run`, and keep the
+        current one as the previous; return False if there is no pending snapshot.
+        """
+        if not self.has_pending():
+            return False
+        (self.pending_path / self.RUN_FILE).write_text(run or "")
+        shutil.rmtree(self.previous_path, ignore_errors=True)
+        if self.path.exists():
+            os.replace(self.path, self.previous_path)
+        os.replace(self.pending_path, self.path)
+        return True
+
+    def restore(self, run: str) -> bool:
+        """
+        Undo the `commit` of the tag run `run`: the previous snapshot becomes the current one again
+        and the current one pending again (unless a later download staged its own). Return False if
+        the current snapshot was not confirmed by `run`.
+        """
+        try:
+            confirmed_by = (self.path / self.RUN_FILE).read_text()
+        except OSError:
+            return False
+        if confirmed_by != run:
+            return False
+
+        if self.has_pending():
+            shutil.rmtree(self.path)
+        else:
+            (self.path / self.RUN_FILE).unlink()
+            os.replace(self.path, self.pending_path)
+        if self.previous_path.exists():
+            os.replace(self.previous_path, self.path)
+        return True
+
+    def load(self) -> Optional[tuple[np.ndarray, dict[str, list[str]]]]:
+        """Return the memory-mapped keys and the values of the codes of the current snapshot, or None if there is none."""
+        try:
+            with open(self.path / self.VALUES_FILE, "r") as file:
+                meta = json.load(file)
+            keys = np.load(self.path / self.KEYS_FILE, mmap_mode="r" if meta.get("rows") else None)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("version") != SNAPSHOT_VERSION or keys.dtype != self.DTYPE or len(keys) != meta.get("rows"):
+            return None
+        return keys, meta["values"]
+
+    def diff(self, df: pd.DataFrame) -> Optional[tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+        """
+        Compare the consolidated aggregate `df` with the current snapshot.
+
+        The keys of `df` are encoded with the codes of the snapshot (values it has never seen get
+        -1, so they never match) and hash-joined with its keys.
+
+        Return:
+        - None when there is no snapshot yet, otherwise the rows of `df` whose key is new, the rows
+          of `df` whose QTY changed (with the new QTY) and the rows of the snapshot whose key is
+          gone (with the uploaded QTY)
+        """
+        snapshot = self.load()
+        if snapshot is None:
+            return None
+        keys, values = snapshot
+
+        new = pd.DataFrame({
+            column: pd.Index(values[column]).get_indexer(df[column].astype(str).to_numpy(dtype=object))
+            for column in TEXT_COLUMNS
+        })
+        new["QTY"] = df["QTY"].to_numpy(dtype=np.int64)
+        new["ROW"] = np.arange(len(new))
+        old = pd.DataFrame({name: np.asarray(keys[name]) for name in self.DTYPE.names})
+
+        joined = new.merge(old, on=TEXT_COLUMNS, how="outer", suffixes=("", "_OLD"), indicator=True)
+        added = joined[joined["_merge"] == "left_only"]
+        both = joined[joined["_merge"] == "both"]
+        changed = both[both["QTY"] != both["QTY_OLD"]]
+        gone = joined[joined["_merge"] == "right_only"]
+
+        removed = pd.DataFrame({
+            column: np.array(values[column], dtype=object)[gone[column].to_numpy(dtype=np.int64)]
+            for column in TEXT_COLUMNS
+        })
+        removed["QTY"] = gone["QTY_OLD"].to_numpy(dtype=np.int64)
+
+        def rows_of(part: pd.DataFrame) -> pd.DataFrame:
+            return df.iloc[np.sort(part["ROW"].to_numpy(dtype=np.int64))].reset_index(drop=True)
+
+        return rows_of(added), rows_of(changed), removed
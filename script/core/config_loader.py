@@ -1,6 +1,6 @@
 import yaml
 from pathlib import Path
-from utils.tools import get_resource_path
+from utils.resources import get_resource_path
 
 class ConfigLoader:
     def __init__(self, config_path: str | Path):
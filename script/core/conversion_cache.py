@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+# Bump whenever the conversion logic changes, so that rows cached by an older version are discarded
+CONVERSION_VERSION = 2
+
+
+def file_hash(file_path: str | Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """
+    Persistent cache of converted workbooks, stored as a JSON manifest next to the save path.
+
+    Each entry is keyed by the source path and records the size, mtime and content hash of the
+    workbook together with its converted rows and total budget. A lookup with matching size and
+    mtime is a hit without reading the file; when only the mtime changed, the content hash
+    decides. The whole cache is invalidated when the file pattern or `CONVERSION_VERSION` changes,
+    and entries not used for `max_age_days` (or beyond `max_entries`) are evicted on save.
+
+    Attributes:
+        path (Path): Path of the manifest file.
+        pattern (str): The file pattern the cached conversions were selected with.
+        entries (dict[str, dict]): Cached entries keyed by source path.
+        hash_func (Callable[[str | Path], str]): Hashes the content of a workbook, e.g. `StorageBackend.content_hash`.
+    """
+    FILE_NAME = ".conversion_cache.json"
+
+    def __init__(self, save_path: str | Path, pattern: str | re.Pattern[str],
+                 max_entries: int = 5000, max_age_days: int = 90,
+                 hash_func: Callable[[str | Path], str] = file_hash):
+        self.path = Path(save_path) / self.FILE_NAME
+        self.hash_func = hash_func
+        self.pattern = pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.entries = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.path, "r") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get("version") != CONVERSION_VERSION or manifest.get("pattern") != self.pattern:
+            return {}
+        return manifest.get("entries", {})
+
+    def lookup(self, file_path: str | Path, size: Optional[int] = None, mtime: Optional[float] = None) -> Optional[dict]:
+        """
+        Return the cached entry of a workbook if it has not changed, otherwise None.
+
+        Args:
+            file_path (str | Path): Path of the source workbook.
+            size (Optional[int]): Size of the workbook, if already known from a scan.
+            mtime (Optional[float]): Modification time of the workbook, if already known from a scan.
+        """
+        entry = self.entries.get(str(file_path))
+        if entry is None:
+            return None
+
+        if size is None or mtime is None:
+            stat = os.stat(file_path)
+            size, mtime = stat.st_size, stat.st_mtime
+        if entry["size"] != size:
+            return None
+        if entry["mtime"] != mtime:
+            # Touched but possibly unchanged (e.g. re-synced by OneDrive): let the content decide
+            if entry["hash"] != self.hash_func(file_path):
+                return None
+            entry["mtime"] = mtime
+
+        entry["last_used"] = time.time()
+        return entry
+
+    def status(self, file_path: str | Path, size: int, mtime: float) -> str:
+        """
+        Return what `lookup` would find for a workbook, without hashing it: "cached" (same size and
+        mtime), "touched" (same size, another mtime: the content hash decides), "changed" or "new".
+        """
+        entry = self.entries.get(str(file_path))
+        if entry is None:
+            return "new"
+        if entry["size"] != size:
+            return "changed"
+        return "cached" if entry["mtime"] == mtime else "touched"
+
+    def store(self, file_path: str | Path, rows: list[list], total_budget: int,
+              size: Optional[int] = None, mtime: Optional[float] = None, content_hash: Optional[str] = None):
+        """
+        Record the converted rows and total budget of a workbook.
+
+        `content_hash` is the hash of the workbook as `hash_func` computes it, if already known
+        (e.g. computed by the conversion worker); otherwise the workbook is hashed here.
+        """
+        if size is None or mtime is None:
+            stat = os.stat(file_path)
+            size, mtime = stat.st_size, stat.st_mtime
+        self.entries[str(file_path)] = {
+            "size": size,
+            "mtime": mtime,
+            "hash": content_hash if content_hash is not None else self.hash_func(file_path),
+            "total": total_budget,
+            "rows": rows,
+            "last_used": time.time(),
+        }
+
+    def _evict(self):
+        oldest = time.time() - self.max_age_days * 24 * 3600
+        entries = sorted(
+            ((key, entry) for key, entry in self.entries.items() if entry["last_used"] >= oldest),
+            key=lambda item: item[1]["last_used"], reverse=True
+        )
+        self.entries = dict(entries[:self.max_entries])
+
+    def save(self):
+        """Evict stale entries and write the manifest atomically."""
+        self._evict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        manifest = {"version": CONVERSION_VERSION, "pattern": self.pattern, "entries": self.entries}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self.path)
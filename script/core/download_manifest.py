@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+
+class DownloadManifest:
+    """
+    Record of the last download of a release: which SharePoint file produced which outputs.
+
+    It is written in the release save folder by `find_and_convert_files` and read by `put_tag`,
+    which can then rename exactly the downloaded files without scanning any folder. Sources are
+    stored relative to the SharePoint folder, since the OneDrive mount differs from user to user.
+
+    Attributes:
+        path (Path): Path of the manifest file.
+        release (str): The release downloaded.
+        created (str): When the download ended, ISO format.
+        files (list[dict]): One entry per converted file, with its `region`, `source` (relative to
+            the SharePoint folder), `outputs` (relative to the save folder), `rows` and `total`.
+        timing (dict): How long the download took, the history the run plans are estimated from:
+            `workers`, `converted_files`, `converted_bytes`, `converted_seconds`, `cached_files`
+            and `cached_seconds`.
+    """
+    FILE_NAME = "download_manifest.json"
+
+    def __init__(self, save_path: str | Path, release: str, files: Optional[list[dict]] = None, created: Optional[str] = None,
+                 timing: Optional[dict] = None):
+        self.path = Path(save_path) / self.FILE_NAME
+        self.release = release
+        self.files = files if files is not None else []
+        self.created = created
+        self.timing = timing if timing is not None else {}
+
+    def add(self, region: str, source: str | Path, sharepoint_path: str | Path, outputs: list[str], rows: int, total: int):
+        self.files.append({
+            "region": region,
+            "source": Path(source).relative_to(sharepoint_path).as_posix(),
+            "outputs": outputs,
+            "rows": rows,
+            "total": total,
+        })
+
+    def remove(self, source: str | Path, sharepoint_path: str | Path) -> Optional[dict]:
+        """Drop the entry of a source file, returning it, or None if there was none."""
+        source = Path(source).relative_to(sharepoint_path).as_posix()
+        removed = next((entry for entry in self.files if entry["source"] == source), None)
+        self.files = [entry for entry in self.files if entry["source"] != source]
+        return removed
+
+    def save(self):
+        """Write the manifest atomically."""
+        self.created = datetime.now().isoformat(timespec="seconds")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump({"release": self.release, "created": self.created, "timing": self.timing, "files": self.files},
+                      file, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, save_path: str | Path) -> Optional["DownloadManifest"]:
+        """Return the manifest saved in `save_path`, or None if there is none."""
+        try:
+            with open(Path(save_path) / cls.FILE_NAME, "r") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return cls(save_path, manifest["release"], files=manifest["files"], created=manifest.get("created"),
+                   timing=manifest.get("timing"))
+
+
+class TagJournal:
+    """
+    Append-only journal of the renames done by `put_tag`, one JSON record per line.
+
+    A run first records its whole plan, then one record per rename as soon as it is done, then
+    its end; an interrupted run is therefore the last run without an end record, and its pending
+    renames are the planned ones not recorded as done. Renames can also be rolled back, each
+    rollback being recorded in the same way. Paths are relative to the SharePoint folder.
+
+    Records:
+    - {"run", "action": "plan", "tag", "renames": [[region, source, target], ...]}
+    - {"run", "action": "renamed" | "rolled_back", "source", "target"}
+    - {"run", "action": "end", "time"}
+    """
+    FILE_NAME = "tag_journal.jsonl"
+    # Run ids are their start time
+    RUN_FORMAT = "%Y%m%dT%H%M%S%f"
+
+    def __init__(self, save_path: str | Path):
+        self.path = Path(save_path) / self.FILE_NAME
+        self._lock = threading.Lock()
+
+    def _append(self, record: dict):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def begin(self, renames: list[tuple[str, str, str]], tag: str) -> str:
+        """Record the plan of a new run and return its id."""
+        run = datetime.now().strftime(self.RUN_FORMAT)
+        self._append({"run": run, "action": "plan", "tag": tag, "renames": [list(rename) for rename in renames]})
+        return run
+
+    def record(self, run: str, action: str, source: str, target: str):
+        self._append({"run": run, "action": action, "source": source, "target": target})
+
+    def end(self, run: str):
+        self._append({"run": run, "action": "end", "time": datetime.now().strftime(self.RUN_FORMAT)})
+
+    def read_runs(self) -> dict[str, dict]:
+        """
+        Return the runs of the journal, in order, as {run: {"tag", "renames", "renamed", "rolled_back", "ended", "seconds"}},
+        where "renames" are the planned (region, source, target), "renamed" and "rolled_back" the
+        (source, target) done and "seconds" the duration of an ended run (None if unknown). A
+        truncated last line (interrupted write) is ignored.
+        """
+        runs = {}
+        try:
+            with open(self.path, "r") as file:
+                lines = file.readlines()
+        except OSError:
+            return runs
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record["action"] == "plan":
+                runs[record["run"]] = {"tag": record["tag"], "renames": [tuple(rename) for rename in record["renames"]],
+                                       "renamed": set(), "rolled_back": set(), "ended": False, "seconds": None}
+            elif record["run"] in runs:
+                run = runs[record["run"]]
+                if record["action"] == "end":
+                    # A rollback of the run ends it again, later: the first end is the one of the tag
+                    if "time" in record and not run["ended"]:
+                        started = datetime.strptime(record["run"], self.RUN_FORMAT)
+                        run["seconds"] = (datetime.strptime(record["time"], self.RUN_FORMAT) - started).total_seconds()
+                    run["ended"] = True
+                else:
+                    run[record["action"]].add((record["source"], record["target"]))
+        return runs
+
+    def last_run(self) -> Optional[tuple[str, dict]]:
+        """Return the id and the state of the last run, or None if the journal is empty."""
+        runs = self.read_runs()
+        if not runs:
+            return None
+        run = next(reversed(runs))
+        return run, runs[run]
@@ -0,0 +1,76 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class JobRunner:
+    """
+    Run one job at a time on a worker thread, reporting to the GUI through a thread-safe queue.
+
+    The job receives the runner itself and uses `log`, `progress` and `cancel_event` to talk back;
+    the GUI drains `events` periodically (with `after()`), so no widget is touched outside the
+    main thread. Logs go to `log_func` (e.g. a `LogSink`) when given. Each event is a tuple whose 
+    first item is its kind:
+    - ("log", message, color), only without `log_func`
+    - ("progress", done, total, files_per_second)
+    - ("done", result) or ("error", exception), always the last event of a job
+
+    Attributes:
+        events (queue.Queue): Events produced by the running job.
+        cancel_event (threading.Event): Set by `cancel`, checked by the job between files.
+    """
+    def __init__(self, log_func: Optional[Callable[[str, str], None]] = None):
+        self.log_func = log_func
+        self.events: queue.Queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._progress_started = time.perf_counter()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, job: Callable[["JobRunner"], Any]) -> bool:
+        """Start `job(self)` on a worker thread. Return False if another job is still running."""
+        if self.is_running():
+            return False
+        self.cancel_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, job: Callable[["JobRunner"], Any]):
+        try:
+            result = job(self)
+        except Exception as e:
+            self.events.put(("error", e))
+        else:
+            self.events.put(("done", result))
+
+    def cancel(self):
+        """Ask the running job to stop at the next file."""
+        self.cancel_event.set()
+
+    def log(self, message: str, color: str = 'black'):
+        if self.log_func:
+            self.log_func(message, color)
+        else:
+            self.events.put(("log", message, color))
+
+    def progress(self, done: int, total: int):
+        """Report that `done` of `total` files are processed; the rate restarts when `done` is 0."""
+        now = time.perf_counter()
+        if done == 0:
+            self._progress_started = now
+        elapsed = now - self._progress_started
+        self.events.put(("progress", done, total, done / elapsed if elapsed > 0 else 0.0))
+
+    def drain(self, max_events: int = 500) -> list[tuple]:
+        """Return the pending events, at most `max_events` at a time to keep the GUI responsive."""
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return events
@@ -1,14 +1,174 @@
+import json
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from typing import Optional
+
+from core.storage import LocalBackend, StorageBackend
+from core.tree_index import SharePointIndex
+
+
+def release_sort_key(release: str) -> tuple[str, str]:
+    """Sort key of a release name like 'S1 2025': by year, then by code."""
+    return release[-4:], release[:-4]
+
+
+@dataclass
+class ReleaseInfo:
+    """A release found on SharePoint, with the number of regions having it and of candidate files."""
+    name: str
+    regions: int
+    files: int
+
 
 class ReleaseManager:
-    def __init__(self, sharepoint_path: Path, pattern: str):
+    """
+    Discover the releases available on SharePoint.
+
+    All the configured regions are scanned, in parallel, and each release is reported with the
+    number of regions having it and the number of candidate files. The result is kept in an
+    on-disk cache, valid for `cache_ttl` seconds as long as the modification times of the
+    scanned folders (budget folders and release folders) do not change, so that the GUI can
+    show the releases immediately and refresh them in the background.
+
+    Attributes:
+        sharepoint_path (Path): Root of the SharePoint tree.
+        pattern (str): Pattern identifying the release folders.
+        regions (list | tuple | str): Regions to scan.
+        budget_folder (str): Name of the budget folder inside each region.
+        file_pattern (str | None): Pattern of the candidate files, counted for each release.
+        cache_path (Path | None): Where the discovered releases are cached. None disables the cache.
+        cache_ttl (float): Seconds after which the cache is rebuilt anyway.
+        workers (int): Number of threads scanning the regions.
+        backend (StorageBackend): Lists the SharePoint folders; by default the local folder `sharepoint_path`.
+    """
+    CACHE_VERSION = 1
+
+    def __init__(self,
+                 sharepoint_path: Path,
+                 pattern: str,
+                 regions: list | tuple | str = ("USA",),
+                 budget_folder: str = "BUDGET DEFINITION",
+                 file_pattern: Optional[str] = None,
+                 cache_path: Optional[str | Path] = None,
+                 cache_ttl: float = 3600,
+                 workers: int = 8,
+                 backend: Optional[StorageBackend] = None):
         self.sharepoint_path = sharepoint_path
         self.pattern = pattern
+        self.regions = regions
+        self.budget_folder = budget_folder
+        self.file_pattern = file_pattern
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.cache_ttl = cache_ttl
+        self.workers = workers
+        self.backend = backend if backend is not None else LocalBackend(sharepoint_path)
+        # Compiled once, shared by every region scan
+        self._release_pattern = re.compile(pattern)
+
+    def _cache_key(self) -> dict:
+        return {
+            "version": self.CACHE_VERSION,
+            "sharepoint_path": str(self.sharepoint_path),
+            "pattern": self.pattern,
+            "regions": str(self.regions),
+            "budget_folder": self.budget_folder,
+            "file_pattern": self.file_pattern,
+        }
+
+    def discover_releases(self, index: Optional[SharePointIndex] = None) -> list[ReleaseInfo]:
+        """
+        Scan the SharePoint tree and return the releases, most recent first, updating the cache.
+        """
+        if index is None:
+            index = SharePointIndex(
+                self.sharepoint_path, regions=self.regions, budget_folder=self.budget_folder,
+                file_pattern=self.file_pattern, release_pattern=self._release_pattern,
+                release_depth=1, workers=self.workers, backend=self.backend
+            )
+
+        folders = [Path(self.sharepoint_path) / region / self.budget_folder for region in index.get_regions()]
+        region_releases = [(region, release) for region in index.get_regions() for release in index.get_releases(region)]
+        folders += [folder for region, release in region_releases for folder in index.get_release_dirs(region, release)]
+
+        # Listing the files is what takes time on SharePoint, so the releases are listed in parallel
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            file_counts = list(executor.map(lambda item: len(index.get_files(*item)), region_releases))
+
+        counts: dict[str, list[int]] = {}
+        for (region, release), files in zip(region_releases, file_counts):
+            count = counts.setdefault(release, [0, 0])
+            count[0] += 1
+            count[1] += files
+
+        releases = [
+            ReleaseInfo(name=release, regions=n_regions, files=n_files)
+            for release, (n_regions, n_files) in sorted(counts.items(), key=lambda item: release_sort_key(item[0]), reverse=True)
+        ]
+        self._save_cache(releases, folders)
+        return releases
+
+    def _save_cache(self, releases: list[ReleaseInfo], folders: list[Path]):
+        if self.cache_path is None:
+            return
+        mtimes = {}
+        for folder in folders:
+            entry = self.backend.stat(folder)
+            if entry is not None:
+                mtimes[str(folder)] = entry.mtime
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+            with open(tmp_path, "w") as file:
+                json.dump({**self._cache_key(), "created": time.time(), "folders": mtimes,
+                           "releases": [asdict(release) for release in releases]}, file, indent=1)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            # The cache is only an optimization
+            pass
+
+    def get_cached_releases(self, allow_stale: bool = False) -> Optional[list[ReleaseInfo]]:
+        """
+        Return the cached releases, or None if there is no cache or it is no longer valid.
+
+        With `allow_stale` an expired cache is returned anyway, e.g. to show it while refreshing it.
+        """
+        if self.cache_path is None:
+            return None
+        try:
+            with open(self.cache_path, "r") as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if any(cache.get(key) != value for key, value in self._cache_key().items()):
+            return None
+
+        if not allow_stale:
+            if time.time() - cache["created"] > self.cache_ttl:
+                return None
+            self.backend.refresh()
+            for folder, mtime in cache["folders"].items():
+                entry = self.backend.stat(folder)
+                if entry is None or entry.mtime != mtime:
+                    return None
+        return [ReleaseInfo(**release) for release in cache["releases"]]
+
+    def get_release_info(self, refresh: bool = False) -> list[ReleaseInfo]:
+        """Return the releases from the cache when valid, scanning SharePoint otherwise or with `refresh`."""
+        releases = None if refresh else self.get_cached_releases()
+        if releases is None:
+            releases = self.discover_releases()
+        return releases
+
+    def get_available_releases(self, index: SharePointIndex | None = None) -> list[str]:
+        if index is not None:
+            return index.get_releases()
+        return [release.name for release in self.get_release_info()]
 
-    def get_available_releases(self):
-        budget_path = self.sharepoint_path / "USA/BUDGET DEFINITION"
-        return [
-            entry.name for entry in budget_path.iterdir()
-            if entry.is_dir() and re.compile(self.pattern).match(entry.name)
-        ]
\ No newline at end of file
+    def get_latest_release(self, releases: list[str] | None = None) -> str | None:
+        if releases is None:
+            releases = self.get_available_releases()
+        return max(releases, key=release_sort_key, default=None)
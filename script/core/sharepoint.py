@@ -1,9 +1,31 @@
+import os
 from pathlib import Path
+from typing import Optional
+
+from core.storage import GraphBackend, LocalBackend, StorageBackend
 from utils.constants import OS, USER, MAC_OS, WINDOWS_OS
 
 class SharePointPathResolver:
-    def __init__(self):
-        self.path = self._resolve_path()
+    """
+    Resolve the SharePoint document library and the storage backend to read it with.
+
+    By default the library is the folder synced by the OneDrive client, or `path` when given.
+    With `storage_url`, the URL of the drive on Microsoft Graph (or of a server exposing the same
+    API), it is read remotely with the token of the GRAPH_TOKEN environment variable, and no
+    sync client is needed.
+
+    Attributes:
+        backend (StorageBackend): Lists, reads and renames the files of the library.
+        path (Path): The folder containing the regions, root of `backend`.
+    """
+    TOKEN_VARIABLE = "GRAPH_TOKEN"
+
+    def __init__(self, storage_url: Optional[str] = None, path: Optional[str | Path] = None):
+        if storage_url:
+            self.backend: StorageBackend = GraphBackend(storage_url, token=os.environ.get(self.TOKEN_VARIABLE))
+        else:
+            self.backend = LocalBackend(Path(path) if path else self._resolve_path())
+        self.path = self.backend.root
 
     def _resolve_path(self) -> Path:
         base_path = None
@@ -0,0 +1,397 @@
+import hashlib
+import http.client
+import io
+import json
+import os
+import queue
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+from typing import BinaryIO, Optional
+from urllib.parse import quote, urlsplit
+
+
+@dataclass(frozen=True)
+class StorageEntry:
+    """An entry of a folder listing, with its size and mtime (0 for the size of a folder)."""
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    """
+    Access to the SharePoint document library: batched folder listings, reads and renames.
+
+    Paths are absolute paths under `root`, built as everywhere else (root / region / budget
+    folder / ...), so the outputs, manifests and caches do not depend on the backend. Missing
+    folders list as empty; reads and renames raise the usual OSError subclasses.
+
+    Attributes:
+        root (Path): The folder containing the regions.
+        local (bool): Whether the files can be read in place by path; otherwise they must be
+            copied locally first, see `download`.
+        content_sha256 (bool): Whether `content_hash` is the SHA-256 of the content, so that it can
+            be computed from any copy of the file (see `conversion_cache.file_hash`).
+    """
+    local = True
+    content_sha256 = True
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    @abstractmethod
+    def list_dir(self, path: str | Path) -> list[StorageEntry]:
+        """Return the entries of a folder sorted by name, with their size and mtime."""
+
+    @abstractmethod
+    def stat(self, path: str | Path) -> Optional[StorageEntry]:
+        """Return the entry of a file or folder, or None if it does not exist."""
+
+    @abstractmethod
+    def open_read(self, path: str | Path) -> BinaryIO:
+        """Open a file for reading, in binary mode."""
+
+    @abstractmethod
+    def rename(self, source: str | Path, target: str | Path):
+        """Rename a file, raising FileExistsError if `target` already exists."""
+
+    def refresh(self):
+        """Pick up the changes made since the last listing, for backends that keep one in memory."""
+
+    def exists(self, path: str | Path) -> bool:
+        return self.stat(path) is not None
+
+    def download(self, source: str | Path, target: str | Path):
+        """Copy a file to a local path, e.g. into the staging folder of `StagingPrefetcher`."""
+        with self.open_read(source) as reader, open(target, "wb") as writer:
+            shutil.copyfileobj(reader, writer, 1 << 20)
+
+    def content_hash(self, path: str | Path) -> str:
+        """Return a hash of the content of a file, changing whenever the content changes."""
+        digest = hashlib.sha256()
+        with self.open_read(path) as reader:
+            for chunk in iter(lambda: reader.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+class _LocalEntry(StorageEntry):
+    """Entry of `LocalBackend.list_dir`: the file is only stat-ed when its size or mtime is read."""
+
+    def __init__(self, entry: os.DirEntry, is_dir: bool):
+        object.__setattr__(self, "name", entry.name)
+        object.__setattr__(self, "is_dir", is_dir)
+        object.__setattr__(self, "_entry", entry)
+
+    @cached_property
+    def _stat(self) -> Optional[os.stat_result]:
+        try:
+            return self._entry.stat()
+        except OSError:
+            # Removed since the listing
+            return None
+
+    @cached_property
+    def size(self) -> int:
+        return 0 if self.is_dir or self._stat is None else self._stat.st_size
+
+    @cached_property
+    def mtime(self) -> float:
+        return 0.0 if self._stat is None else self._stat.st_mtime
+
+
+class LocalBackend(StorageBackend):
+    """Backend of the OneDrive mount, or of any local folder."""
+
+    def list_dir(self, path: str | Path) -> list[StorageEntry]:
+        """
+        Return the entries of a folder sorted by name. The size and mtime are read when first
+        accessed, so the folders walked and the files filtered out by name are never stat-ed.
+        """
+        entries = []
+        try:
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    entries.append(_LocalEntry(entry, is_dir))
+        except OSError:
+            return []
+        return sorted(entries, key=lambda entry: entry.name)
+
+    def stat(self, path: str | Path) -> Optional[StorageEntry]:
+        path = Path(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        is_dir = path.is_dir()
+        return StorageEntry(path.name, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime)
+
+    def open_read(self, path: str | Path) -> BinaryIO:
+        return open(path, "rb")
+
+    def rename(self, source: str | Path, target: str | Path):
+        if os.path.exists(target):
+            raise FileExistsError(f"'{Path(target).name}' already exists")
+        os.rename(source, target)
+
+    def download(self, source: str | Path, target: str | Path):
+        shutil.copyfile(source, target)
+
+
+class _PooledResponse(io.RawIOBase):
+    """Body of a response, read as a file; the connection goes back to the pool once the body is read."""
+
+    def __init__(self, response: http.client.HTTPResponse, release):
+        self._response = response
+        self._release = release
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self._response.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._release(self._response.isclosed())
+        super().close()
+
+
+class GraphBackend(StorageBackend):
+    """
+    Backend of the document library through the Microsoft Graph drive API, for machines without
+    the sync client.
+
+    The drive is listed with the delta API (`/root/delta`, paged through `@odata.nextLink`) on the
+    first use and kept in memory; `refresh` then requests only the changes since the last
+    `@odata.deltaLink`, so listing a folder costs no request and a rescan costs one page when
+    nothing changed. Reads go through `/items/{id}/content` (following the redirect to the download
+    URL) and renames are a PATCH of the item. Requests reuse a pool of keep-alive connections per host.
+
+    Attributes:
+        base_url (str): URL of the drive, e.g. https://graph.microsoft.com/v1.0/drives/{drive-id}.
+        token (str | None): Bearer token sent with the API requests.
+        page_size (int): Items requested per page of the delta listing.
+        pool_size (int): Idle connections kept open per host.
+        timeout (float): Seconds before a request times out.
+    """
+    local = False
+    # The hashes come with the listing
+    content_sha256 = False
+
+    def __init__(self, base_url: str, token: Optional[str] = None, page_size: int = 500,
+                 pool_size: int = 8, timeout: float = 60.0):
+        super().__init__(Path("/"))
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.page_size = page_size
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._pools: dict[tuple[str, str], queue.LifoQueue] = {}
+        self._lock = threading.RLock()
+        # id -> StorageEntry, id -> parent id, parent id -> {name: id}
+        self._entries: dict[str, StorageEntry] = {}
+        self._parents: dict[str, Optional[str]] = {}
+        self._hashes: dict[str, Optional[str]] = {}
+        self._children: dict[str, dict[str, str]] = {}
+        self._root_id: Optional[str] = None
+        self._delta_link: Optional[str] = None
+
+    # Connections
+
+    def _new_connection(self, key: tuple[str, str]) -> http.client.HTTPConnection:
+        scheme, netloc = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout)
+
+    def _connection(self, key: tuple[str, str]) -> tuple[http.client.HTTPConnection, bool]:
+        """Return an idle connection of the pool (and True), or a new one (and False)."""
+        with self._lock:
+            pool = self._pools.setdefault(key, queue.LifoQueue())
+        try:
+            return pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(key), False
+
+    def _release(self, key: tuple[str, str], connection: http.client.HTTPConnection, reusable: bool):
+        pool = self._pools[key]
+        if reusable and pool.qsize() < self.pool_size:
+            pool.put(connection)
+        else:
+            connection.close()
+
+    def _send(self, method: str, url: str, body: Optional[dict] = None
+              ) -> tuple[tuple[str, str], http.client.HTTPConnection, http.client.HTTPResponse]:
+        """Send a request, following redirects; return the connection and the response, whose body is still to read."""
+        auth = True
+        for _ in range(5):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            target = parts.path + (f"?{parts.query}" if parts.query else "")
+            headers = {"Accept": "application/json"}
+            if auth and self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode()
+                headers["Content-Type"] = "application/json"
+
+            connection, reused = self._connection(key)
+            try:
+                connection.request(method, target, body=data, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if not reused:
+                    raise
+                # An idle connection closed by the server: retry on a new one
+                connection = self._new_connection(key)
+                connection.request(method, target, body=data, headers=headers)
+                response = connection.getresponse()
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                self._release(key, connection, not response.will_close)
+                location = response.getheader("Location")
+                # The download URLs are pre-authenticated and on another host
+                auth = urlsplit(location).netloc == urlsplit(self.base_url).netloc
+                url = location if "://" in location else f"{parts.scheme}://{parts.netloc}{location}"
+                continue
+            return key, connection, response
+        raise OSError(f"{method} {url}: too many redirects")
+
+    @staticmethod
+    def _error(method: str, url: str, response: http.client.HTTPResponse, body: bytes) -> OSError:
+        message = f"{method} {url}: {response.status} {response.reason} {body[:200].decode(errors='replace')}"
+        if response.status == 404:
+            return FileNotFoundError(message)
+        if response.status == 409:
+            return FileExistsError(message)
+        if response.status in (401, 403):
+            return PermissionError(message)
+        return OSError(message)
+
+    def _json(self, method: str, url: str, body: Optional[dict] = None) -> dict:
+        key, connection, response = self._send(method, url, body)
+        data = response.read()
+        self._release(key, connection, not response.will_close)
+        if response.status >= 400:
+            raise self._error(method, url, response, data)
+        return json.loads(data) if data else {}
+
+    # Delta listing
+
+    def _apply(self, item: dict):
+        item_id = item["id"]
+        old_parent = self._parents.get(item_id)
+        if old_parent is not None:
+            siblings = self._children.get(old_parent, {})
+            old = self._entries.get(item_id)
+            if old is not None and siblings.get(old.name) == item_id:
+                del siblings[old.name]
+
+        if "deleted" in item or "@removed" in item:
+            self._drop(item_id)
+            return
+
+        if "root" in item:
+            self._root_id = item_id
+        modified = item.get("lastModifiedDateTime")
+        mtime = datetime.fromisoformat(modified).timestamp() if modified else 0.0
+        is_dir = "folder" in item or "root" in item
+        self._entries[item_id] = StorageEntry(item.get("name", ""), is_dir, 0 if is_dir else item.get("size", 0), mtime)
+        hashes = item.get("file", {}).get("hashes", {})
+        self._hashes[item_id] = hashes.get("quickXorHash") or hashes.get("sha256Hash") or item.get("cTag")
+        parent = item.get("parentReference", {}).get("id")
+        self._parents[item_id] = parent
+        if parent is not None:
+            self._children.setdefault(parent, {})[self._entries[item_id].name] = item_id
+
+    def _drop(self, item_id: str):
+        """Forget an item and, for a folder, its whole subtree: the delta may report only the folder as deleted."""
+        self._entries.pop(item_id, None)
+        self._parents.pop(item_id, None)
+        self._hashes.pop(item_id, None)
+        for child in self._children.pop(item_id, {}).values():
+            self._drop(child)
+
+    def refresh(self):
+        with self._lock:
+            url = self._delta_link or f"{self.base_url}/root/delta?$top={self.page_size}"
+            while url:
+                page = self._json("GET", url)
+                for item in page.get("value", []):
+                    self._apply(item)
+                url = page.get("@odata.nextLink")
+                if url is None:
+                    self._delta_link = page.get("@odata.deltaLink")
+
+    def _resolve(self, path: str | Path) -> Optional[str]:
+        with self._lock:
+            if self._delta_link is None:
+                self.refresh()
+            item_id = self._root_id
+            for part in Path(path).relative_to(self.root).parts:
+                item_id = self._children.get(item_id, {}).get(part)
+                if item_id is None:
+                    return None
+            return item_id
+
+    def list_dir(self, path: str | Path) -> list[StorageEntry]:
+        with self._lock:
+            item_id = self._resolve(path)
+            if item_id is None or not self._entries[item_id].is_dir:
+                return []
+            entries = [self._entries[child] for child in self._children.get(item_id, {}).values()]
+        return sorted(entries, key=lambda entry: entry.name)
+
+    def stat(self, path: str | Path) -> Optional[StorageEntry]:
+        with self._lock:
+            item_id = self._resolve(path)
+            return self._entries.get(item_id) if item_id is not None else None
+
+    def _item_id(self, path: str | Path) -> str:
+        item_id = self._resolve(path)
+        if item_id is None:
+            raise FileNotFoundError(f"'{Path(path).name}' not found")
+        return item_id
+
+    # Files
+
+    def open_read(self, path: str | Path) -> BinaryIO:
+        url = f"{self.base_url}/items/{quote(self._item_id(path))}/content"
+        key, connection, response = self._send("GET", url)
+        if response.status >= 400:
+            body = response.read()
+            self._release(key, connection, not response.will_close)
+            raise self._error("GET", url, response, body)
+        reader = _PooledResponse(response, lambda done: self._release(key, connection, done and not response.will_close))
+        return io.BufferedReader(reader, 1 << 20)
+
+    def rename(self, source: str | Path, target: str | Path):
+        source, target = Path(source), Path(target)
+        item_id = self._item_id(source)
+        if self.exists(target):
+            raise FileExistsError(f"'{target.name}' already exists")
+        body = {"name": target.name}
+        if source.parent != target.parent:
+            body["parentReference"] = {"id": self._item_id(target.parent)}
+        item = self._json("PATCH", f"{self.base_url}/items/{quote(item_id)}", body)
+        with self._lock:
+            self._apply({"parentReference": {"id": self._parents.get(item_id)}, **item, "id": item_id})
+
+    def content_hash(self, path: str | Path) -> str:
+        with self._lock:
+            content_hash = self._hashes.get(self._item_id(path))
+        return content_hash if content_hash is not None else super().content_hash(path)
@@ -0,0 +1,143 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from core.storage import LocalBackend, StorageBackend, StorageEntry
+
+
+def normalize_release(name: str) -> str:
+    """Normalize a release (or folder) name so that e.g. 'R1_2025' and 'R1 2025' compare equal."""
+    return re.sub(r"\W", " ", name)
+
+
+@dataclass(frozen=True)
+class IndexedFile:
+    """A candidate file found under a release folder, with the stats read while scanning."""
+    path: Path
+    size: int
+    mtime: float
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+class SharePointIndex:
+    """
+    In-memory index of the SharePoint tree: region -> release (normalized) -> candidate files.
+
+    The tree is walked once through the storage backend, whose listings carry the size and mtime
+    of every entry, so every folder is listed a single time and the release names are normalized
+    only once. A folder is considered a release folder when its
+    normalized name is one of `releases` or when it matches `release_pattern`; the walk never
+    descends inside a release folder looking for other releases, skips release folders that
+    are not requested and stops at `release_depth` levels below the budget folder.
+    The files of each release are listed lazily, the first time they are requested.
+    With `workers` greater than 1 the regions are walked in parallel.
+
+    Attributes:
+        sharepoint_path (Path): Root of the SharePoint tree (the folder containing the regions).
+        regions (list | tuple | set | str): Regions to index.
+        budget_folder (str): Name of the budget folder inside each region.
+        file_pattern (re.Pattern | None): Pattern the upper-cased file names must match.
+        release_pattern (re.Pattern | None): Pattern identifying release folders.
+        releases (set[str] | None): Normalized names of the releases to index. None keeps all of them.
+        release_depth (int | None): How many levels below the budget folder to look for releases.
+        workers (int | None): Number of threads walking the regions.
+        backend (StorageBackend): Lists the folders; by default the local folder `sharepoint_path`.
+    """
+    def __init__(self,
+                 sharepoint_path: str | Path,
+                 regions: list | tuple | set | str,
+                 budget_folder: str,
+                 file_pattern: Optional[str | re.Pattern[str]] = None,
+                 release_pattern: Optional[str | re.Pattern[str]] = None,
+                 releases: Optional[Iterable[str]] = None,
+                 release_depth: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 backend: Optional[StorageBackend] = None):
+        self.sharepoint_path = Path(sharepoint_path)
+        self.regions = regions
+        self.budget_folder = budget_folder
+        self.file_pattern = re.compile(file_pattern) if isinstance(file_pattern, str) else file_pattern
+        self.release_pattern = re.compile(release_pattern) if isinstance(release_pattern, str) else release_pattern
+        self.releases = {normalize_release(release) for release in releases} if releases is not None else None
+        self.release_depth = release_depth
+        self.workers = workers
+        self.backend = backend if backend is not None else LocalBackend(self.sharepoint_path)
+
+        self._release_dirs: dict[str, dict[str, list[Path]]] = {}
+        self._release_names: dict[str, str] = {}
+        self._files: dict[tuple[str, str], list[IndexedFile]] = {}
+        self._build()
+
+    def _build(self):
+        self.backend.refresh()
+        regions = [entry for entry in self.backend.list_dir(self.sharepoint_path) if entry.is_dir and entry.name in self.regions]
+
+        def walk(entry: StorageEntry) -> dict[str, list[Path]]:
+            releases = {}
+            self._walk_releases(self.sharepoint_path / entry.name / self.budget_folder, releases, depth=1)
+            return releases
+
+        if self.workers and self.workers > 1 and len(regions) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                region_releases = list(executor.map(walk, regions))
+        else:
+            region_releases = [walk(entry) for entry in regions]
+
+        for entry, releases in zip(regions, region_releases):
+            self._release_dirs[entry.name] = releases
+
+    def _walk_releases(self, directory: Path, releases: dict[str, list[Path]], depth: int):
+        for entry in self.backend.list_dir(directory):
+            if not entry.is_dir:
+                continue
+
+            key = normalize_release(entry.name)
+            is_release = (
+                (self.releases is not None and key in self.releases)
+                or (self.release_pattern is not None and self.release_pattern.match(entry.name))
+            )
+            if is_release:
+                # Release folders that were not requested are pruned, together with their content
+                if self.releases is None or key in self.releases:
+                    releases.setdefault(key, []).append(directory / entry.name)
+                    self._release_names.setdefault(key, entry.name)
+            elif self.release_depth is None or depth < self.release_depth:
+                self._walk_releases(directory / entry.name, releases, depth + 1)
+
+    def _walk_files(self, directory: Path, files: list[IndexedFile]):
+        for entry in self.backend.list_dir(directory):
+            if entry.is_dir:
+                self._walk_files(directory / entry.name, files)
+            elif self.file_pattern is None or self.file_pattern.match(entry.name.upper()):
+                files.append(IndexedFile(path=directory / entry.name, size=entry.size, mtime=entry.mtime))
+
+    def get_regions(self) -> list[str]:
+        """Return the indexed regions, in name order."""
+        return list(self._release_dirs)
+
+    def get_releases(self, region: Optional[str] = None) -> list[str]:
+        """Return the release folder names found in `region`, or in any region when `region` is None."""
+        if region is not None:
+            keys = self._release_dirs.get(region, {})
+        else:
+            keys = {key: None for releases in self._release_dirs.values() for key in releases}
+        return [self._release_names[key] for key in keys]
+
+    def get_release_dirs(self, region: str, release: str) -> list[Path]:
+        """Return the folders of `release` in `region`."""
+        return self._release_dirs.get(region, {}).get(normalize_release(release), [])
+
+    def get_files(self, region: str, release: str) -> list[IndexedFile]:
+        """Return the candidate files of `release` in `region`, walking its folders on first use."""
+        key = (region, normalize_release(release))
+        if key not in self._files:
+            files = []
+            for release_dir in self.get_release_dirs(region, release):
+                self._walk_files(release_dir, files)
+            self._files[key] = files
+        return self._files[key]
@@ -0,0 +1,212 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+from core.storage import LocalBackend
+from core.tree_index import IndexedFile, SharePointIndex, normalize_release
+
+
+@dataclass(frozen=True)
+class WatchEvent:
+    """A file of a release that settled after being added, changed or removed."""
+    region: str
+    release: str
+    path: Path
+    kind: str
+
+
+@dataclass
+class _Directory:
+    """A watched directory, with the mtime and the entries it had when last listed."""
+    region: str
+    release: str
+    mtime: Optional[int]
+    subdirs: set[Path] = field(default_factory=set)
+    files: dict[Path, IndexedFile] = field(default_factory=dict)
+
+
+class TreeWatcher:
+    """
+    Polling watcher of the release folders of the SharePoint tree, without third-party watchers.
+
+    Every directory below the release folders is listed once at start; afterwards each poll only
+    stats the known directories and lists again those whose mtime changed (a file was added,
+    removed or replaced), so the cost of a poll grows with the changed directories, not with the
+    files of the tree. The budget folders are watched in the same way, to pick up release folders
+    created later. Files edited in place do not change the mtime of their directory, so every
+    `full_scan_every` polls all the directories are listed again anyway.
+
+    A new, changed or removed file is reported once its size and mtime have not changed for
+    `settle` seconds (debounce), so that a workbook still being synced is never converted. The
+    watcher can be passed as the `index` of `find_and_convert_files`: it exposes the settled
+    files only, with the stats they settled with. It needs the local mount, since the mtimes of
+    the folders are what makes the polls cheap.
+
+    Attributes:
+        sharepoint_path (Path): Root of the SharePoint tree.
+        regions (list | tuple | set | str): Regions to watch.
+        budget_folder (str): Name of the budget folder inside each region.
+        file_pattern (re.Pattern | None): Pattern the upper-cased file names must match.
+        releases (list[str]): The releases to watch.
+        release_pattern (re.Pattern | None): Pattern of the release folders, so that the others are not walked.
+        settle (float): Seconds a file must stay unchanged before it is reported.
+        full_scan_every (int): Every how many polls all the directories are listed again.
+    """
+    def __init__(self,
+                 sharepoint_path: str | Path,
+                 regions: list | tuple | set | str,
+                 budget_folder: str,
+                 file_pattern: Optional[str | re.Pattern[str]] = None,
+                 releases: Iterable[str] = (),
+                 settle: float = 30.0,
+                 full_scan_every: int = 30,
+                 release_pattern: Optional[str | re.Pattern[str]] = None):
+        self.sharepoint_path = Path(sharepoint_path)
+        self.regions = regions
+        self.budget_folder = budget_folder
+        self.file_pattern = re.compile(file_pattern) if isinstance(file_pattern, str) else file_pattern
+        self.releases = list(releases)
+        self.release_pattern = re.compile(release_pattern) if isinstance(release_pattern, str) else release_pattern
+        self.settle = settle
+        self.full_scan_every = max(1, full_scan_every)
+
+        self._release_names = {normalize_release(release): release for release in self.releases}
+        self._roots: dict[str, Optional[int]] = {}
+        self._dirs: dict[Path, _Directory] = {}
+        self._stable: dict[tuple[str, str], dict[Path, IndexedFile]] = {}
+        # Files seen changing, not settled yet: path -> (region, release key, (size, mtime) or None, since)
+        self._pending: dict[Path, tuple[str, str, Optional[tuple[int, float]], float]] = {}
+        self._polls = 0
+        self._backend = LocalBackend(self.sharepoint_path)
+
+        index = SharePointIndex(self.sharepoint_path, regions, budget_folder, releases=self.releases,
+                                release_pattern=self.release_pattern)
+        for region in index.get_regions():
+            self._roots[region] = self._mtime(self.sharepoint_path / region / budget_folder)
+            self._add_release_dirs(index, region, now=None)
+
+    @staticmethod
+    def _mtime(path: Path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[tuple[int, float]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _add_release_dirs(self, index: SharePointIndex, region: str, now: Optional[float]):
+        for key, release in self._release_names.items():
+            for release_dir in index.get_release_dirs(region, release):
+                if release_dir not in self._dirs:
+                    self._add_dir(release_dir, region, key, now)
+
+    def _add_dir(self, path: Path, region: str, release: str, now: Optional[float]):
+        """Watch a directory and its subdirectories; their files are stable at start (`now` None), pending later."""
+        directory = _Directory(region, release, self._mtime(path))
+        self._dirs[path] = directory
+        self._list(path, directory, now)
+
+    def _remove_dir(self, path: Path, now: float):
+        directory = self._dirs.pop(path, None)
+        if directory is None:
+            return
+        for subdir in directory.subdirs:
+            self._remove_dir(subdir, now)
+        for file_path in directory.files:
+            self._pending[file_path] = (directory.region, directory.release, None, now)
+
+    def _list(self, path: Path, directory: _Directory, now: Optional[float]):
+        """List a directory again, queueing its new, changed and removed files."""
+        subdirs, files = set(), {}
+        for entry in self._backend.list_dir(path):
+            if entry.is_dir:
+                subdirs.add(path / entry.name)
+            elif self.file_pattern is None or self.file_pattern.match(entry.name.upper()):
+                files[path / entry.name] = IndexedFile(path=path / entry.name, size=entry.size, mtime=entry.mtime)
+
+        stable = self._stable.setdefault((directory.region, directory.release), {})
+        for file_path, file in files.items():
+            if now is None:
+                stable[file_path] = file
+            elif file_path not in self._pending and stable.get(file_path) != file:
+                self._pending[file_path] = (directory.region, directory.release, (file.size, file.mtime), now)
+        if now is not None:
+            for file_path in directory.files.keys() - files.keys():
+                self._pending[file_path] = (directory.region, directory.release, None, now)
+
+        for subdir in directory.subdirs - subdirs:
+            self._remove_dir(subdir, now)
+        for subdir in subdirs - directory.subdirs:
+            self._add_dir(subdir, directory.region, directory.release, now)
+        directory.subdirs, directory.files = subdirs, files
+
+    def poll(self, now: Optional[float] = None) -> list[WatchEvent]:
+        """Look for changes and return the files that settled since the last poll."""
+        now = time.monotonic() if now is None else now
+        self._polls += 1
+        full = self._polls % self.full_scan_every == 0
+
+        for region, mtime in self._roots.items():
+            current = self._mtime(self.sharepoint_path / region / self.budget_folder)
+            if full or current != mtime:
+                self._roots[region] = current
+                index = SharePointIndex(self.sharepoint_path, [region], self.budget_folder, releases=self.releases,
+                                        release_pattern=self.release_pattern)
+                self._add_release_dirs(index, region, now)
+
+        for path in list(self._dirs):
+            directory = self._dirs.get(path)
+            if directory is None:
+                # Removed with its parent during this poll
+                continue
+            mtime = self._mtime(path)
+            if mtime is None:
+                self._remove_dir(path, now)
+            elif full or mtime != directory.mtime:
+                directory.mtime = mtime
+                self._list(path, directory, now)
+
+        events = []
+        for path, (region, release, signature, since) in list(self._pending.items()):
+            current = self._signature(path)
+            if current != signature:
+                self._pending[path] = (region, release, current, now)
+                continue
+            if now - since < self.settle:
+                continue
+
+            del self._pending[path]
+            stable = self._stable.setdefault((region, release), {})
+            if current is None:
+                if stable.pop(path, None) is not None:
+                    events.append(WatchEvent(region, self._release_names[release], path, "removed"))
+            else:
+                file = IndexedFile(path=path, size=current[0], mtime=current[1])
+                if stable.get(path) != file:
+                    kind = "changed" if path in stable else "added"
+                    stable[path] = file
+                    events.append(WatchEvent(region, self._release_names[release], path, kind))
+        return events
+
+    @property
+    def pending(self) -> int:
+        """Number of files seen changing that did not settle yet."""
+        return len(self._pending)
+
+    def get_regions(self) -> list[str]:
+        """Return the watched regions, in name order."""
+        return sorted(self._roots)
+
+    def get_files(self, region: str, release: str) -> list[IndexedFile]:
+        """Return the settled files of `release` in `region`, in the order `SharePointIndex` lists them."""
+        files = self._stable.get((region, normalize_release(release)), {})
+        return sorted(files.values(), key=lambda file: file.path.parts)
@@ -1,64 +1,171 @@
 
 # Standard Libs
 from pathlib import Path
+import threading
+import time
 import customtkinter
-import sys
 
 # Local Imports
 from gui.components import MyCheckboxFrame
 from core.config_loader import ConfigLoader
-from utils.tools import find_and_convert_files, put_tag
+from core.release_manager import ReleaseInfo, ReleaseManager
+from core.storage import StorageBackend
+from core.tree_index import SharePointIndex
+from core.job_runner import JobRunner
+from utils.log_sink import LogSink
+from utils.resources import get_log_path, get_save_path
 
 class App(customtkinter.CTk):
     """
     Main application class for managing the SharePoint budget process via a GUI.
 
     This application provides functionality for:
+    - Previewing the files a download and a tag would process, with their estimated duration.
     - Downloading and converting budget files for selected releases.
     - Tagging processed budget files with a custom label ("UPLOADED").
 
     Attributes:
         releases (list[str]): List of release names available for processing.
+        release_manager (ReleaseManager | None): Refreshes the releases in the background at startup.
+        started (float | None): `time.perf_counter()` when the program started, to log the time to the first paint.
+        backend (StorageBackend | None): Lists, reads and renames the SharePoint files; None uses the local `sharepoint_path`.
         config (ConfigLoader): Configuration loader instance containing file patterns, regions, and folder paths.
         sharepoint_path (Path): Path to the SharePoint directory containing budget files.
         checkbox_frame (MyCheckboxFrame): UI component for selecting releases via checkboxes.
         log_textbox (customtkinter.CTkTextbox): UI component for displaying logs and messages.
+        progress_bar (customtkinter.CTkProgressBar): UI component showing the files processed by the running job.
+        progress_label (customtkinter.CTkLabel): UI component showing the processed files and the files per second.
+        plan_button (customtkinter.CTkButton): Button to preview the download and tagging processes.
         download_button (customtkinter.CTkButton): Button to trigger the download process.
         tag_button (customtkinter.CTkButton): Button to trigger the tagging process.
+        cancel_button (customtkinter.CTkButton): Button to stop the running job between two files.
+        job_runner (JobRunner): Runs the download and tagging jobs off the main thread.
+        log_sink (LogSink): Buffers the log messages for the text box and writes them to the log file.
     """
-    def __init__(self, releases: list[str], config: ConfigLoader, sharepoint_path:  str | Path):
+    LOG_FLUSH_MS = 100
+
+    def __init__(self, releases: list[ReleaseInfo] | None, config: ConfigLoader, sharepoint_path:  str | Path,
+                 release_manager: ReleaseManager | None = None, started: float | None = None,
+                 backend: StorageBackend | None = None):
         """
         Initialize the App instance and set up the GUI components.
 
         Args:
-            releases (list[str]): List of release names to populate the checkbox frame.
+            releases (list[ReleaseInfo] | None): Releases to populate the checkbox frame, possibly from the cache.
+                None shows the frame as loading, and the jobs stay disabled, until the background scan ends.
             config (ConfigLoader): Configuration loader containing settings and parameters for the process.
             sharepoint_path (str | Path): Path to the SharePoint directory containing the budget files.
+            release_manager (ReleaseManager | None): If given, the releases are rescanned in the background
+                and the checkbox frame is updated when the scan ends.
+            started (float | None): `time.perf_counter()` when the program started, to log the time to the first paint.
+            backend (StorageBackend | None): Lists, reads and renames the SharePoint files; None uses the local `sharepoint_path`.
         """
         super().__init__()
-        self.releases = releases
+        self.releases = [release.name for release in releases or []]
+        self.release_manager = release_manager
+        self.started = started
+        self.backend = backend
         self.config = config
         self.sharepoint_path = sharepoint_path
+        self.log_sink = LogSink(log_file=self._get_log_path())
+        self.job_runner = JobRunner(log_func=self.log_sink.write)
+        self._color_tags = set()
 
         self.title("Download Budget From SharePoint")
-        self.geometry("600x650")
+        self.geometry("600x720")
         self._configure_layout()
 
-        self.checkbox_frame = MyCheckboxFrame(self, values=self.releases, title="Release")
+        self.checkbox_frame = MyCheckboxFrame(
+            self, values=self.releases, title="Release", details=self._release_details(releases or [])
+        )
         self.checkbox_frame.grid(row=0, column=0, padx=15, pady=(10, 0), sticky="nsew")
 
         self.log_textbox = customtkinter.CTkTextbox(self, height=10)
         self.log_textbox.grid(row=0, column=1, padx=15, pady=(10, 0), sticky="nsew")
 
+        self.progress_bar = customtkinter.CTkProgressBar(self, progress_color="#39597B")
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=1, column=0, padx=15, pady=(10, 0), sticky="ew")
+
+        self.progress_label = customtkinter.CTkLabel(self, text="")
+        self.progress_label.grid(row=1, column=1, padx=15, pady=(10, 0), sticky="w")
+
+        self.plan_button = customtkinter.CTkButton(
+            self, text="Plan", command=self._handle_plan, fg_color="#39597B"
+        )
+        self.plan_button.grid(row=2, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
         self.download_button = customtkinter.CTkButton(
             self, text="Download", command=self._handle_download, fg_color="#39597B"
         )
-        self.download_button.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.download_button.grid(row=3, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
 
         self.tag_button = customtkinter.CTkButton(
             self, text="Put 'UPLOADED'", command=self._handle_put_tag, fg_color="#39597B"
         )
-        self.tag_button.grid(row=2, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.tag_button.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
+        self.cancel_button = customtkinter.CTkButton(
+            self, text="Cancel", command=self._handle_cancel, fg_color="#39597B", state="disabled"
+        )
+        self.cancel_button.grid(row=5, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+
+        self.after(self.LOG_FLUSH_MS, self._flush_log)
+        if releases is None:
+            self.checkbox_frame.set_loading("Loading releases...")
+            self._set_running(True, cancellable=False)
+        if self.release_manager is not None:
+            self._refresh_releases()
+        # Idle callbacks run once the window has been drawn
+        self.after_idle(self._report_startup)
+
+    def _report_startup(self):
+        """
+        Log the time from the start of the program to the first paint of the window.
+        """
+        if self.started is not None:
+            self.log_sink.write(f"Window shown in {time.perf_counter() - self.started:.2f} s", color='gray')
+
+    @staticmethod
+    def _release_details(releases: list[ReleaseInfo]) -> dict[str, str]:
+        """
+        Return the text shown next to each release: how many regions have it and how many files.
+        """
+        return {release.name: f"{release.regions} regions, {release.files} files" for release in releases}
+
+    def _refresh_releases(self):
+        """
+        Rescan the releases on a background thread, then update the checkbox frame.
+        """
+        result = {}
+
+        def scan():
+            try:
+                result["releases"] = self.release_manager.discover_releases()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=scan, daemon=True)
+        thread.start()
+        self.after(200, self._poll_releases, thread, result)
+
+    def _poll_releases(self, thread: threading.Thread, result: dict):
+        """
+        Wait for the background scan of the releases, then show them.
+        """
+        if thread.is_alive():
+            self.after(200, self._poll_releases, thread, result)
+            return
+        if "error" in result:
+            self.log_message(f"Could not refresh the releases: {result['error']}", color='orange')
+            if self.checkbox_frame.loading_label is not None:
+                self.checkbox_frame.set_loading("No releases")
+        else:
+            releases = result["releases"]
+            self.releases = [release.name for release in releases]
+            self.checkbox_frame.set_values(self.releases, details=self._release_details(releases))
+        if not self.job_runner.is_running():
+            self._set_running(False)
 
     def _configure_layout(self):
         """
@@ -73,6 +180,9 @@ class App(customtkinter.CTk):
         self.grid_rowconfigure(0, weight=1)
         self.grid_rowconfigure(1, weight=0)
         self.grid_rowconfigure(2, weight=0)
+        self.grid_rowconfigure(3, weight=0)
+        self.grid_rowconfigure(4, weight=0)
+        self.grid_rowconfigure(5, weight=0)
 
     def _create_widgets(self):
         """
@@ -105,33 +215,65 @@ class App(customtkinter.CTk):
 
     def log_message(self, message: str, color: str = 'black'):
         """
-        Append a log message to the log text box and apply a specific color to it.
+        Append a log message to the log sink; it is shown in the log text box at the next flush.
 
         Args:
             message (str): The message to be logged.
             color (str): The color of the message. Default is 'black'.
         """
-        # Insert the new message
-        self.log_textbox.insert("end", f"{message}\n")
-        
-        # Calculate the indices of the inserted message
-        start_index = self.log_textbox.index("end-1c linestart")  # Start of the newly inserted line
-        end_index = self.log_textbox.index("end-1c")  # End of the newly inserted message
-        print(start_index, end_index)
-        # Create a unique tag for this message
-        tag_name = f"color_{self.log_textbox.index('end-1c').replace('.', '_')}"
-        self.log_textbox.tag_add(tag_name, start_index, end_index)
-        self.log_textbox.tag_config(tag_name, foreground=color)
-        
-        # Ensure the log scrolls to the latest entry
-        self.log_textbox.see("end")
+        self.log_sink.write(message, color=color)
+
+    def _get_color_tag(self, color: str) -> str:
+        """
+        Return the text box tag of a color, configuring it the first time it is used.
+        """
+        tag_name = f"color_{color}"
+        if tag_name not in self._color_tags:
+            self.log_textbox.tag_config(tag_name, foreground=color)
+            self._color_tags.add(tag_name)
+        return tag_name
+
+    def _flush_log(self):
+        """
+        Insert the messages buffered by the log sink in one batch, keeping at most 
+        `log_sink.max_lines` lines in the text box, then schedule the next flush.
+        """
+        batch = self.log_sink.drain()
+        if batch:
+            # Consecutive messages of the same color are inserted together
+            chunks = []
+            for message, color in batch:
+                if chunks and chunks[-1][1] == color:
+                    chunks[-1][0].append(message)
+                else:
+                    chunks.append(([message], color))
+            for messages, color in chunks:
+                self.log_textbox.insert("end", "\n".join(messages) + "\n", self._get_color_tag(color))
+
+            lines = int(self.log_textbox.index("end-1c").split(".")[0])
+            if lines > self.log_sink.max_lines:
+                self.log_textbox.delete("1.0", f"{lines - self.log_sink.max_lines + 1}.0")
+
+            # Ensure the log scrolls to the latest entry
+            self.log_textbox.see("end")
+
+        self.after(self.LOG_FLUSH_MS, self._flush_log)
 
     def clear_log(self):
         """
         Clear all messages from the log text box.
         """
+        self.log_sink.clear()
         self.log_textbox.delete("1.0", "end")
         
+    def _get_log_path(self) -> Path:
+        """
+        Construct the path of the log file, next to the release folders.
+
+        Returns:
+            Path: The path of the rotating log file.
+        """
+        return get_log_path()
 
     def _get_save_path(self, release: str) -> Path:
         """
@@ -143,34 +285,136 @@ class App(customtkinter.CTk):
         Returns:
             Path: The computed save path based on the release name.
         """
-        year = release[-4:]  # Extract the year from the release name
-        if getattr(sys, 'frozen', False):
-            return Path(__file__).parents[6] / year / release
-        else:
-            return Path(__file__).parents[3] / year / release
+        return get_save_path(release)
     
-    def _process_releases(self, process_func, process_name: str):
+    def _process_releases(self, process_func, process_name: str, scan: bool = True, multi_release: bool = False):
         """
         Generalized method to process selected releases.
 
         This method handles common tasks such as:
         - Clearing the log box.
+        - Running the process on a worker thread, with the buttons disabled until it ends.
+        - Scanning the SharePoint tree once for all the selected releases, if needed.
         - Iterating through selected releases.
         - Logging the start and end of the process.
 
         Args:
-            process_func (callable): The function to apply to each release.
-                It must accept two arguments: `release` (str) and `save_path` (Path).
+            process_func (callable): The function to apply to each release, on the worker thread.
+                It must accept four arguments: `release` (str), `save_path` (Path), 
+                `index` (SharePointIndex, None without `scan`) and `runner` (JobRunner), to report logs and progress.
             process_name (str): A descriptive name for the process (e.g., "download", "label").
+            scan (bool): Whether the process needs the index of the SharePoint tree.
+            multi_release (bool): Call `process_func` once for all the releases instead, with `releases` (list[str]),
+                `save_paths` (dict[str, Path]), `index`, `runner` and `start_release` (callable logging the start 
+                of a release), so that it can process them together.
         """
+        if self.job_runner.is_running():
+            return
+
         self.clear_log()
         releases = self.checkbox_frame.get()
-        for release in releases:
-            save_path = self._get_save_path(release)
-            self.log_message(f"Starting {process_name} process for release: {release}", color='blue')
-            process_func(release, save_path)
-        self.log_message(f"{process_name.capitalize()} process completed.\n\n", color='blue')
-        
+        save_paths = {release: self._get_save_path(release) for release in releases}
+
+        def job(runner: JobRunner):
+            index = None
+            if scan:
+                index = SharePointIndex(
+                    self.sharepoint_path,
+                    regions=self.config.get('regions'),
+                    budget_folder=self.config.get('budget_folder'),
+                    file_pattern=self.config.get('pattern file'),
+                    release_pattern=self.config.get('pattern release'),
+                    releases=releases,
+                    backend=self.backend
+                )
+
+            def start_release(release: str):
+                runner.log(f"Starting {process_name} process for release: {release}", color='blue')
+
+            if multi_release:
+                process_func(releases, save_paths, index, runner, start_release)
+            else:
+                for release in releases:
+                    if runner.cancel_event.is_set():
+                        break
+                    start_release(release)
+                    process_func(release, save_paths[release], index, runner)
+
+            if runner.cancel_event.is_set():
+                runner.log(f"{process_name.capitalize()} process cancelled.\n\n", color='blue')
+            else:
+                runner.log(f"{process_name.capitalize()} process completed.\n\n", color='blue')
+
+        self._set_running(True)
+        self.job_runner.start(job)
+        self.after(100, self._poll_job)
+
+    def _poll_job(self):
+        """
+        Show the logs and the progress reported by the running job, until it ends.
+        """
+        finished = False
+        for event in self.job_runner.drain():
+            kind = event[0]
+            if kind == "progress":
+                _, done, total, files_per_second = event
+                self.progress_bar.set(done / total if total else 0)
+                self.progress_label.configure(text=f"{done}/{total} files - {files_per_second:.1f} files/s")
+            elif kind == "error":
+                self.log_message(f"Error: {event[1]}", color='red')
+                finished = True
+            elif kind == "done":
+                finished = True
+
+        if finished:
+            self._set_running(False)
+        else:
+            self.after(100, self._poll_job)
+
+    def _set_running(self, running: bool, cancellable: bool = True):
+        """
+        Enable or disable the buttons, so that only one job runs at a time.
+        """
+        state = "disabled" if running else "normal"
+        self.plan_button.configure(state=state)
+        self.download_button.configure(state=state)
+        self.tag_button.configure(state=state)
+        self.cancel_button.configure(state="normal" if running and cancellable else "disabled")
+
+    def _handle_cancel(self):
+        """
+        Ask the running job to stop before the next file.
+        """
+        self.job_runner.cancel()
+        self.log_message("Cancelling, waiting for the current file to finish...", color='blue')
+
+    def _handle_plan(self):
+        """
+        Preview the download and tagging processes of the selected releases.
+
+        The files each process would handle, their cache status, the estimated durations and the
+        anomalies are logged; no workbook is opened and nothing is written.
+        """
+        def plan_process(releases, save_paths, index, runner, start_release):
+            from utils.planner import plan_releases
+
+            plan_releases(
+                releases=releases,
+                pattern=self.config.get('pattern file'),
+                search_path=self.sharepoint_path,
+                regions=self.config.get('regions'),
+                budget_definition_folder=self.config.get('budget_folder'),
+                save_paths=save_paths,
+                tag='UPLOADED',
+                log_func=self.log_sink,
+                workers=self.config.get('workers'),
+                cache=bool(self.config.get('cache')),
+                backend=self.backend,
+                release_pattern=self.config.get('pattern release')
+            )
+
+        # The planner scans the tree itself, to time the scan for the estimate
+        self._process_releases(plan_process, "plan", scan=False, multi_release=True)
 
     def _handle_download(self):
         """
@@ -179,19 +423,38 @@ class App(customtkinter.CTk):
         This method uses the `_process_releases` method to:
         - Download files for each selected release.
         - Convert the downloaded files into the required format.
+
+        All the selected releases are converted together, through one worker pool.
         """
-        def download_process(release, save_path):
-            find_and_convert_files(
-                release=release,
+        def download_process(releases, save_paths, index, runner, start_release):
+            # pandas and openpyxl are imported by the first job, not at startup
+            from utils.tools import find_and_convert_releases
+
+            find_and_convert_releases(
+                releases=releases,
                 pattern=self.config.get('pattern file'),
                 search_path=self.sharepoint_path,
                 regions=self.config.get('regions'),
                 budget_definition_folder=self.config.get('budget_folder'),
-                save_path=save_path,
-                log_func=self.log_message
+                save_paths=save_paths,
+                log_func=self.log_sink,
+                workers=self.config.get('workers'),
+                index=index,
+                cache=bool(self.config.get('cache')),
+                reader=self.config.get('reader') or 'pandas',
+                progress_func=runner.progress,
+                cancel_event=runner.cancel_event,
+                profile=self.config.get('profile'),
+                prefetch=self.config.get('prefetch'),
+                outputs=self.config.get('outputs'),
+                aggregate_outputs=self.config.get('aggregate_outputs'),
+                consolidate=bool(self.config.get('consolidate')),
+                delta=bool(self.config.get('delta')),
+                backend=self.backend,
+                release_func=start_release
             )
 
-        self._process_releases(download_process, "download")
+        self._process_releases(download_process, "download", multi_release=True)
 
     def _handle_put_tag(self):
         """
@@ -200,7 +463,9 @@ class App(customtkinter.CTk):
         This method uses the `_process_releases` method to:
         - Apply a custom tag (e.g., "UPLOADED") to each selected release.
         """
-        def tag_process(release, save_path):
+        def tag_process(release, save_path, index, runner):
+            from utils.tools import put_tag
+
             put_tag(
                 release=release,
                 pattern=self.config.get('pattern file'),
@@ -209,7 +474,12 @@ class App(customtkinter.CTk):
                 regions=self.config.get('regions'),
                 budget_definition_folder=self.config.get('budget_folder'),
                 tag='UPLOADED',
-                log_func=self.log_message
+                log_func=self.log_sink,
+                progress_func=runner.progress,
+                cancel_event=runner.cancel_event,
+                profile=self.config.get('profile'),
+                backend=self.backend
             )
 
-        self._process_releases(tag_process, "label")
\ No newline at end of file
+        # Tagging renames the files listed in the download manifest, no scan needed
+        self._process_releases(tag_process, "label", scan=False)
\ No newline at end of file
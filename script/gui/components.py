@@ -1,21 +1,51 @@
 import customtkinter
-from typing import List
+from typing import Dict, List, Optional
 
 class MyCheckboxFrame(customtkinter.CTkFrame):
-    def __init__(self, master, values: List[str], title: str):
+    def __init__(self, master, values: List[str], title: str, details: Optional[Dict[str, str]] = None):
         super().__init__(master)
-        self.values = values
+        self.values = []
         self.checkboxes = []
+        self.detail_labels = []
+        self.loading_label = None
 
         title_label = customtkinter.CTkLabel(self, text=title, fg_color="#39597B", corner_radius=6)
         title_label.grid(row=0, column=0, padx=10, pady=10, sticky="ew", columnspan=2)
 
+        self.set_values(values, details)
+
+    def set_values(self, values: List[str], details: Optional[Dict[str, str]] = None):
+        """Replace the checkboxes with `values`, keeping checked the values that still exist."""
+        self.set_loading(None)
+        checked = set(self.get())
+        for widget in self.checkboxes + self.detail_labels:
+            widget.destroy()
+        self.values = values
+        self.checkboxes = []
+        self.detail_labels = []
+
         for i, value in enumerate(self.values):
             checkbox = customtkinter.CTkCheckBox(self, text=value)
             checkbox.grid(row=i + 1, column=0, padx=10, pady=(15, 0), sticky="ew")
+            if value in checked:
+                checkbox.select()
             self.checkboxes.append(checkbox)
 
+            if details and value in details:
+                label = customtkinter.CTkLabel(self, text=details[value], text_color="gray")
+                label.grid(row=i + 1, column=1, padx=10, pady=(15, 0), sticky="w")
+                self.detail_labels.append(label)
+
+    def set_loading(self, text: Optional[str] = "Loading..."):
+        """Show `text` in place of the checkboxes until the values are set, or remove it when None."""
+        if self.loading_label is not None:
+            self.loading_label.destroy()
+            self.loading_label = None
+        if text is not None:
+            self.loading_label = customtkinter.CTkLabel(self, text=text, text_color="gray")
+            self.loading_label.grid(row=1, column=0, padx=10, pady=(15, 0), sticky="w", columnspan=2)
+
     def get(self) -> List[str]:
         return [
             checkbox.cget("text") for checkbox in self.checkboxes if checkbox.get() == 1
-        ]
\ No newline at end of file
+        ]
@@ -1,28 +1,42 @@
 # Standard imports
+import time
+STARTED = time.perf_counter()
+
 from pathlib import Path
-import openpyxl
+import multiprocessing
 
 # Local Imports
 from core.config_loader import ConfigLoader
 from core.sharepoint import SharePointPathResolver
 from core.release_manager import ReleaseManager
+from utils.resources import get_release_cache_path
 from gui.app import App
 
 
 if __name__ == "__main__":
+    # Needed by the conversion process pool in the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
+
     # Load config
     config = ConfigLoader(config_path=Path(__file__).parents[0] / "config.yaml")
     
     # Resolve SharePoint path
-    resolver = SharePointPathResolver()
+    resolver = SharePointPathResolver(storage_url=config.get('storage_url'))
     
-    # Get available releases
+    # The cached releases are shown at once; the share is scanned by the GUI in the background,
+    # with the release list shown as loading when there is no cache yet
     release_manager = ReleaseManager(
         sharepoint_path=resolver.path,
-        pattern=config.get("pattern release")
+        pattern=config.get("pattern release"),
+        regions=config.get('regions'),
+        budget_folder=config.get('budget_folder'),
+        file_pattern=config.get('pattern file'),
+        cache_path=get_release_cache_path(),
+        backend=resolver.backend
     )
-    available_releases = release_manager.get_available_releases()
+    available_releases = release_manager.get_cached_releases(allow_stale=True)
     
     # Launch the GUI
-    app = App(releases=available_releases, config=config, sharepoint_path=resolver.path)
-    app.mainloop()
\ No newline at end of file
+    app = App(releases=available_releases, config=config, sharepoint_path=resolver.path,
+              release_manager=release_manager, started=STARTED, backend=resolver.backend)
+    app.mainloop()
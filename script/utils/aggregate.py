@@ -0,0 +1,375 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.convert_kernel import TEXT_COLUMNS
+from utils.writers import OutputWriter, XlsxWriter, get_writers
+
+
+@dataclass(frozen=True)
+class FileSummary:
+    """Lightweight result of a converted file: where it comes from, how many rows and its total budget."""
+    path: Path
+    rows: int
+    total: int
+
+
+class AggregateSink:
+    """
+    Streaming writer of the `{name}.txt`, `{name}.xlsx` (and other `outputs`) aggregates of a release.
+
+    The rows of each converted file are appended to every aggregate as soon as the file is
+    converted: the TXT is streamed to disk, the XLSX goes to an openpyxl write-only workbook that
+    keeps them on disk until it is saved, and the pyarrow formats get one row group (or batch) per
+    file, so the aggregate is never held in memory as a whole. Each aggregate is written to a
+    temporary file renamed when closed. The files are created on the first append, so nothing
+    is written when no file is found.
+
+    Attributes:
+        save_path (Path): Folder where the aggregates are written.
+        name (str): Name of the aggregate files, without extension.
+        outputs (list[str] | None): Formats of the aggregates, see `utils.writers.get_writers`.
+        summaries (list[FileSummary]): One summary per appended file.
+    """
+    def __init__(self, save_path: str | Path, name: str, outputs: Optional[list[str]] = None):
+        self.save_path = Path(save_path)
+        self.name = name
+        self.outputs = outputs
+        self.summaries: list[FileSummary] = []
+        self._writers: Optional[list[OutputWriter]] = None
+
+    def _open(self):
+        self.save_path.mkdir(parents=True, exist_ok=True)
+        self._writers = [writer(self.save_path / f"{self.name}{writer.extension}") for writer in get_writers(self.outputs)]
+
+    def append(self, df: pd.DataFrame, source: str | Path) -> FileSummary:
+        """Append the rows of a converted file to the aggregates and return its summary."""
+        if self._writers is None:
+            self._open()
+
+        for writer in self._writers:
+            writer.append(df)
+
+        summary = FileSummary(path=Path(source), rows=len(df), total=int(df["QTY"].sum()))
+        self.summaries.append(summary)
+        return summary
+
+    def close(self):
+        """Flush the aggregates and move them in place, if any row was appended."""
+        if self._writers is None:
+            return
+        for writer in self._writers:
+            writer.close()
+        self._writers = None
+
+    def abort(self):
+        """Drop the temporary files, leaving the aggregates of the last complete run in place."""
+        if self._writers is None:
+            return
+        for writer in self._writers:
+            writer.abort()
+        self._writers = None
+
+
+@dataclass(frozen=True)
+class ConsolidationSummary:
+    """Result of a consolidated aggregate: rows appended, distinct keys, keys found in more than one row and their rows."""
+    rows: int
+    keys: int
+    duplicate_keys: int
+    duplicate_rows: int
+
+
+class ConsolidatedAggregate:
+    """
+    Consolidated aggregate of a release: one row per REGION/MODEL/SIZE/COLOR/P key, QTY summed.
+
+    Every key value is encoded as an integer (one code table per column, filled as new values are
+    met), each file is grouped by the five codes on its own, and the partial groups are merged
+    every `compact_rows` groups: memory grows with the number of distinct keys, never with the
+    rows of the release. The (key, file) pairs of each file are spilled to a temporary binary file
+    instead, read back in chunks only to list the source files of the duplicated keys.
+
+    `close` writes `{name}_consolidated` (in the `outputs` formats, rows in order of first
+    appearance) and, when some key is found in more than one row, `{name}_duplicates.xlsx` with
+    the summed QTY, the number of rows and files and the names of the source files of each key.
+    With `write_outputs` False nothing is written, the keys are only kept for `to_frame`.
+
+    Attributes:
+        save_path (Path): Folder where the consolidated aggregate is written.
+        name (str): Name of the raw aggregate, used as prefix.
+        outputs (list[str] | None): Formats of the consolidated aggregate, see `utils.writers.get_writers`.
+        write_outputs (bool): Write the consolidated aggregate and the duplicates report when closed.
+        sources (list[str]): Names of the appended files, indexed by file id.
+        rows (int): Number of rows appended.
+    """
+    KEY_COLUMNS = TEXT_COLUMNS
+
+    def __init__(self, save_path: str | Path, name: str, outputs: Optional[list[str]] = None,
+                 compact_rows: int = 1_000_000, chunk_rows: int = 100_000, write_outputs: bool = True):
+        self.save_path = Path(save_path)
+        self.name = name
+        self.outputs = outputs
+        self.write_outputs = write_outputs
+        self.compact_rows = compact_rows
+        self.chunk_rows = chunk_rows
+        self.sources: list[str] = []
+        self.rows = 0
+        self._codes: dict[str, dict[str, int]] = {column: {} for column in self.KEY_COLUMNS}
+        self._values: dict[str, list[str]] = {column: [] for column in self.KEY_COLUMNS}
+        self._groups: Optional[pd.DataFrame] = None
+        self._pending: list[pd.DataFrame] = []
+        self._pending_rows = 0
+        self._keys_path = self.save_path / f".{name}_keys.tmp"
+        self._keys_file = None
+
+    def _encode(self, column: str, values: pd.Series) -> np.ndarray:
+        """Return the codes of `values`, as written in the TXT, adding the new ones to the code table."""
+        codes, uniques = pd.factorize(values.astype(str))
+        table, known = self._codes[column], self._values[column]
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = table.get(value)
+            if code is None:
+                code = table[value] = len(known)
+                known.append(value)
+            mapping[i] = code
+        return mapping[codes]
+
+    def append(self, df: pd.DataFrame, source: str | Path):
+        """Add the rows of a converted file."""
+        if self._keys_file is None and self.write_outputs:
+            self.save_path.mkdir(parents=True, exist_ok=True)
+            self._keys_file = open(self._keys_path, "wb")
+
+        file_id = len(self.sources)
+        self.sources.append(Path(source).name)
+        keys = pd.DataFrame({column: self._encode(column, df[column]) for column in self.KEY_COLUMNS})
+        keys["QTY"] = df["QTY"].to_numpy(dtype="int64")
+        keys["ROWS"] = 1
+        partial = keys.groupby(self.KEY_COLUMNS, sort=False, as_index=False).sum()
+        partial["FILES"] = 1
+
+        if self._keys_file is not None:
+            records = np.column_stack([partial[self.KEY_COLUMNS].to_numpy(dtype=np.int32),
+                                       np.full(len(partial), file_id, dtype=np.int32)])
+            records.tofile(self._keys_file)
+
+        self.rows += len(df)
+        self._pending.append(partial)
+        self._pending_rows += len(partial)
+        if self._pending_rows >= self.compact_rows:
+            self._compact()
+
+    def _compact(self):
+        frames = ([self._groups] if self._groups is not None else []) + self._pending
+        if frames:
+            self._groups = pd.concat(frames, ignore_index=True).groupby(self.KEY_COLUMNS, sort=False, as_index=False).sum()
+        self._pending = []
+        self._pending_rows = 0
+
+    def _decode(self, groups: pd.DataFrame) -> pd.DataFrame:
+        df = pd.DataFrame({
+            column: np.array(self._values[column], dtype=object)[groups[column].to_numpy()]
+            for column in self.KEY_COLUMNS
+        })
+        df["QTY"] = groups["QTY"].to_numpy()
+        return df
+
+    def _sources(self, duplicates: pd.DataFrame) -> pd.Series:
+        """Return the source files of each duplicated key, read back from the spilled (key, file) pairs."""
+        wanted = pd.MultiIndex.from_frame(duplicates[self.KEY_COLUMNS])
+        records = np.memmap(self._keys_path, dtype=np.int32, mode="r").reshape(-1, len(self.KEY_COLUMNS) + 1)
+        matches = []
+        for start in range(0, len(records), self.chunk_rows):
+            chunk = np.asarray(records[start:start + self.chunk_rows])
+            index = pd.MultiIndex.from_arrays([chunk[:, i] for i in range(len(self.KEY_COLUMNS))])
+            mask = index.isin(wanted)
+            if mask.any():
+                matches.append(pd.DataFrame(chunk[mask], columns=self.KEY_COLUMNS + ["FILE"]))
+        del records
+
+        pairs = pd.concat(matches, ignore_index=True)
+        files = pairs.groupby(self.KEY_COLUMNS, sort=False)["FILE"].agg(
+            lambda ids: "; ".join(self.sources[i] for i in ids)
+        )
+        return pd.MultiIndex.from_frame(duplicates[self.KEY_COLUMNS]).map(files)
+
+    def _write(self, groups: pd.DataFrame, duplicates: pd.DataFrame):
+        writers = [writer(self.save_path / f"{self.name}_consolidated{writer.extension}")
+                   for writer in get_writers(self.outputs)]
+        try:
+            for start in range(0, len(groups), self.chunk_rows):
+                chunk = self._decode(groups.iloc[start:start + self.chunk_rows])
+                for writer in writers:
+                    writer.append(chunk)
+            for writer in writers:
+                writer.close()
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        if len(duplicates):
+            report = self._decode(duplicates)
+            report["ROWS"] = duplicates["ROWS"].to_numpy()
+            report["FILES"] = duplicates["FILES"].to_numpy()
+            report["SOURCES"] = np.asarray(self._sources(duplicates), dtype=object)
+            XlsxWriter.write(report, self.save_path / f"{self.name}_duplicates.xlsx")
+
+    def close(self) -> Optional[ConsolidationSummary]:
+        """Write the consolidated aggregate and the duplicates report, if any row was appended."""
+        if not self.sources:
+            return None
+        if self._keys_file is not None:
+            self._keys_file.close()
+            self._keys_file = None
+
+        try:
+            self._compact()
+            groups = self._groups
+            duplicates = groups[groups["ROWS"] > 1]
+            if self.write_outputs:
+                self._write(groups, duplicates)
+        finally:
+            self._keys_path.unlink(missing_ok=True)
+
+        return ConsolidationSummary(rows=self.rows, keys=len(groups), duplicate_keys=len(duplicates),
+                                    duplicate_rows=int(duplicates["ROWS"].sum()))
+
+    def abort(self):
+        """Drop the spilled keys without writing anything."""
+        if self._keys_file is not None:
+            self._keys_file.close()
+            self._keys_file = None
+        self._keys_path.unlink(missing_ok=True)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the consolidated aggregate (REGION, MODEL, SIZE, COLOR, P, QTY) once closed."""
+        if self._groups is None:
+            return pd.DataFrame(columns=self.KEY_COLUMNS + ["QTY"])
+        return self._decode(self._groups)
+
+
+class LiveAggregate:
+    """
+    Aggregate of a watched release, kept in memory and updated file by file.
+
+    `update` replaces the rows of one file and `remove` drops them. The consolidated groups (QTY,
+    ROWS and FILES per REGION/MODEL/SIZE/COLOR/P key) are updated by subtracting the groups of the
+    previous version of the file and adding those of the new one, so a change costs the rows of
+    the changed file and the keys of the release, never a pass over the rows of every file. `write`
+    then rewrites the aggregates from memory, named and laid out as `AggregateSink` and
+    `ConsolidatedAggregate` write them. Unlike those, the rows of the release stay in memory.
+
+    Attributes:
+        save_path (Path): Folder where the aggregates are written.
+        outputs (list[str] | None): Formats of the aggregates, see `utils.writers.get_writers`.
+    """
+    KEY_COLUMNS = TEXT_COLUMNS
+
+    def __init__(self, save_path: str | Path, outputs: Optional[list[str]] = None):
+        self.save_path = Path(save_path)
+        self.outputs = outputs
+        # Source -> (region, rows) and source -> its groups, in the order the files were added
+        self._files: dict[Path, tuple[str, pd.DataFrame]] = {}
+        self._file_groups: dict[Path, pd.DataFrame] = {}
+        self._groups: Optional[pd.DataFrame] = None
+
+    def _groups_of(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Group the rows of a file by key, the key values as written in the TXT."""
+        keys = df[self.KEY_COLUMNS].astype(str)
+        keys["QTY"] = df["QTY"].to_numpy(dtype="int64")
+        keys["ROWS"] = 1
+        groups = keys.groupby(self.KEY_COLUMNS, sort=False).sum()
+        groups["FILES"] = 1
+        return groups
+
+    def _merge(self, parts: list[pd.DataFrame]):
+        frames = ([self._groups] if self._groups is not None else []) + parts
+        groups = pd.concat(frames).groupby(level=list(range(len(self.KEY_COLUMNS))), sort=False).sum()
+        # The keys left without rows belonged to the removed rows only
+        self._groups = groups[groups["ROWS"] > 0]
+
+    def update(self, source: str | Path, region: str, df: pd.DataFrame) -> FileSummary:
+        """Add the rows of a converted file, replacing those of its previous version, and return its summary."""
+        source = Path(source)
+        parts = [-self._file_groups[source]] if source in self._file_groups else []
+        groups = self._groups_of(df)
+        self._files[source] = (region, df)
+        self._file_groups[source] = groups
+        self._merge(parts + [groups])
+        return FileSummary(path=source, rows=len(df), total=int(df["QTY"].sum()))
+
+    def remove(self, source: str | Path) -> bool:
+        """Drop the rows of a file, returning whether it was in the aggregate."""
+        source = Path(source)
+        if source not in self._files:
+            return False
+        del self._files[source]
+        self._merge([-self._file_groups.pop(source)])
+        return True
+
+    @property
+    def summaries(self) -> list[FileSummary]:
+        return [FileSummary(path=source, rows=len(df), total=int(df["QTY"].sum()))
+                for source, (_, df) in self._ordered()]
+
+    def _ordered(self) -> list[tuple[Path, tuple[str, pd.DataFrame]]]:
+        # Region by region, as a download appends them; the files added later come last in their region
+        return sorted(self._files.items(), key=lambda item: item[1][0])
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the consolidated aggregate (REGION, MODEL, SIZE, COLOR, P, QTY)."""
+        if self._groups is None:
+            return pd.DataFrame(columns=self.KEY_COLUMNS + ["QTY"])
+        return self._groups.reset_index()[self.KEY_COLUMNS + ["QTY"]]
+
+    def write(self, name: str, consolidate: bool = False) -> Optional[ConsolidationSummary]:
+        """
+        Write the `{name}` aggregates and, with `consolidate`, `{name}_consolidated` and the
+        duplicates report. Return the summary of the consolidation, None when no file is left.
+        """
+        if not self._files:
+            return None
+
+        aggregate = AggregateSink(self.save_path, name, outputs=self.outputs)
+        try:
+            for source, (_, df) in self._ordered():
+                aggregate.append(df, source=source)
+            aggregate.close()
+        except BaseException:
+            aggregate.abort()
+            raise
+
+        groups = self._groups
+        duplicates = groups[groups["ROWS"] > 1]
+        if consolidate:
+            self._write_consolidated(name, duplicates)
+        return ConsolidationSummary(rows=sum(len(df) for _, df in self._files.values()), keys=len(groups),
+                                    duplicate_keys=len(duplicates), duplicate_rows=int(duplicates["ROWS"].sum()))
+
+    def _write_consolidated(self, name: str, duplicates: pd.DataFrame):
+        writers = [writer(self.save_path / f"{name}_consolidated{writer.extension}")
+                   for writer in get_writers(self.outputs)]
+        try:
+            consolidated = self.to_frame()
+            for writer in writers:
+                writer.append(consolidated)
+                writer.close()
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        if len(duplicates):
+            sources = {key: [] for key in duplicates.index}
+            for source, groups in self._file_groups.items():
+                for key in groups.index.intersection(duplicates.index):
+                    sources[key].append(source.name)
+            report = duplicates.reset_index()[self.KEY_COLUMNS + ["QTY", "ROWS", "FILES"]]
+            report["SOURCES"] = ["; ".join(sources[key]) for key in duplicates.index]
+            XlsxWriter.write(report, self.save_path / f"{name}_duplicates.xlsx")
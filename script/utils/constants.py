@@ -1,8 +1,13 @@
 import platform
+import getpass
 import os
 
 # Discovery OS
 OS = platform.system() # Darwin = Mac
-USER = os.getlogin()
+try:
+    USER = os.getlogin()
+except OSError:
+    # No controlling terminal (e.g. scheduled runs): fall back to the environment
+    USER = getpass.getuser()
 MAC_OS = 'Darwin'
 WINDOWS_OS = "Windows"
\ No newline at end of file
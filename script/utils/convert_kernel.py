@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ['REGION', 'MODEL', 'SIZE', 'COLOR', 'P', 'QTY']
+TEXT_COLUMNS = COLUMNS[:-1]
+TOTAL_BUDGET_THRESHOLD = 50000
+
+
+def round_half_up(values) -> np.ndarray:
+    """
+    Round an array of numbers to integers like `normal_round`, without a Python call per value.
+
+    The fractional part is computed as `values - floor(values)`, exactly as `normal_round` does,
+    so ties (x.5) always go up, also for negative numbers.
+
+    Parameters:
+    - values (array-like): The numbers to round.
+
+    Returns:
+    - np.ndarray: The rounded values as int64.
+
+    Example:
+    >>> round_half_up([3.2, 3.7, 3.5, -0.5, -2.5, -2.6]).tolist()
+    [3, 4, 4, 0, -2, -3]
+    """
+    values = np.asarray(values, dtype="float64")
+    if not np.isfinite(values).all():
+        raise ValueError("cannot convert float NaN or infinity to integer")
+
+    floor = np.floor(values)
+    return np.where(values - floor < 0.5, floor, np.ceil(values)).astype("int64")
+
+
+def round_qty(qty: pd.Series) -> pd.Series:
+    """Round a QTY series with `round_half_up`, keeping its index."""
+    return pd.Series(round_half_up(qty.to_numpy()), index=qty.index, name=qty.name)
+
+
+def normalize_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store the REGION/MODEL/SIZE/COLOR/P columns read as text as categoricals, since the same few
+    values repeat over the whole file, and normalize their values as written in the TXT: texts
+    stripped of the surrounding whitespace, numbers found among texts as text. Only the distinct
+    values (the categories) are normalized; the values equal once normalized (e.g. ' 52 ', '52'
+    and 52) become a single category. Columns parsed as numbers are left untouched, their text
+    output is already canonical.
+
+    Example:
+    >>> df = pd.DataFrame({column: ["A"] * 3 for column in TEXT_COLUMNS})
+    >>> df["SIZE"] = pd.Series([" 52 ", "52", 52], dtype=object)
+    >>> normalize_text_columns(df)["SIZE"].cat.categories.tolist()
+    ['52']
+    """
+    for column in TEXT_COLUMNS:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            continue
+        values = df[column].astype("category")
+        categories = values.cat.categories
+        normalized = categories.astype(str).str.strip()
+        if not normalized.equals(categories):
+            # Merge the categories equal once normalized, remapping the codes of the rows
+            mapping, merged = pd.factorize(normalized)
+            codes = values.cat.codes.to_numpy()
+            values = pd.Series(
+                pd.Categorical.from_codes(np.where(codes >= 0, mapping[codes], -1), categories=merged),
+                index=values.index, name=column
+            )
+        df[column] = values
+    return df
+
+
+def is_total_budget_high(total_budget: int) -> bool:
+    """Tell whether the total budget of a file is high enough to be checked manually."""
+    return total_budget > TOTAL_BUDGET_THRESHOLD
+
+
+def convert_budget_frame(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """
+    Turn the rows read from a budget file (columns A:F) into the converted DataFrame.
+
+    Drops the incomplete rows, names the columns, normalizes the text columns and rounds QTY
+    to integers, all column-wise.
+
+    Parameters:
+    - df (pd.DataFrame): The six columns read from the budget file.
+
+    Returns:
+    - The converted DataFrame
+    - The total budget of the file
+    """
+    df = df.dropna()
+    df.columns = COLUMNS
+    df = normalize_text_columns(df.copy())
+    df["QTY"] = round_qty(df["QTY"])
+    return df, int(df["QTY"].sum())
@@ -0,0 +1,64 @@
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Optional
+
+# Level written to the log file for each color used by the GUI
+COLOR_LEVELS = {'red': logging.ERROR, 'orange': logging.WARNING}
+
+
+class LogSink:
+    """
+    Thread-safe log shared by the GUI and the `log_func` callbacks of `utils.tools`.
+
+    Messages are buffered and handed over in batches by `drain`, so the GUI can insert them
+    on a timer instead of one by one, while the full log is streamed to a rotating file on disk.
+    An instance can be passed directly as `log_func`.
+
+    Attributes:
+        max_lines (int): Lines the GUI keeps in its text box, dropping the oldest ones.
+        log_file (Path | None): File where every message is written, rotated at `max_bytes`.
+    """
+    def __init__(self, log_file: Optional[str | Path] = None, max_lines: int = 5000,
+                 max_bytes: int = 5 * 2**20, backup_count: int = 5):
+        self.max_lines = max_lines
+        self.log_file = Path(log_file) if log_file else None
+        self._pending: deque[tuple[str, str]] = deque()
+        self._lock = threading.Lock()
+
+        self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        if self.log_file is not None:
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(self.log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+            self._logger.addHandler(handler)
+
+    def write(self, message: str, color: str = 'black'):
+        """Buffer a message for the GUI and write it to the log file."""
+        with self._lock:
+            self._pending.append((message, color))
+        self._logger.log(COLOR_LEVELS.get(color, logging.INFO), message)
+
+    def __call__(self, message: str):
+        self.write(message)
+
+    def drain(self) -> list[tuple[str, str]]:
+        """Return the (message, color) buffered since the last call."""
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        return batch
+
+    def clear(self):
+        """Forget the messages not drained yet; the log file is kept."""
+        with self._lock:
+            self._pending.clear()
+
+    def close(self):
+        for handler in list(self._logger.handlers):
+            handler.close()
+            self._logger.removeHandler(handler)
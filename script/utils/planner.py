@@ -0,0 +1,302 @@
+import re
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Callable, Optional
+
+from core.conversion_cache import ConversionCache
+from core.download_manifest import DownloadManifest, TagJournal
+from core.storage import LocalBackend, StorageBackend
+from core.tree_index import SharePointIndex
+
+
+@dataclass
+class PlannedFile:
+    """A workbook the download would find, with its cache status (see `ConversionCache.status`, or "convert" without cache)."""
+    region: str
+    path: Path
+    size: int
+    status: str
+
+    @property
+    def converted(self) -> bool:
+        # Touched files are counted as converted: only their content hash, not computed here, could tell
+        return self.status != "cached"
+
+
+@dataclass
+class PlannedRename:
+    """A rename the tag would do; `status` is "ok", "missing" (source gone), "done" (already tagged) or "conflict" (target exists)."""
+    region: str
+    source: Path
+    target: Path
+    status: str
+
+
+@dataclass
+class ReleasePlan:
+    """
+    What a download and a tag of a release would do, without doing it.
+
+    Attributes:
+        release (str): The release.
+        save_path (Path): Where the release is downloaded.
+        files (list[PlannedFile]): The files the download would convert or serve from the cache.
+        renames (list[PlannedRename]): The renames the tag would do, from the last download manifest.
+        anomalies (list[str]): Things worth checking before running, e.g. empty regions or large files.
+        download_seconds (float | None): Estimated duration of the download, None without history.
+        tag_seconds (float | None): Estimated duration of the tag, None without history.
+    """
+    release: str
+    save_path: Path
+    files: list[PlannedFile] = field(default_factory=list)
+    renames: list[PlannedRename] = field(default_factory=list)
+    anomalies: list[str] = field(default_factory=list)
+    download_seconds: Optional[float] = None
+    tag_seconds: Optional[float] = None
+
+
+@dataclass
+class Throughput:
+    """
+    Throughput of the earlier runs, read from the download manifests and tag journals of the releases.
+
+    Attributes:
+        downloads (int): Number of downloads the rates come from.
+        bytes_per_second (float | None): Workbook bytes converted per second.
+        cached_seconds (float | None): Seconds per file served from the conversion cache.
+        rename_seconds (float | None): Seconds per file renamed by the tag.
+    """
+    downloads: int = 0
+    bytes_per_second: Optional[float] = None
+    cached_seconds: Optional[float] = None
+    rename_seconds: Optional[float] = None
+
+    @classmethod
+    def from_history(cls, folders: set[Path], workers: int = 1) -> "Throughput":
+        """
+        Read the history of the `{year}/{release}` folders under `folders`; the downloads run with
+        `workers` processes are preferred, since the throughput grows with them.
+        """
+        timings, renamed, rename_seconds = [], 0, 0.0
+        for folder in folders:
+            for path in folder.glob(f"*/*/{DownloadManifest.FILE_NAME}"):
+                manifest = DownloadManifest.load(path.parent)
+                if manifest is not None and manifest.timing:
+                    timings.append(manifest.timing)
+            for path in folder.glob(f"*/*/{TagJournal.FILE_NAME}"):
+                for run in TagJournal(path.parent).read_runs().values():
+                    if run["seconds"] is not None and run["renamed"]:
+                        renamed += len(run["renamed"])
+                        rename_seconds += run["seconds"]
+
+        timings = [timing for timing in timings if timing.get("workers") == workers] or timings
+        converted_bytes = sum(timing.get("converted_bytes", 0) for timing in timings)
+        converted_seconds = sum(timing.get("converted_seconds", 0.0) for timing in timings)
+        cached_files = sum(timing.get("cached_files", 0) for timing in timings)
+        cached_seconds = sum(timing.get("cached_seconds", 0.0) for timing in timings)
+        return cls(
+            downloads=len(timings),
+            bytes_per_second=converted_bytes / converted_seconds if converted_bytes and converted_seconds else None,
+            cached_seconds=cached_seconds / cached_files if cached_files else None,
+            rename_seconds=rename_seconds / renamed if renamed else None,
+        )
+
+    def download_seconds(self, files: list[PlannedFile]) -> Optional[float]:
+        converted_bytes = sum(file.size for file in files if file.converted)
+        cached_files = sum(not file.converted for file in files)
+        if converted_bytes and self.bytes_per_second is None:
+            return None
+        # Until a download has served files from the cache, they are counted as free next to the conversions
+        return (converted_bytes / self.bytes_per_second if converted_bytes else 0.0) \
+            + cached_files * (self.cached_seconds or 0.0)
+
+    def tag_seconds(self, renames: list[PlannedRename]) -> Optional[float]:
+        count = sum(rename.status == "ok" for rename in renames)
+        if not count:
+            return 0.0
+        return count * self.rename_seconds if self.rename_seconds is not None else None
+
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "unknown (no earlier run to estimate from)"
+    if seconds < 1:
+        return "<1 s"
+    if seconds < 60:
+        return f"~{seconds:.0f} s"
+    return f"~{seconds / 60:.0f} min"
+
+
+def _plan_renames(plan: ReleasePlan,
+                  pattern: re.Pattern[str],
+                  search_path: Path,
+                  regions: list | tuple | set,
+                  tag: str,
+                  index: SharePointIndex,
+                  backend: StorageBackend):
+    """Plan the renames of `put_tag` from the manifest of the last download, as `put_tag` selects them."""
+    manifest = DownloadManifest.load(plan.save_path)
+    if manifest is None:
+        plan.anomalies.append("No download manifest yet: the tag has nothing to rename until the release is downloaded")
+        return
+
+    sources = set()
+    for entry in manifest.files:
+        source = PurePosixPath(entry["source"])
+        if entry["region"] not in regions or not pattern.match(source.name.upper()):
+            continue
+        source_path = search_path / source
+        target_path = source_path.with_name(f"{tag}_{source.name}")
+        sources.add(source_path)
+        if not backend.exists(source_path):
+            status = "done" if backend.exists(target_path) else "missing"
+        elif backend.exists(target_path):
+            status = "conflict"
+        else:
+            status = "ok"
+        plan.renames.append(PlannedRename(entry["region"], source_path, target_path, status))
+
+    for status, message in [("missing", "downloaded files no longer on SharePoint"),
+                            ("conflict", "files whose tagged name already exists")]:
+        names = [rename.source.name for rename in plan.renames if rename.status == status]
+        if names:
+            plan.anomalies.append(f"{len(names)} {message}: {', '.join(names)}")
+
+    # Files landed or edited after the download would not be tagged, or would be tagged without being uploaded
+    created = datetime.fromisoformat(manifest.created).timestamp() if manifest.created else None
+    new, edited = [], []
+    for region in index.get_regions():
+        for file in index.get_files(region, plan.release):
+            if file.path not in sources:
+                new.append(file.name)
+            elif created is not None and file.mtime > created:
+                edited.append(file.name)
+    if new:
+        plan.anomalies.append(f"{len(new)} files not in the last download, the tag will skip them: {', '.join(new)}")
+    if edited:
+        plan.anomalies.append(f"{len(edited)} files changed after the last download, download again before tagging: "
+                              f"{', '.join(edited)}")
+
+
+def plan_releases(releases: list[str],
+                  pattern: str | re.Pattern[str],
+                  search_path: str | Path,
+                  regions: list | tuple | set,
+                  budget_definition_folder: str,
+                  save_paths: dict[str, str | Path],
+                  tag: str = 'UPLOADED',
+                  log_func: Optional[Callable[[str], None]] = None,
+                  workers: Optional[int] = None,
+                  index: Optional[SharePointIndex] = None,
+                  cache: bool = True,
+                  large_factor: float = 5.0,
+                  backend: Optional[StorageBackend] = None,
+                  release_pattern: Optional[str | re.Pattern[str]] = None) -> dict[str, ReleasePlan]:
+    """
+    Preview what `find_and_convert_releases` and `put_tag` would do for the releases, without doing it.
+
+    The tree is scanned as the download scans it and the files are checked against the conversion
+    cache by size and mtime only; the renames come from the download manifest, as for `put_tag`. No
+    workbook is opened, so the plan takes about as long as the scan. The durations are estimated
+    from the timings recorded in the manifests and tag journals of the earlier runs (in the
+    `{year}/{release}` folders next to the save paths).
+
+    Parameters:
+    - large_factor (float): Files larger than this many times the median file are reported.
+    - The other parameters are those of `find_and_convert_releases` and `put_tag`.
+
+    Return:
+    - The plan of each release
+    """
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
+
+    search_path = Path(search_path)
+    if backend is None:
+        backend = LocalBackend(search_path)
+
+    started = time.perf_counter()
+    if index is None:
+        index = SharePointIndex(search_path, regions, budget_definition_folder, file_pattern=pattern,
+                                release_pattern=release_pattern, releases=releases, backend=backend)
+    # The files are listed lazily: list them now, so that the scan is timed as the download runs it
+    for region in index.get_regions():
+        for release in releases:
+            index.get_files(region, release)
+    scan_seconds = time.perf_counter() - started
+
+    throughput = Throughput.from_history({Path(save_path).parent.parent for save_path in save_paths.values()},
+                                         workers=workers or 1)
+
+    plans = {}
+    for release in releases:
+        plan = ReleasePlan(release, Path(save_paths[release]))
+        conversion_cache = ConversionCache(plan.save_path, pattern) if cache else None
+        for region in index.get_regions():
+            files = index.get_files(region, release)
+            if not index.get_release_dirs(region, release):
+                plan.anomalies.append(f"Region {region}: no '{release}' folder")
+            elif not files:
+                plan.anomalies.append(f"Region {region}: no files to download")
+            for file in files:
+                status = conversion_cache.status(file.path, file.size, file.mtime) if conversion_cache else "convert"
+                plan.files.append(PlannedFile(region, file.path, file.size, status))
+        if not index.get_regions():
+            plan.anomalies.append("None of the regions was found on SharePoint")
+
+        _plan_renames(plan, pattern, search_path, regions, tag, index, backend)
+        plans[release] = plan
+
+    # Large files stand out against the median of every planned file
+    sizes = [file.size for plan in plans.values() for file in plan.files]
+    if len(sizes) > 1:
+        median = statistics.median(sizes)
+        for plan in plans.values():
+            for file in plan.files:
+                if median and file.size > large_factor * median:
+                    plan.anomalies.append(f"{file.region}/{file.path.name}: {format_size(file.size)}, "
+                                          f"{file.size / median:.0f}x the median file")
+
+    for plan in plans.values():
+        download_seconds = throughput.download_seconds(plan.files)
+        plan.download_seconds = download_seconds + scan_seconds / len(plans) if download_seconds is not None else None
+        plan.tag_seconds = throughput.tag_seconds(plan.renames)
+
+        log(f"\nPlan for release: {plan.release}")
+        for region in index.get_regions():
+            files = [file for file in plan.files if file.region == region]
+            converted = sum(file.converted for file in files)
+            log(f"Region {region}: {len(files)} files, {format_size(sum(file.size for file in files))} "
+                f"({converted} to convert, {len(files) - converted} cached)")
+            for file in files:
+                log(f"\t{file.path.name}  {format_size(file.size)}  {file.status}")
+        renames = [rename for rename in plan.renames if rename.status == "ok"]
+        log(f"Tag: {len(renames)} files to rename")
+        for rename in renames:
+            log(f"\t{rename.region}/{rename.source.name} -> {rename.target.name}")
+        log(f"Estimated download: {format_seconds(plan.download_seconds)}, tag: {format_seconds(plan.tag_seconds)}")
+        if plan.anomalies:
+            log("To check:")
+            for anomaly in plan.anomalies:
+                log(f"\t{anomaly}")
+        log('-------------------------------')
+
+    log(f"Scan: {scan_seconds:.2f} s, estimates from {throughput.downloads} earlier downloads")
+    return plans
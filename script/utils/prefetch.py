@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from utils.profiling import NULL_PROFILER, NullProfiler, Profiler
+
+
+class StagingPrefetcher:
+    """
+    Copy files into a local staging folder on a bounded thread pool, a few files ahead of the consumer.
+
+    On the OneDrive folder the first read of a workbook blocks while it is downloaded: staging the
+    next files while the current one is parsed overlaps the network I/O with the parsing. Iterating
+    yields (source, path) in the order of `files`, where `path` is the staged copy, or the OSError
+    of the last attempt when the source could not be copied (the consumer reports it as the error
+    of that file). Copies failing with an OSError (e.g. a file locked by the sync client) are
+    retried with exponential backoff. Each staged copy is kept in its own subfolder, so it keeps the name of
+    its source. The staging folder is removed by `close`.
+
+    Attributes:
+        files (list[Path]): The files to stage, in consumption order.
+        ahead (int): How many files are staged ahead of the consumer, i.e. the copies in flight.
+        staging_dir (Path): The staging folder, created in `staging_root` (default: the temp folder).
+        retries (int): Attempts after the first failed copy of a file.
+        backoff (float): Seconds waited after the first failure, doubled at each retry.
+        copy_func (Callable[[Path, Path], object]): Copies a source to its staging path.
+    """
+    def __init__(self,
+                 files: list[str | Path],
+                 ahead: int = 4,
+                 staging_root: Optional[str | Path] = None,
+                 retries: int = 4,
+                 backoff: float = 0.5,
+                 copy_func: Callable[[Path, Path], object] = shutil.copyfile,
+                 profiler: Profiler | NullProfiler = NULL_PROFILER):
+        self.files = [Path(file) for file in files]
+        self.ahead = max(1, ahead)
+        self.staging_dir = Path(tempfile.mkdtemp(prefix="download_bgt_staging_", dir=staging_root))
+        self.retries = retries
+        self.backoff = backoff
+        self.copy_func = copy_func
+        self.profiler = profiler
+
+    def _stage(self, position: int, source: Path) -> Path:
+        target = self.staging_dir / f"{position:05d}" / source.name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        for attempt in range(self.retries + 1):
+            try:
+                with self.profiler.span("fetch", source):
+                    self.copy_func(source, target)
+                return target
+            except FileNotFoundError:
+                raise
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+        return target
+
+    def __iter__(self) -> Iterator[tuple[Path, Path | OSError]]:
+        files = iter(enumerate(self.files))
+        pending: deque[tuple[Path, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.ahead) as executor:
+            def submit_next():
+                for position, source in files:
+                    pending.append((source, executor.submit(self._stage, position, source)))
+                    return
+
+            for _ in range(self.ahead):
+                submit_next()
+            while pending:
+                source, future = pending.popleft()
+                submit_next()
+                try:
+                    path = future.result()
+                except OSError as e:
+                    path = e
+                yield source, path
+
+    def release(self, path: str | Path):
+        """Delete a staged copy once it has been consumed; sources are never touched."""
+        path = Path(path)
+        if path.parent.parent != self.staging_dir:
+            return
+        shutil.rmtree(path.parent, ignore_errors=True)
+
+    def close(self):
+        """Remove the staging folder and whatever is left in it."""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def __enter__(self) -> "StagingPrefetcher":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,177 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+# Stages timed by `utils.tools`, in pipeline order
+STAGES = ["scan", "fetch", "read", "convert", "write_txt", "write_xlsx", "write_parquet", "write_feather", "aggregate", "delta", "rename"]
+
+# Profiling modes, from config.yaml or the command line
+PROFILE_MODES = ["timing", "cprofile", "tracemalloc"]
+
+
+class NullProfiler:
+    """
+    Profiler used when profiling is off: every span is the same no-op context manager, so the
+    instrumented code pays one attribute lookup and an empty `with` per span.
+    """
+    enabled = False
+    _span = nullcontext()
+
+    def span(self, stage: str, file: Optional[str | Path] = None):
+        return self._span
+
+    def add(self, stage: str, seconds: float, file: Optional[str | Path] = None):
+        pass
+
+    def merge(self, records: list[tuple[str, Optional[str], float]]):
+        pass
+
+    def start(self):
+        pass
+
+    def report(self, log: Callable[[str], None], json_path: Optional[str | Path] = None):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """
+    Collect the duration of named spans (see `STAGES`), per file and per stage.
+
+    Spans can be opened from several threads; the spans measured in a worker process are
+    collected there by another `Profiler` and merged back with `merge`. With mode "cprofile"
+    or "tracemalloc" the calling thread is also profiled, respectively memory traced, between
+    `start` and `report`.
+
+    Attributes:
+        mode (str): One of `PROFILE_MODES`.
+        records (list[tuple[str, str | None, float]]): The (stage, file, seconds) of every span.
+    """
+    enabled = True
+
+    def __init__(self, mode: str = "timing"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.records: list[tuple[str, Optional[str], float]] = []
+        self._lock = threading.Lock()
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage: str, file: Optional[str | Path] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, file)
+
+    def add(self, stage: str, seconds: float, file: Optional[str | Path] = None):
+        with self._lock:
+            self.records.append((stage, str(file) if file is not None else None, seconds))
+
+    def merge(self, records: list[tuple[str, Optional[str], float]]):
+        with self._lock:
+            self.records.extend(records)
+
+    def start(self):
+        """Start the run: reset the wall clock and start the cProfile/tracemalloc capture of the mode."""
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def summary(self) -> dict:
+        """
+        Return the durations as a JSON-serializable dict: per stage the number of spans, the total,
+        mean and max seconds and the slowest file, and per file the seconds spent in each stage.
+        """
+        stages: dict[str, dict] = {}
+        files: dict[str, dict[str, float]] = {}
+        for stage, file, seconds in self.records:
+            summary = stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0, "slowest": None})
+            summary["count"] += 1
+            summary["total"] += seconds
+            if seconds >= summary["max"]:
+                summary["max"], summary["slowest"] = seconds, file
+            if file is not None:
+                files.setdefault(file, {}).setdefault(stage, 0.0)
+                files[file][stage] += seconds
+
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        stages = {stage: stages[stage] for stage in sorted(stages, key=lambda stage: order.get(stage, len(order)))}
+        for summary in stages.values():
+            summary["mean"] = summary["total"] / summary["count"]
+        return {"mode": self.mode, "wall": time.perf_counter() - self._started, "stages": stages, "files": files}
+
+    def format_table(self, summary: dict) -> list[str]:
+        lines = [f"{'stage':<11}{'spans':>6}{'total s':>10}{'mean s':>10}{'max s':>10}  slowest"]
+        for stage, values in summary["stages"].items():
+            slowest = Path(values["slowest"]).name if values["slowest"] else ""
+            lines.append(f"{stage:<11}{values['count']:>6}{values['total']:>10.3f}"
+                         f"{values['mean']:>10.4f}{values['max']:>10.3f}  {slowest}")
+        lines.append(f"{'wall':<11}{'':>6}{summary['wall']:>10.3f}")
+        return lines
+
+    def report(self, log: Callable[[str], None], json_path: Optional[str | Path] = None):
+        """
+        Stop the capture, log the summary table (and the top functions or allocations of the
+        capture) and write the summary as JSON to `json_path`, with the cProfile stats next to it.
+        """
+        summary = self.summary()
+        log("\nTimings:")
+        for line in self.format_table(summary):
+            log(line)
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(15)
+            log(stream.getvalue())
+            if json_path is not None:
+                stats.dump_stats(Path(json_path).with_suffix(".prof"))
+            self._cprofile = None
+        elif self.mode == "tracemalloc" and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary["peak_mib"] = peak / 2**20
+            log(f"Peak traced memory: {peak / 2**20:.1f} MiB")
+            for statistic in snapshot.statistics("lineno")[:10]:
+                log(f"\t{statistic}")
+
+        if json_path is not None:
+            json_path = Path(json_path)
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            json_path.write_text(json.dumps(summary, indent=1))
+            log(f"Timings saved in {json_path}")
+
+
+def make_profiler(mode: Optional[str | bool]) -> Profiler | NullProfiler:
+    """
+    Return a started `Profiler` for `mode`, or the `NULL_PROFILER` when `mode` is None or false.
+    `True` (e.g. `profile: true` in the config) stands for "timing".
+    """
+    if not mode:
+        return NULL_PROFILER
+    profiler = Profiler("timing" if mode is True else mode)
+    profiler.start()
+    return profiler
+
+
+def profile_path(save_path: str | Path, process_name: str) -> Path:
+    """Return the path of the JSON timings of a run, in the release folder."""
+    return Path(save_path) / f"{datetime.now():%Y_%m_%d_%H%M%S}_{process_name}_profile.json"
@@ -0,0 +1,36 @@
+import os
+import sys
+from pathlib import Path
+
+
+def get_resource_path(relative_path):
+    """Ottieni il percorso assoluto del file, tenendo conto dell'esecuzione tramite PyInstaller."""
+    base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
+    return os.path.join(base_path, relative_path)
+
+
+def get_base_path() -> Path:
+    """
+    Return the folder containing the `{year}/{release}` download folders, i.e. the folder
+    containing the project (or the one containing the PyInstaller build).
+    """
+    if getattr(sys, 'frozen', False):
+        return Path(__file__).parents[6]
+    else:
+        return Path(__file__).parents[3]
+
+
+def get_save_path(release: str, base_path: str | Path | None = None) -> Path:
+    """Return the folder where the files of a release are downloaded, under `base_path` if given."""
+    year = release[-4:]  # Extract the year from the release name
+    return Path(base_path or get_base_path()) / year / release
+
+
+def get_log_path() -> Path:
+    """Return the path of the rotating log file, next to the release folders."""
+    return get_base_path() / "logs" / "download_bgt.log"
+
+
+def get_release_cache_path() -> Path:
+    """Return the path of the cache of the releases available on SharePoint."""
+    return get_base_path() / "cache" / "releases.json"
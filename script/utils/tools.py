@@ -1,22 +1,31 @@
 
 import pandas as pd
-from pathlib import Path   
+from pathlib import Path, PurePosixPath
 import re
 import math
 from typing import Callable, Optional
 from datetime import datetime
-import openpyxl
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
 
-import sys
-import os
+import threading
+import shutil
+import time
 
+from core.storage import LocalBackend, StorageBackend
+from core.tree_index import SharePointIndex
+from core.tree_watcher import TreeWatcher
+from core.conversion_cache import ConversionCache, file_hash
+from core.download_manifest import DownloadManifest, TagJournal
+from core.aggregate_snapshot import AggregateSnapshot
+from utils.xlsx_reader import read_budget_workbook
+from utils.aggregate import AggregateSink, ConsolidatedAggregate, LiveAggregate
+from utils.convert_kernel import convert_budget_frame, normalize_text_columns, round_qty, is_total_budget_high
+from utils.profiling import NULL_PROFILER, Profiler, NullProfiler, make_profiler, profile_path
+from utils.prefetch import StagingPrefetcher
+from utils.writers import TxtWriter, get_writers
 
 
-def get_resource_path(relative_path):
-    """Ottieni il percorso assoluto del file, tenendo conto dell'esecuzione tramite PyInstaller."""
-    base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
-    return os.path.join(base_path, relative_path)
-
 
 def choose_release(available_release: list) -> str:
     print("Available releases:")
@@ -65,18 +74,48 @@ def normal_round(n):
 
 
 
-def convert_file(file_path: str | Path, save_path: str | Path, log_func: Optional[Callable[[str], None]] = None) -> pd.DataFrame | str | Path :
+def _log_total_budget(total_budget: int, log: Callable[[str], None]):
+    """Log the total budget of a file, warning when it is suspiciously high."""
+    if is_total_budget_high(total_budget):
+        log(f"\tWARNING: Total Budget for the file: {total_budget}. The total is pretty high, check the file manually.")
+    else:
+        log(f"\tTotal Budget for the file: {total_budget}")
+    log('\t----------\n')
+
+
+def convert_file(file_path: str | Path, 
+                 save_path: str | Path, 
+                 log_func: Optional[Callable[[str], None]] = None,
+                 reader: str = "pandas",
+                 profiler: Optional[Profiler | NullProfiler] = None,
+                 outputs: Optional[list[str]] = None,
+                 source_path: Optional[str | Path] = None) -> pd.DataFrame | str | Path :
     """
-    Convert an Excel file to the desired format, saving both .txt and .xlsx versions.
+    Convert an Excel file to the desired format, saving it as .txt and in the other `outputs` formats
+    (by default .xlsx).
 
     Parameters:
     - file_path (str | Path): The path of the Excel file to convert. Do specify the name of the file like 'C:/User/.../file.xlsx'
     - save_path (str | Path): The path where to save the converted file. Do not specify the name of the file like 'C:/User/.../folder/'
+    - reader (str): "pandas" to load the whole sheet with `pd.read_excel`, "streaming" to read it 
+      row by row with `read_budget_workbook`, which stops at the trailing empty rows of formatted 
+      templates and keeps only compact codes of the rows while reading, so its peak memory stays
+      close to the size of the converted DataFrame.
+    - profiler (Optional[Profiler]): Times the read, convert and write_{format} spans of the file.
+      With the streaming reader the QTY is rounded while reading, so it is part of the read span.
+    - outputs (Optional[list[str]]): The output formats, see `utils.writers.get_writers`. Each output is
+      written to a temporary file, then renamed.
+    - source_path (Optional[str | Path]): The SharePoint file when `file_path` is a staged copy of it: the 
+      outputs are named after it and the errors and timings report it. By default `file_path`.
     
     Return:
     - Dataframe of the converted file
-    - str or Path if the process encounters an error
+    - str or Path (`source_path`) if the process encounters an error
     """
+    if profiler is None:
+        profiler = NULL_PROFILER
+    if source_path is None:
+        source_path = file_path
     
     def log(message):
         if log_func:
@@ -86,58 +125,253 @@ def convert_file(file_path: str | Path, save_path: str | Path, log_func: Optiona
 
     try:
         # Extract file name for saving (same as SharePoint file name)
-        file_name = Path(file_path).stem
-
-        # Load Excel file with specified columns and data types
-        df = pd.read_excel(
-            file_path,
-            usecols="A:F",
-            dtype={"A": "str", "B": "str", "C": "str", "D": "str", "E": "str", "F": "float"},
-            engine="openpyxl"
-        )
-
-        # Clean and prepare data
-        df = df.dropna()
-        df.columns = ['REGION', 'MODEL', 'SIZE', 'COLOR', 'P', 'QTY']
-
-        # Convert 'QTY' column to integers, rounding if needed
-        df["QTY"] = df["QTY"].apply(lambda x: int(normal_round(x)))
+        file_name = Path(source_path).stem
+
+        if reader == "streaming":
+            # Stream the rows, rounding 'QTY' and summing the total budget chunk by chunk
+            with profiler.span("read", source_path):
+                df, total_budget = read_budget_workbook(file_path, round_func=round_qty)
+            with profiler.span("convert", source_path):
+                df = normalize_text_columns(df)
+        else:
+            # Load Excel file with specified columns and data types
+            with profiler.span("read", source_path):
+                df = pd.read_excel(
+                    file_path,
+                    usecols="A:F",
+                    dtype={"A": "str", "B": "str", "C": "str", "D": "str", "E": "str", "F": "float"},
+                    engine="openpyxl"
+                )
+
+            # Clean and prepare data, rounding 'QTY' to integers
+            with profiler.span("convert", source_path):
+                df, total_budget = convert_budget_frame(df)
         
         # Output total budget for verification
-        total_budget = int(df["QTY"].sum())
-        if total_budget > 50000:
-            log(f"\tWARNING: Total Budget for the file: {total_budget}. The total is pretty high, check the file manually.")
-        else:
-            log(f"\tTotal Budget for the file: {total_budget}")
-        log('\t----------\n')
+        _log_total_budget(total_budget, log)
 
         # Define the save path and ensure directories exist
         save_path = Path(save_path)
         save_path.mkdir(parents=True, exist_ok=True)
 
-        # Save as .txt and .xlsx with standardized naming
-        df.to_csv(save_path / f"{file_name}.txt", header=False, index=False, sep='\t', mode='w')
-        df.to_excel(save_path / f"{file_name}.xlsx", index=False)
+        # Save as .txt (and .xlsx, ...) with standardized naming
+        for writer in get_writers(outputs):
+            with profiler.span(f"write_{writer.name}", source_path):
+                writer.write(df, save_path / f"{file_name}{writer.extension}")
         
         return df
 
     except Exception as e:
-        log(f"\tError processing file '{file_path}': {e}")
+        log(f"\tError processing file '{source_path}': {e}")
         log(f"\tPlease, check the file manually\n")
         
-        return file_path   
+        return source_path   
     
     
             
         
 
+def _cached_frame(entry: dict) -> pd.DataFrame:
+    """Return the converted DataFrame stored in a `ConversionCache` entry."""
+    df = pd.DataFrame(entry["rows"], columns=['REGION', 'MODEL', 'SIZE', 'COLOR', 'P', 'QTY'])
+    df["QTY"] = df["QTY"].astype("int64")
+    return df
+
+
+def convert_cached(entry: dict, 
+                   file_path: str | Path, 
+                   save_path: str | Path, 
+                   log_func: Optional[Callable[[str], None]] = None,
+                   profiler: Optional[Profiler | NullProfiler] = None,
+                   outputs: Optional[list[str]] = None) -> pd.DataFrame:
+    """
+    Rebuild the converted DataFrame of an unchanged file from its conversion cache entry.
+
+    The .txt and .xlsx outputs are regenerated only when missing; existing ones are just touched,
+    so they still count among the newest downloads when tagging.
+
+    Parameters:
+    - entry (dict): The `ConversionCache` entry of the file.
+    - file_path (str | Path): The path of the original Excel file.
+    - save_path (str | Path): The path where the converted file is saved.
+    - profiler (Optional[Profiler]): Times the rebuild of the DataFrame (convert span) and the writes.
+    - outputs (Optional[list[str]]): The output formats, see `utils.writers.get_writers`.
+    
+    Return:
+    - Dataframe of the converted file
+    """
+    
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
+
+    if profiler is None:
+        profiler = NULL_PROFILER
+
+    with profiler.span("convert", file_path):
+        df = _cached_frame(entry)
+    log("\tUnchanged since the last download, using the cached conversion")
+    _log_total_budget(entry["total"], log)
+
+    file_name = Path(file_path).stem
+    save_path = Path(save_path)
+    writers = get_writers(outputs)
+    paths = [save_path / f"{file_name}{writer.extension}" for writer in writers]
+    if all(path.exists() for path in paths):
+        for path in paths:
+            path.touch()
+    else:
+        save_path.mkdir(parents=True, exist_ok=True)
+        for writer, path in zip(writers, paths):
+            with profiler.span(f"write_{writer.name}", file_path):
+                writer.write(df, path)
+
+    return df
+
+
+def _convert_worker(file_path: str | Path, 
+                    save_path: str | Path, 
+                    reader: str = "pandas",
+                    profile: bool = False,
+                    outputs: Optional[list[str]] = None,
+                    source_path: Optional[str | Path] = None,
+                    hash_file: bool = False) -> tuple[pd.DataFrame | str | Path, list[str], list[tuple], Optional[str]]:
+    """
+    Run `convert_file` inside a worker process.
+
+    Log messages cannot be streamed back from another process, so they are collected
+    and returned together with the result to be replayed by the parent in order; so are
+    the spans timed with `profile`. With `hash_file` the SHA-256 of a converted file is
+    returned too, hashed here rather than by the parent.
+    """
+    messages = []
+    profiler = Profiler() if profile else NULL_PROFILER
+    result = convert_file(file_path=file_path, save_path=save_path, log_func=messages.append, reader=reader, 
+                          profiler=profiler, outputs=outputs, source_path=source_path)
+    content_hash = None
+    if hash_file and isinstance(result, pd.DataFrame):
+        with profiler.span("hash", source_path or file_path):
+            content_hash = file_hash(file_path)
+    return result, messages, profiler.records if profile else [], content_hash
+
+
+def _convert_all(jobs: list[tuple[Path, Path]], 
+                 workers: Optional[int] = None,
+                 log_func: Optional[Callable[[str], None]] = None,
+                 reader: str = "pandas",
+                 profiler: Profiler | NullProfiler = NULL_PROFILER,
+                 prefetch: Optional[int] = None,
+                 outputs: Optional[list[str]] = None,
+                 copy_func: Optional[Callable[[Path, Path], object]] = None,
+                 hash_files: bool = False):
+    """
+    Convert every (file, save_path) job, yielding the results in the same order as `jobs`,
+    each with the SHA-256 of the converted file when `hash_files` is set (None otherwise).
+
+    With `workers` greater than 1 the files are parsed in a process pool and the log
+    messages of each file are replayed in submission order, so the log reads exactly
+    as in the serial run. With `prefetch` the files are first copied to a local staging
+    folder by a `StagingPrefetcher` (with `copy_func`, e.g. `StorageBackend.download`), that many
+    files ahead of the conversion; the staged copy is only read, the outputs, errors and timings
+    refer to the original file, and a file that could not be staged is reported as an error. The hash is computed by the worker from the file it has just read,
+    so the original is not read again by the parent.
+    """
+    
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
+
+    prefetcher = None
+    if prefetch and jobs:
+        prefetcher = StagingPrefetcher([file for file, _ in jobs], ahead=prefetch, copy_func=copy_func or shutil.copyfile,
+                                       profiler=profiler)
+    staged = iter(prefetcher) if prefetcher is not None else ((file, file) for file, _ in jobs)
+    save_paths = (save_path for _, save_path in jobs)
+
+    def finish(source: Path, path: Path | OSError, result: pd.DataFrame | str | Path,
+               content_hash: Optional[str]) -> tuple[pd.DataFrame | Path, Optional[str]]:
+        if prefetcher is not None and not isinstance(path, OSError):
+            prefetcher.release(path)
+        return (result, content_hash) if isinstance(result, pd.DataFrame) else (source, None)
+
+    def staging_failed(source: Path, error: OSError) -> Future:
+        # Completed as a worker would for a file it could not read
+        future = Future()
+        future.set_result((source, [f"\tError staging file '{source}': {error}", "\tPlease, check the file manually\n"],
+                           [], None))
+        return future
+
+    def collect(source: Path, path: Path | OSError, future) -> tuple[pd.DataFrame | Path, Optional[str]]:
+        result, messages, records, content_hash = future.result()
+        for message in messages:
+            log(message)
+        profiler.merge(records)
+        return finish(source, path, result, content_hash)
+
+    executor = None
+    try:
+        if not workers or workers <= 1 or len(jobs) <= 1:
+            for (source, path), save_path in zip(staged, save_paths):
+                if isinstance(path, OSError):
+                    yield collect(source, path, staging_failed(source, path))
+                    continue
+                result = convert_file(file_path=path, save_path=save_path, log_func=log_func, reader=reader, 
+                                      profiler=profiler, outputs=outputs, source_path=source)
+                content_hash = None
+                if hash_files and isinstance(result, pd.DataFrame):
+                    with profiler.span("hash", source):
+                        content_hash = file_hash(path)
+                yield finish(source, path, result, content_hash)
+            return
+
+        # At most two files per process are submitted ahead, so that staged copies do not pile up
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        pending = deque()
+        for (source, path), save_path in zip(staged, save_paths):
+            if isinstance(path, OSError):
+                pending.append((source, path, staging_failed(source, path)))
+            else:
+                pending.append((source, path, executor.submit(_convert_worker, path, save_path, reader,
+                                                                 profiler.enabled, outputs, source, hash_files)))
+            while len(pending) >= 2 * workers or (pending and pending[0][2].done()):
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
+    finally:
+        if executor is not None:
+            # If the caller stops early (e.g. cancelled), the files not started yet are dropped
+            executor.shutdown(wait=True, cancel_futures=True)
+        if prefetcher is not None:
+            staged.close()
+            prefetcher.close()
+
+
 def find_and_convert_files(release: str, 
                            pattern: str | re.Pattern[str], 
                            search_path: str | Path, 
                            regions: list | tuple | set, 
                            budget_definition_folder: str,
                            save_path: str | Path,
-                           log_func: Optional[Callable[[str], None]] = None) -> None:
+                           log_func: Optional[Callable[[str], None]] = None,
+                           workers: Optional[int] = None,
+                           index: Optional[SharePointIndex] = None,
+                           cache: bool = False,
+                           reader: str = "pandas",
+                           keep_dataframes: bool = False,
+                           progress_func: Optional[Callable[[int, int], None]] = None,
+                           cancel_event: Optional[threading.Event] = None,
+                           profile: Optional[str] = None,
+                           prefetch: Optional[int] = None,
+                           outputs: Optional[list[str]] = None,
+                           aggregate_outputs: Optional[list[str]] = None,
+                           consolidate: bool = False,
+                           delta: bool = False,
+                           backend: Optional[StorageBackend] = None,
+                           release_pattern: Optional[str | re.Pattern[str]] = None) -> tuple[list, list]:
     """
     Find all files matching a pattern in subdirectories of a given path.
     Convert the files to the desired format and save them in designated folders.
@@ -147,13 +381,89 @@ def find_and_convert_files(release: str,
     - pattern (str | re.Pattern): The pattern to match file names against.
     - search_path (str | Path): The path in which to search for files.
     - log_func (Optional[Callable[[str], None]]): A function to handle log messages.
+    - workers (Optional[int]): Number of processes used to convert the files. 
+      None or 1 keeps the conversion serial.
+    - index (Optional[SharePointIndex]): Index of the SharePoint tree to query instead of scanning it again.
+    - cache (bool): Serve unchanged files from the `ConversionCache` stored in `save_path` instead of parsing them again.
+    - reader (str): The workbook reader used by `convert_file`, "pandas" or "streaming".
+    - keep_dataframes (bool): Return the DataFrames of the converted files instead of their summaries.
+      The rows are streamed to the aggregate anyway, this only keeps them in memory too.
+    - progress_func (Optional[Callable[[int, int], None]]): Called with the number of processed files and the total.
+    - cancel_event (Optional[threading.Event]): When set, the process stops before the next file.
+    - profile (Optional[str]): Time the stages of the run ("timing", or "cprofile"/"tracemalloc" to
+      capture the main process too) and log a summary table at the end, also saved as JSON in `save_path`.
+    - prefetch (Optional[int]): Copy the files to convert to a local staging folder, this many files ahead of
+      the conversion, so that the OneDrive downloads overlap with the parsing. None or 0 reads them in place.
+    - outputs (Optional[list[str]]): Formats of the per-file outputs, "txt" (always written), "xlsx", "parquet"
+      or "feather". Default: txt and xlsx.
+    - aggregate_outputs (Optional[list[str]]): Formats of the aggregate, same choices and default.
+    - consolidate (bool): Also write the consolidated aggregate, one row per REGION/MODEL/SIZE/COLOR/P 
+      with the QTY summed, and the report of the keys found in more than one row (see `ConsolidatedAggregate`).
+    - delta (bool): Also write the rows of the consolidated aggregate added, changed and removed since the 
+      last upload, diffed against the `AggregateSnapshot` of `save_path`, which `put_tag` updates.
+    - backend (Optional[StorageBackend]): Lists and reads the SharePoint files, by default in the local folder
+      `search_path`. The files of a remote backend are always staged locally, see `prefetch`.
+    - release_pattern (Optional[str | re.Pattern]): The pattern of the release folders (`pattern release` of the
+      config). The scan skips the release folders matching it that are not requested, instead of walking them.
     
     Return:
-    - None
+    - The `FileSummary` (or the DataFrame, with `keep_dataframes`) of each converted file
+    - The paths of the files that could not be converted
+    """
+    results = find_and_convert_releases(
+        [release], pattern, search_path, regions, budget_definition_folder, {release: save_path},
+        log_func=log_func, workers=workers, index=index, cache=cache, reader=reader, keep_dataframes=keep_dataframes,
+        progress_func=progress_func, cancel_event=cancel_event, profile=profile, prefetch=prefetch,
+        outputs=outputs, aggregate_outputs=aggregate_outputs, consolidate=consolidate,
+        delta=delta, backend=backend, release_pattern=release_pattern
+    )
+    return results.get(release, ([], []))
+
+
+def find_and_convert_releases(releases: list[str], 
+                              pattern: str | re.Pattern[str], 
+                              search_path: str | Path, 
+                              regions: list | tuple | set, 
+                              budget_definition_folder: str,
+                              save_paths: dict[str, str | Path],
+                              log_func: Optional[Callable[[str], None]] = None,
+                              workers: Optional[int] = None,
+                              index: Optional[SharePointIndex] = None,
+                              cache: bool = False,
+                              reader: str = "pandas",
+                              keep_dataframes: bool = False,
+                              progress_func: Optional[Callable[[int, int], None]] = None,
+                              cancel_event: Optional[threading.Event] = None,
+                              profile: Optional[str] = None,
+                              prefetch: Optional[int] = None,
+                              outputs: Optional[list[str]] = None,
+                              aggregate_outputs: Optional[list[str]] = None,
+                              consolidate: bool = False,
+                              delta: bool = False,
+                              backend: Optional[StorageBackend] = None,
+                              release_pattern: Optional[str | re.Pattern[str]] = None,
+                              release_func: Optional[Callable[[str], None]] = None) -> dict[str, tuple[list, list]]:
+    """
+    Convert the files of several releases at once, as `find_and_convert_files` does for one.
+
+    The tree is scanned once for all the releases (unless `index` is given) and the files of every
+    release go through a single conversion pool (and prefetcher), so the pool never drains between
+    two releases and the run grows with the number of files, not with the number of releases. The
+    results are still consumed release by release, region by region, so each release gets its own
+    outputs, aggregate, manifest and cache in its `save_paths` folder, and the log reads as if the
+    releases were processed one after another.
+
+    Parameters:
+    - releases (list[str]): The releases to convert, in processing order.
+    - save_paths (dict[str, str | Path]): The save path of each release.
+    - release_func (Optional[Callable[[str], None]]): Called with each release before processing it, 
+      e.g. to log its start.
+    - The other parameters are those of `find_and_convert_files`. With `profile` a single summary is
+      logged at the end, saved in the folder of the first release.
+
+    Return:
+    - For each processed release, the converted files and the errors, as returned by `find_and_convert_files`
     """
-    
-    dataframes = []
-    errors = []
     if isinstance(pattern, str):
         pattern = re.compile(pattern)
     
@@ -163,43 +473,440 @@ def find_and_convert_files(release: str,
         else:
             print(message)
 
-    for root_dir in Path(search_path).glob("*"):
-        region = root_dir.name
-        if region in regions:
-            log(f"\nProcessing region: {region}")
-
-            # Search for folders matching the release name in the region directory
-            for sub_dir in (root_dir / budget_definition_folder).rglob("*"):
-                folder_name_cleaned = re.sub(r"\W", " ", sub_dir.name)
-                release_cleaned = re.sub(r"\W", " ", release)
-
-                
-                if folder_name_cleaned == release_cleaned:
-                    for file in sub_dir.rglob("*"):
-                        if pattern.match(file.name.upper()):
-                            log(f"\tFile found: {file.name}")
-                            
-                            df = convert_file(file_path=file,
-                                        save_path=save_path/region,
-                                        log_func=log_func)
-                            
-                            if isinstance(df, pd.DataFrame):
-                                dataframes.append(df)
-                            elif isinstance(df, Path):
-                                errors.append(df)
-            log('-------------------------------')
-            
-    if dataframes:
-        aggregate_df = pd.concat(dataframes)
-        timestamp = datetime.now().strftime("%Y_%m_%d")
-        name = f"{timestamp}_aggregate"
-        aggregate_df.to_csv(save_path / f"{name}.txt", header=False, index=False, sep='\t', mode='w')
-        aggregate_df.to_excel(save_path / f"{name}.xlsx", index=False)
-        log(f"Data saved in {save_path}")
-    else:
-        log("No files found")
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
+    # Fail before converting anything if a format is unknown or needs a missing package
+    writers = get_writers(outputs)
+    get_writers(aggregate_outputs)
+
+    profiler = make_profiler(profile)
+
+    if backend is None:
+        backend = LocalBackend(search_path)
+    if not backend.local:
+        # Remote files cannot be parsed in place
+        prefetch = max(prefetch or 0, 1)
+
+    with profiler.span("scan"):
+        if index is None:
+            index = SharePointIndex(search_path, regions, budget_definition_folder, file_pattern=pattern,
+                                    release_pattern=release_pattern, releases=releases, backend=backend)
+
+        # Collect the files to convert for each release and region first, so they can be handed to the pool at once
+        release_files = {
+            release: [(region, index.get_files(region, release)) for region in index.get_regions()]
+            for release in releases
+        }
+
+    # Unchanged files are served from the cache, only the others are converted
+    conversion_caches = {
+        release: ConversionCache(save_paths[release], pattern, hash_func=backend.content_hash) if cache else None 
+        for release in releases
+    }
+    cached = {}
+    for release in releases:
+        conversion_cache = conversion_caches[release]
+        if conversion_cache is None:
+            continue
+        for region, files in release_files[release]:
+            for file in files:
+                entry = conversion_cache.lookup(file.path, size=file.size, mtime=file.mtime)
+                if entry is not None:
+                    cached[file.path] = entry
+
+    jobs = [
+        (file.path, Path(save_paths[release]) / region) 
+        for release in releases for region, files in release_files[release] for file in files 
+        if file.path not in cached
+    ]
+    # The cache records the content hash of each converted file: when it is the SHA-256 of the content, the
+    # workers hash the copy they read, otherwise the backend provides it (e.g. from the Graph listing)
+    results = _convert_all(jobs, workers=workers, log_func=log_func, reader=reader, profiler=profiler, prefetch=prefetch,
+                           outputs=outputs, copy_func=backend.download, hash_files=cache and backend.content_sha256)
+
+    timestamp = datetime.now().strftime("%Y_%m_%d")
+    total_files = sum(len(files) for release in releases for _, files in release_files[release])
+    done_files = 0
+    if progress_func:
+        progress_func(done_files, total_files)
+
+    processed = {}
+    try:
+        for release in releases:
+            if cancelled():
+                break
+            if release_func:
+                release_func(release)
+
+            save_path = Path(save_paths[release])
+            conversion_cache = conversion_caches[release]
+            results_by_file = []
+            errors = []
+
+            # Rows are appended to the aggregate as soon as each file is converted
+            aggregate = AggregateSink(save_path, f"{timestamp}_aggregate", outputs=aggregate_outputs)
+            consolidated = None
+            if consolidate or delta:
+                consolidated = ConsolidatedAggregate(save_path, f"{timestamp}_aggregate", outputs=aggregate_outputs,
+                                                     write_outputs=consolidate)
+
+            # Maps every output back to its SharePoint source, for `put_tag`, and records the time 
+            # spent per converted and cached file, for `plan_releases`
+            manifest = DownloadManifest(save_path, release)
+            timing = {"workers": workers or 1, "converted_files": 0, "converted_bytes": 0, "converted_seconds": 0.0,
+                      "cached_files": 0, "cached_seconds": 0.0}
+
+            for region, files in release_files[release]:
+                if cancelled():
+                    break
+                log(f"\nProcessing region: {region}")
+                for file in files:
+                    if cancelled():
+                        break
+                    log(f"\tFile found: {file.name}")
+                    started = time.perf_counter()
+                    
+                    if file.path in cached:
+                        df = convert_cached(cached[file.path], file.path, save_path / region, log_func=log_func,
+                                            profiler=profiler, outputs=outputs)
+                    else:
+                        df, content_hash = next(results)
+                        if conversion_cache is not None and isinstance(df, pd.DataFrame):
+                            conversion_cache.store(file.path, df.values.tolist(), int(df["QTY"].sum()),
+                                                   size=file.size, mtime=file.mtime, content_hash=content_hash)
+                    
+                    if isinstance(df, pd.DataFrame):
+                        with profiler.span("aggregate", file.path):
+                            summary = aggregate.append(df, source=file.path)
+                            if consolidated is not None:
+                                consolidated.append(df, source=file.path)
+                        results_by_file.append(df if keep_dataframes else summary)
+                        manifest.add(region, file.path, search_path, 
+                                     outputs=[f"{region}/{file.path.stem}{writer.extension}" for writer in writers],
+                                     rows=summary.rows, total=summary.total)
+                    elif isinstance(df, Path):
+                        errors.append(df)
+
+                    if file.path in cached:
+                        timing["cached_files"] += 1
+                        timing["cached_seconds"] += time.perf_counter() - started
+                    else:
+                        timing["converted_files"] += 1
+                        timing["converted_bytes"] += file.size
+                        timing["converted_seconds"] += time.perf_counter() - started
+
+                    done_files += 1
+                    if progress_func:
+                        progress_func(done_files, total_files)
+                log('-------------------------------')
+
+            if cancelled():
+                # Stop the conversions still running; the aggregates and the manifest of a partial run
+                # are dropped, so that those of the last complete run stay in place for the tag and the upload
+                results.close()
+                aggregate.abort()
+                if consolidated is not None:
+                    consolidated.abort()
+                log("Process cancelled, the remaining files were skipped and nothing was published "
+                    "(no aggregate, manifest or delta written)")
+            else:
+                with profiler.span("aggregate"):
+                    aggregate.close()
+                    consolidation = consolidated.close() if consolidated is not None else None
+                if consolidate and consolidation is not None:
+                    log(f"Consolidated aggregate: {consolidation.keys} keys from {consolidation.rows} rows")
+                    if consolidation.duplicate_keys:
+                        log(f"\t{consolidation.duplicate_keys} keys found in more than one row ({consolidation.duplicate_rows} rows), "
+                            f"see {timestamp}_aggregate_duplicates.xlsx")
+                if manifest.files:
+                    manifest.timing = timing
+                    manifest.save()
+                if delta and consolidation is not None:
+                    with profiler.span("delta"):
+                        _write_delta(consolidated.to_frame(), save_path, f"{timestamp}_delta", errors, log)
+
+            if conversion_cache is not None:
+                conversion_cache.save()
+                    
+            if not cancelled():
+                log(f"Data saved in {save_path}" if aggregate.summaries else "No files found")
+
+            processed[release] = (results_by_file, errors)
+    finally:
+        results.close()
+
+    if releases:
+        profiler.report(log, profile_path(save_paths[releases[0]], "download"))
         
-    return dataframes, errors
+    return processed
+
+
+def watch_releases(releases: list[str],
+                   pattern: str | re.Pattern[str],
+                   search_path: str | Path,
+                   regions: list | tuple | set,
+                   budget_definition_folder: str,
+                   save_paths: dict[str, str | Path],
+                   log_func: Optional[Callable[[str], None]] = None,
+                   interval: float = 10.0,
+                   settle: float = 30.0,
+                   full_scan_every: int = 30,
+                   cancel_event: Optional[threading.Event] = None,
+                   max_polls: Optional[int] = None,
+                   workers: Optional[int] = None,
+                   reader: str = "pandas",
+                   outputs: Optional[list[str]] = None,
+                   aggregate_outputs: Optional[list[str]] = None,
+                   consolidate: bool = False,
+                   delta: bool = False,
+                   release_pattern: Optional[str | re.Pattern[str]] = None) -> dict[str, int]:
+    """
+    Keep the releases converted while new budget files land on SharePoint, until `cancel_event` is set.
+
+    A first download brings every release up to date, then a `TreeWatcher` polls the release folders
+    every `interval` seconds. When files settle (unchanged for `settle` seconds), only those files
+    are converted; the rows of every file are kept in a `LiveAggregate` per release, loaded once
+    from the conversion cache after the first download, so the aggregates, manifest and delta are
+    updated with the settled files alone, without scanning or reading the other files again. Files
+    still changing keep their last settled conversion.
+
+    Parameters:
+    - releases (list[str]): The releases to watch.
+    - save_paths (dict[str, str | Path]): The save path of each release.
+    - interval (float): Seconds between two polls.
+    - settle (float): Seconds a file must stay unchanged before it is converted.
+    - full_scan_every (int): Every how many polls all the folders are listed again, for files edited in place.
+    - cancel_event (Optional[threading.Event]): When set, the watch stops at the next poll.
+    - max_polls (Optional[int]): Stop after this many polls, None to watch until cancelled.
+    - The other parameters are those of `find_and_convert_files`.
+
+    Return:
+    - The number of files converted while watching, per release
+    """
+
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
+
+    if cancel_event is None:
+        cancel_event = threading.Event()
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    search_path = Path(search_path)
+
+    watcher = TreeWatcher(search_path, regions, budget_definition_folder, file_pattern=pattern, releases=releases,
+                          settle=settle, full_scan_every=full_scan_every, release_pattern=release_pattern)
+
+    find_and_convert_releases(
+        releases, pattern, search_path, regions, budget_definition_folder, save_paths,
+        log_func=log_func, workers=workers, index=watcher, cache=True, reader=reader, cancel_event=cancel_event,
+        outputs=outputs, aggregate_outputs=aggregate_outputs, consolidate=consolidate, delta=delta,
+        release_func=lambda release: log(f"Starting download process for release: {release}")
+    )
+    converted = {release: 0 for release in releases}
+    if cancel_event.is_set():
+        return converted
+
+    # The rows of every downloaded file, from the cache the download has just saved
+    states = {}
+    for release in releases:
+        save_path = Path(save_paths[release])
+        manifest = DownloadManifest.load(save_path) or DownloadManifest(save_path, release)
+        conversion_cache = ConversionCache(save_path, pattern)
+        aggregate = LiveAggregate(save_path, outputs=aggregate_outputs)
+        for entry in manifest.files:
+            source = search_path / PurePosixPath(entry["source"])
+            cached = conversion_cache.entries.get(str(source))
+            if cached is not None:
+                aggregate.update(source, entry["region"], _cached_frame(cached))
+        states[release] = (manifest, conversion_cache, aggregate)
+
+    log(f"\nWatching {', '.join(releases)} every {interval:g} s (files converted after {settle:g} s without changes)")
+
+    polls = 0
+    while (max_polls is None or polls < max_polls) and not cancel_event.wait(interval):
+        polls += 1
+        events = watcher.poll()
+        if not events:
+            continue
+
+        timestamp = datetime.now().strftime("%Y_%m_%d")
+        for release in releases:
+            release_events = [event for event in events if event.release == release]
+            if not release_events:
+                continue
+
+            log(f"\nUpdating release: {release}")
+            save_path = Path(save_paths[release])
+            manifest, conversion_cache, aggregate = states[release]
+            changed = [event for event in release_events if event.kind != "removed"]
+            results = _convert_all([(event.path, save_path / event.region) for event in changed], workers=workers,
+                                   log_func=log_func, reader=reader, outputs=outputs, hash_files=True)
+            errors = []
+            try:
+                for event in release_events:
+                    log(f"File {event.kind} in {event.region}, {event.release}: {event.path.name}")
+                    entry = manifest.remove(event.path, search_path)
+                    if event.kind == "removed":
+                        aggregate.remove(event.path)
+                        _remove_outputs(entry, save_path, log)
+                        continue
+
+                    df, content_hash = next(results)
+                    if not isinstance(df, pd.DataFrame):
+                        # Left out, as by a download: its rows are no longer in the aggregates nor its outputs in the folder
+                        aggregate.remove(event.path)
+                        _remove_outputs(entry, save_path, log)
+                        errors.append(df)
+                        continue
+                    file = next(file for file in watcher.get_files(event.region, release) if file.path == event.path)
+                    conversion_cache.store(event.path, df.values.tolist(), int(df["QTY"].sum()),
+                                           size=file.size, mtime=file.mtime, content_hash=content_hash)
+                    summary = aggregate.update(event.path, event.region, df)
+                    manifest.add(event.region, event.path, search_path,
+                                 outputs=[f"{event.region}/{event.path.stem}{writer.extension}"
+                                          for writer in get_writers(outputs)],
+                                 rows=summary.rows, total=summary.total)
+                    converted[release] += 1
+            finally:
+                results.close()
+
+            consolidation = aggregate.write(f"{timestamp}_aggregate", consolidate=consolidate)
+            if consolidate and consolidation is not None:
+                log(f"Consolidated aggregate: {consolidation.keys} keys from {consolidation.rows} rows")
+                if consolidation.duplicate_keys:
+                    log(f"\t{consolidation.duplicate_keys} keys found in more than one row ({consolidation.duplicate_rows} rows), "
+                        f"see {timestamp}_aggregate_duplicates.xlsx")
+            manifest.save()
+            if delta:
+                _write_delta(aggregate.to_frame(), save_path, f"{timestamp}_delta", errors, log)
+            conversion_cache.save()
+            log(f"Data saved in {save_path}" if manifest.files else "No files left")
+            log('-------------------------------')
+
+    return converted
+
+
+def _remove_outputs(entry: Optional[dict], save_path: Path, log: Callable[[str], None]):
+    """
+    Delete the per-file outputs of a manifest entry, so that the release folder only holds the
+    outputs of the files still in the manifest.
+    """
+    for output in (entry or {}).get("outputs", []):
+        try:
+            (save_path / output).unlink(missing_ok=True)
+        except OSError as e:
+            log(f" Error removing '{output}': {e}")
+
+
+def _write_delta(consolidated: pd.DataFrame, save_path: Path, name: str, errors: list, log: Callable[[str], None]):
+    """
+    Write the added, changed and removed rows of a consolidated aggregate since the last upload as
+    `{name}_added.txt`, `{name}_changed.txt` and `{name}_removed.txt`, and stage it as the snapshot 
+    of the next upload.
+    """
+    snapshot = AggregateSnapshot(save_path)
+    delta = snapshot.diff(consolidated)
+    if delta is None:
+        log("No uploaded snapshot of this release yet, the delta is the whole aggregate")
+        delta = (consolidated, consolidated.iloc[:0], consolidated.iloc[:0])
+
+    for kind, rows in zip(("added", "changed", "removed"), delta):
+        TxtWriter.write(rows, save_path / f"{name}_{kind}.txt")
+    added, changed, removed = delta
+    log(f"Delta since the last upload: {len(added)} rows added, {len(changed)} changed, {len(removed)} removed")
+    if errors:
+        log(f"\t{len(errors)} files could not be converted, their rows are counted as removed")
+    snapshot.stage(consolidated)
+
+
+def _apply_renames(renames: list[tuple[str, str, str]],
+                   sharepoint_path: str | Path,
+                   journal: TagJournal,
+                   run: str,
+                   rollback: bool = False,
+                   workers: int = 8,
+                   log_func: Optional[Callable[[str], None]] = None,
+                   progress_func: Optional[Callable[[int, int], None]] = None,
+                   cancel_event: Optional[threading.Event] = None,
+                   profiler: Profiler | NullProfiler = NULL_PROFILER,
+                   backend: Optional[StorageBackend] = None,
+                   error_func: Optional[Callable[[Path, OSError], None]] = None) -> list[Path]:
+    """
+    Rename (region, source, target) SharePoint files concurrently, recording each rename in the journal.
+
+    The renames run in a thread pool, but their results are logged in the order of `renames`.
+    With `rollback` the files are renamed back from target to source. The renames go through
+    `backend`, by default the local folder `sharepoint_path`. Each failed rename is logged and
+    passed to `error_func` with the file it was renaming.
+
+    Return:
+    - The new paths of the renamed files
+    """
+    
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message)
+
+    sharepoint_path = Path(sharepoint_path)
+    if backend is None:
+        backend = LocalBackend(sharepoint_path)
+    action = "rolled_back" if rollback else "renamed"
+
+    def rename(item):
+        _, source, target = item
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        old_path, new_path = sharepoint_path / source, sharepoint_path / target
+        if rollback:
+            old_path, new_path = new_path, old_path
+
+        try:
+            with profiler.span("rename", source):
+                if not backend.exists(old_path) and backend.exists(new_path):
+                    # Already done by an interrupted run, the journal just missed it
+                    journal.record(run, action, source, target)
+                    return new_path
+                backend.rename(old_path, new_path)
+        except OSError as e:
+            return e
+        journal.record(run, action, source, target)
+        return new_path
+
+    renamed = []
+    done_files = 0
+    if progress_func:
+        progress_func(done_files, len(renames))
+
+    current_region = None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (region, source, _), result in zip(renames, executor.map(rename, renames)):
+            if region != current_region:
+                if current_region is not None:
+                    log('-------------------------------')
+                log(f"\nProcessing region: {region}")
+                current_region = region
+
+            if isinstance(result, Path):
+                renamed.append(result)
+                log(f" File {'restored' if rollback else 'renamed'}: {PurePosixPath(source).name}")
+            elif isinstance(result, OSError):
+                log(f" Error renaming '{PurePosixPath(source).name}': {result}")
+                if error_func:
+                    error_func(sharepoint_path / source, result)
+
+            done_files += 1
+            if progress_func:
+                progress_func(done_files, len(renames))
+    if current_region is not None:
+        log('-------------------------------')
+
+    return renamed
 
 
 def put_tag(release: str,
@@ -209,9 +916,44 @@ def put_tag(release: str,
             regions: list | tuple | set, 
             budget_definition_folder: str,
             tag: str = 'UPLOADED',
-            log_func: Optional[Callable[[str], None]] = None
-            ) -> None:
-    
+            log_func: Optional[Callable[[str], None]] = None,
+            progress_func: Optional[Callable[[int, int], None]] = None,
+            cancel_event: Optional[threading.Event] = None,
+            workers: int = 8,
+            profile: Optional[str] = None,
+            backend: Optional[StorageBackend] = None,
+            error_func: Optional[Callable[[Path, OSError], None]] = None
+            ) -> list[Path]:
+    """
+    Tag the SharePoint files of the last download of a release, prepending `tag` to their names.
+
+    The files to rename are read from the `DownloadManifest` written in `search_path` by 
+    `find_and_convert_files`, so no folder is scanned. The renames run concurrently and are 
+    recorded in the `TagJournal` of `search_path`, so that an interrupted run can be completed 
+    with `resume_tag` or undone with `rollback_tag`.
+
+    Parameters:
+    - release (str): The release name.
+    - pattern (str | re.Pattern): The pattern of the files to process; files not matching it anymore 
+      (e.g. already tagged) are skipped.
+    - search_path (str | Path): The save path of the release, containing the download manifest.
+    - sharepoint_path (str | Path): The SharePoint folder.
+    - regions (list | tuple | set): The regions to tag.
+    - budget_definition_folder (str): The name of the budget folder (kept for compatibility, the manifest has the full paths).
+    - tag (str): The tag prepended to the file names.
+    - log_func (Optional[Callable[[str], None]]): A function to handle log messages.
+    - progress_func (Optional[Callable[[int, int], None]]): Called with the number of processed files and the total.
+    - cancel_event (Optional[threading.Event]): When set, the files not renamed yet are skipped.
+    - workers (int): Number of concurrent renames.
+    - profile (Optional[str]): Time the renames ("timing", "cprofile" or "tracemalloc") and log a 
+      summary table at the end, also saved as JSON in `search_path`.
+    - backend (Optional[StorageBackend]): Renames the SharePoint files, by default in the local folder `sharepoint_path`.
+    - error_func (Optional[Callable[[Path, OSError], None]]): Called with each SharePoint file that could not be
+      renamed (e.g. locked, or its tagged name already exists) and the error.
+
+    Return:
+    - The new paths of the renamed files
+    """
 
     def log(message):
         if log_func:
@@ -222,20 +964,131 @@ def put_tag(release: str,
     if isinstance(pattern, str):
         pattern = re.compile(pattern)
 
+    manifest = DownloadManifest.load(search_path)
+    if manifest is None:
+        log(f"No download manifest in {search_path}, download the release first")
+        return []
 
-    for root_dir in Path(search_path).rglob("*"):
-        region = root_dir.name
-        if region in regions:
-            log(f"\nProcessing region: {region}")
-            files = [f for f in root_dir.iterdir() if f.is_file()]
-            newest_date = max(datetime.fromtimestamp(f.stat().st_mtime).date() for f in files)
-            newest_files = [f.name for f in files 
-                if datetime.fromtimestamp(f.stat().st_mtime).date() == newest_date]
-
-            for file in Path(sharepoint_path / region / budget_definition_folder / release).rglob("*"):
-                if file.name in newest_files:
-                    new_name = file.with_name(f"{tag}_" + file.name)
-                    file.rename(new_name)
-                    log(f" File renamed: {file.name}") 
-            log('-------------------------------')
-  
\ No newline at end of file
+    renames = []
+    for entry in manifest.files:
+        source = PurePosixPath(entry["source"])
+        if entry["region"] in regions and pattern.match(source.name.upper()):
+            renames.append((entry["region"], source.as_posix(), (source.parent / f"{tag}_{source.name}").as_posix()))
+
+    profiler = make_profiler(profile)
+    journal = TagJournal(search_path)
+    run = journal.begin(renames, tag)
+    renamed = _apply_renames(renames, sharepoint_path, journal, run, workers=workers, log_func=log_func,
+                             progress_func=progress_func, cancel_event=cancel_event, profiler=profiler, backend=backend,
+                             error_func=error_func)
+
+    if cancel_event is not None and cancel_event.is_set():
+        log("Process cancelled, the remaining files were not renamed (resume with `resume_tag`)")
+    else:
+        journal.end(run)
+        snapshot = AggregateSnapshot(search_path)
+        if snapshot.has_pending():
+            # The files filtered out by region or pattern were not part of this tag run
+            if renames and len(renamed) == len(renames):
+                snapshot.commit(run)
+                log("Upload confirmed, the next delta starts from this download")
+            else:
+                log("Not every file selected for the tag was renamed, the snapshot of the last upload was not updated")
+
+    profiler.report(log, profile_path(search_path, "tag"))
+
+    return renamed
+
+
+def resume_tag(search_path: str | Path,
+               sharepoint_path: str | Path,
+               log_func: Optional[Callable[[str], None]] = None,
+               workers: int = 8,
+               backend: Optional[StorageBackend] = None,
+               error_func: Optional[Callable[[Path, OSError], None]] = None) -> list[Path]:
+    """
+    Complete the last tag run of a release if it was interrupted, using only its journal.
+    Once every rename of the run is done, the upload is confirmed as by `put_tag`: the pending
+    `AggregateSnapshot` becomes the base of the next delta.
+
+    Parameters:
+    - search_path (str | Path): The save path of the release, containing the tag journal.
+    - sharepoint_path (str | Path): The SharePoint folder.
+    - backend (Optional[StorageBackend]): Renames the SharePoint files, by default in the local folder `sharepoint_path`.
+    - error_func (Optional[Callable[[Path, OSError], None]]): Called with each SharePoint file that could not be
+      renamed and the error.
+
+    Return:
+    - The new paths of the files renamed now
+    """
+
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message) 
+
+    journal = TagJournal(search_path)
+    last_run = journal.last_run()
+    if last_run is None or last_run[1]["ended"]:
+        log("No interrupted tag run to resume")
+        return []
+
+    run, state = last_run
+    pending = [rename for rename in state["renames"] if tuple(rename[1:]) not in state["renamed"]]
+    renamed = _apply_renames(pending, sharepoint_path, journal, run, workers=workers, log_func=log_func, backend=backend,
+                             error_func=error_func)
+    journal.end(run)
+
+    # The upload is confirmed once every rename planned by the interrupted `put_tag` is done
+    state = journal.read_runs()[run]
+    if all(tuple(rename[1:]) in state["renamed"] for rename in state["renames"]):
+        if AggregateSnapshot(search_path).commit(run):
+            log("Upload confirmed, the next delta starts from this download")
+    return renamed
+
+
+def rollback_tag(search_path: str | Path,
+                 sharepoint_path: str | Path,
+                 log_func: Optional[Callable[[str], None]] = None,
+                 workers: int = 8,
+                 backend: Optional[StorageBackend] = None,
+                 error_func: Optional[Callable[[Path, OSError], None]] = None) -> list[Path]:
+    """
+    Undo the renames of the last tag run of a release (complete or interrupted), using only its journal.
+    If the run confirmed the upload, the `AggregateSnapshot` it replaced becomes the base of the
+    next delta again.
+
+    Parameters:
+    - search_path (str | Path): The save path of the release, containing the tag journal.
+    - sharepoint_path (str | Path): The SharePoint folder.
+    - backend (Optional[StorageBackend]): Renames the SharePoint files, by default in the local folder `sharepoint_path`.
+    - error_func (Optional[Callable[[Path, OSError], None]]): Called with each SharePoint file that could not be
+      renamed and the error.
+
+    Return:
+    - The restored paths of the files
+    """
+
+    def log(message):
+        if log_func:
+            log_func(message)
+        else:
+            print(message) 
+
+    journal = TagJournal(search_path)
+    last_run = journal.last_run()
+    if last_run is None:
+        log("No tag run to roll back")
+        return []
+
+    run, state = last_run
+    done = [rename for rename in state["renames"] 
+            if tuple(rename[1:]) in state["renamed"] and tuple(rename[1:]) not in state["rolled_back"]]
+    restored = _apply_renames(done, sharepoint_path, journal, run, rollback=True, workers=workers, log_func=log_func,
+                              backend=backend, error_func=error_func)
+    journal.end(run)
+
+    if AggregateSnapshot(search_path).restore(run):
+        log("Upload unconfirmed, the next delta starts again from the previous upload")
+    return restored
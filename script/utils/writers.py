@@ -0,0 +1,190 @@
+import importlib.util
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import openpyxl
+import pandas as pd
+
+# Outputs written when config.yaml does not choose them
+DEFAULT_OUTPUTS = ["txt", "xlsx"]
+
+
+class OutputWriter(ABC):
+    """
+    Writer of an output file, built by appending DataFrames (one for a converted file, one per
+    file for the aggregate).
+
+    Everything is written to a hidden temporary file next to `path`, renamed to `path` by `close`,
+    so that a crash never leaves a half-written output; `abort` discards the temporary file.
+
+    Attributes:
+        path (Path): The output file.
+        tmp_path (Path): The temporary file written until `close`.
+    """
+    name = ""
+    extension = ""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+
+    @abstractmethod
+    def append(self, df: pd.DataFrame):
+        """Write the rows of `df` to the temporary file."""
+
+    @abstractmethod
+    def _finish(self):
+        """Flush and close the temporary file."""
+
+    def _discard(self):
+        """Close the temporary file without completing it; by default by finishing it, when that is cheap."""
+        self._finish()
+
+    def close(self):
+        self._finish()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._discard()
+        except Exception:
+            pass
+        self.tmp_path.unlink(missing_ok=True)
+
+    @classmethod
+    def write(cls, df: pd.DataFrame, path: str | Path):
+        """Write `df` to `path` atomically."""
+        writer = cls(path)
+        try:
+            writer.append(df)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+
+class TxtWriter(OutputWriter):
+    """Tab-separated text without header nor index, the format loaded into SAP."""
+    name = "txt"
+    extension = ".txt"
+
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        # newline="" leaves the line terminator to `to_csv` and UTF-8 is what `to_csv` writes to a path,
+        # whatever the locale (cp1252 on Windows would change or reject the non-ASCII descriptions)
+        self._file = open(self.tmp_path, "w", newline="", encoding="utf-8")
+
+    def append(self, df: pd.DataFrame):
+        df.to_csv(self._file, header=False, index=False, sep='\t')
+
+    def _finish(self):
+        self._file.close()
+
+
+class XlsxWriter(OutputWriter):
+    """Excel workbook with a header row, streamed row by row by an openpyxl write-only workbook."""
+    name = "xlsx"
+    extension = ".xlsx"
+
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._header = False
+
+    def append(self, df: pd.DataFrame):
+        if not self._header:
+            self._sheet.append(list(df.columns))
+            self._header = True
+        for row in df.astype("object").itertuples(index=False, name=None):
+            self._sheet.append(row)
+
+    def _finish(self):
+        if self._workbook is not None:
+            self._workbook.save(self.tmp_path)
+            self._workbook = None
+
+    def _discard(self):
+        # Saving would zip every row only to delete the file: the sheet is closed (ending the rows
+        # streamed to its temporary file) and that file removed instead
+        if self._workbook is not None:
+            self._sheet.close()
+            if self._sheet._writer is not None:
+                self._sheet._writer.cleanup()
+            self._workbook = None
+
+
+class _ArrowWriter(OutputWriter):
+    """
+    Base of the pyarrow formats, for our own analytics. Every column but QTY is stored as strings,
+    since a column mixing numbers and text (e.g. SIZE) cannot be stored as is and the same column
+    may be parsed as numbers in a file and as text in another: the schema of the first DataFrame
+    is then valid for the following ones.
+    """
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self._writer = None
+        self._schema = None
+
+    @abstractmethod
+    def _open(self, schema):
+        """Return the pyarrow writer of the temporary file."""
+
+    def append(self, df: pd.DataFrame):
+        import pyarrow as pa
+
+        df = df.reset_index(drop=True)
+        df = df.astype({column: str for column in df.columns if column != "QTY"})
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._open(self._schema)
+        self._writer.write_table(table)
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ParquetWriter(_ArrowWriter):
+    """Parquet file, written one row group per appended DataFrame."""
+    name = "parquet"
+    extension = ".parquet"
+
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.tmp_path, schema)
+
+
+class FeatherWriter(_ArrowWriter):
+    """Feather (Arrow IPC) file, written one record batch per appended DataFrame."""
+    name = "feather"
+    extension = ".feather"
+
+    def _open(self, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(str(self.tmp_path), schema)
+
+
+WRITERS = {writer.name: writer for writer in (TxtWriter, XlsxWriter, ParquetWriter, FeatherWriter)}
+
+
+def get_writers(outputs: Optional[list[str]] = None) -> list[type[OutputWriter]]:
+    """
+    Return the writer classes of the `outputs` formats (default `DEFAULT_OUTPUTS`).
+
+    The TXT is always written, first, since it is what SAP loads; listing only "txt" skips the
+    per-file XLSX. Unknown formats and the pyarrow formats without pyarrow raise a ValueError.
+    """
+    outputs = list(outputs) if outputs else list(DEFAULT_OUTPUTS)
+    unknown = [output for output in outputs if output not in WRITERS]
+    if unknown:
+        raise ValueError(f"Unknown output formats {unknown}, expected some of {list(WRITERS)}")
+    if any(issubclass(WRITERS[output], _ArrowWriter) for output in outputs) and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("The parquet and feather outputs need pyarrow: pip install pyarrow")
+
+    names = ["txt"] + [output for output in dict.fromkeys(outputs) if output != "txt"]
+    return [WRITERS[name] for name in names]
@@ -0,0 +1,145 @@
+from array import array
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
+
+from utils.convert_kernel import COLUMNS
+
+
+def _convert_cell(cell):
+    """Convert a cell value exactly like the openpyxl reader of `pd.read_excel`."""
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return float("nan")
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def iter_budget_rows(file_path: str | Path, max_empty_rows: int = 1000) -> Iterator[list]:
+    """
+    Stream the rows of the columns A:F of an Excel file, header included.
+
+    The workbook is opened in read-only mode and only the first six columns are read. Empty rows
+    are held back until a non-empty row follows them, so trailing empty rows are dropped as in
+    `pd.read_excel`; after `max_empty_rows` consecutive empty rows the sheet is considered finished,
+    which is where formatted but empty templates spend most of their reading time. The sheet does
+    not end at the first empty row on purpose: `pd.read_excel` reads the rows after a blank line
+    (and the blank line turns the integer columns into floats), so stopping there would change the
+    result; a gap of `max_empty_rows` rows is taken as the end of the data instead.
+
+    Parameters:
+    - file_path (str | Path): The path of the Excel file to read.
+    - max_empty_rows (int): Number of consecutive empty rows after which the reading stops.
+
+    Return:
+    - Iterator of rows of six values, converted like `pd.read_excel` does
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+
+        empty_rows = 0
+        for row in sheet.iter_rows(max_col=6):
+            values = [_convert_cell(cell) for cell in row]
+            values += [""] * (6 - len(values))
+
+            if all(value == "" for value in values):
+                empty_rows += 1
+                if empty_rows >= max_empty_rows:
+                    break
+                continue
+
+            for _ in range(empty_rows):
+                yield [""] * 6
+            empty_rows = 0
+            yield values
+    finally:
+        workbook.close()
+
+
+def _typed_values(values: list) -> pd.Series:
+    """
+    Type the distinct values of a column with the parser used by `pd.read_excel`.
+
+    The type the parser infers for a column (int, float, bool, str or object) and the value each
+    cell becomes only depend on which values the column holds, not on how often or where, so
+    typing the distinct values gives the same column as typing every row.
+    """
+    return TextParser([["VALUE"]] + [[value] for value in values], header=0, skip_blank_lines=False).read()["VALUE"]
+
+
+def read_budget_workbook(file_path: str | Path,
+                         round_func: Callable[[pd.Series], pd.Series],
+                         chunk_size: int = 50000,
+                         max_empty_rows: int = 1000) -> tuple[pd.DataFrame, int]:
+    """
+    Read the budget rows of an Excel file with `iter_budget_rows`, rounding the QTY.
+
+    The rows are read in a single pass that keeps, for each column, the table of its distinct
+    values and one int32 code per row, so the sheet is never held as Python rows: the memory grows
+    by 24 bytes per row (and with the distinct values), well below the DataFrame that is returned.
+    Once the sheet is read, the distinct values of each column are typed by the parser of
+    `pd.read_excel`, which gives each column the dtype the whole column would get (a null or a
+    text anywhere in the column decides it), then the DataFrame is built `chunk_size` rows at a
+    time: the incomplete rows are dropped, the QTY is rounded and summed into the total budget.
+    The rows keep their position in the sheet as index, so the DataFrame is identical to the one of
+    `pd.read_excel(usecols="A:F", ...).dropna()` with the QTY rounded.
+
+    Parameters:
+    - file_path (str | Path): The path of the Excel file to read.
+    - round_func (Callable[[pd.Series], pd.Series]): Function rounding a QTY series to integers.
+    - chunk_size (int): Number of rows typed and rounded at a time.
+    - max_empty_rows (int): Number of consecutive empty rows after which the reading stops, see `iter_budget_rows`.
+
+    Return:
+    - The DataFrame of the file with QTY rounded
+    - The total budget of the file
+    """
+    rows = iter_budget_rows(file_path, max_empty_rows=max_empty_rows)
+    if next(rows, None) is None:
+        raise ValueError("The sheet is empty, no header row found")
+
+    tables = [{} for _ in COLUMNS]
+    values = [[] for _ in COLUMNS]
+    codes = [array("i") for _ in COLUMNS]
+    for row in rows:
+        for value, table, column_values, column_codes in zip(row, tables, values, codes):
+            # 1, 1.0 and True are equal as keys but not as cells; every NaN (error cell) is the same null
+            key = (type(value), value) if value == value else (float, "nan")
+            code = table.get(key)
+            if code is None:
+                code = table[key] = len(column_values)
+                column_values.append(value)
+            column_codes.append(code)
+    del tables
+
+    typed = [_typed_values(column_values) for column_values in values]
+    del values
+    codes = [np.frombuffer(column_codes, dtype=np.int32) for column_codes in codes]
+
+    rows_count = len(codes[0])
+    chunks = []
+    total_budget = 0
+    for start in range(0, rows_count, chunk_size) or [0]:
+        stop = min(start + chunk_size, rows_count)
+        chunk = pd.DataFrame(
+            {column: column_typed.array.take(column_codes[start:stop])
+             for column, column_typed, column_codes in zip(COLUMNS, typed, codes)},
+            index=pd.RangeIndex(start, stop)
+        ).dropna()
+        chunk["QTY"] = round_func(chunk["QTY"])
+        total_budget += int(chunk["QTY"].sum())
+        chunks.append(chunk)
+
+    return pd.concat(chunks) if len(chunks) > 1 else chunks[0], total_budget
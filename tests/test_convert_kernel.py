@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from hypothesis import given, strategies as st
+
+from utils.convert_kernel import TEXT_COLUMNS, normalize_text_columns, round_half_up, round_qty
+from utils.tools import normal_round
+
+# Beyond 2**52 every float is an integer, and the rounded values must fit in int64
+LIMIT = 2.0 ** 52
+
+finite_floats = st.floats(min_value=-LIMIT, max_value=LIMIT, allow_nan=False, allow_infinity=False)
+half_values = st.integers(min_value=-10**9, max_value=10**9).map(lambda n: n + 0.5)
+quantities = st.one_of(finite_floats, half_values, st.integers(min_value=-10**9, max_value=10**9))
+
+
+@given(st.lists(quantities, max_size=50))
+def test_round_half_up_matches_normal_round(values):
+    assert round_half_up(values).tolist() == [int(normal_round(value)) for value in values]
+
+
+@given(half_values)
+def test_round_half_up_rounds_ties_up(value):
+    assert round_half_up([value])[0] == value + 0.5
+
+
+@given(st.lists(quantities, min_size=1, max_size=20))
+def test_round_qty_keeps_the_index(values):
+    qty = pd.Series(values, index=np.arange(len(values)) * 2, name="QTY", dtype="float64")
+    rounded = round_qty(qty)
+    assert rounded.index.equals(qty.index)
+    assert rounded.tolist() == [int(normal_round(value)) for value in qty]
+
+
+texts = st.text(alphabet=st.sampled_from(list("AB52 \t")), max_size=6)
+cells = st.one_of(texts, st.integers(min_value=0, max_value=99))
+
+
+@given(st.lists(cells, min_size=1, max_size=30))
+def test_normalize_text_columns_strips_and_merges(values):
+    df = pd.DataFrame({column: pd.Series(values, dtype=object) for column in TEXT_COLUMNS})
+    df["QTY"] = 1
+    normalized = normalize_text_columns(df)["MODEL"]
+
+    expected = [str(value).strip() for value in values]
+    assert normalized.astype(str).tolist() == expected
+    assert sorted(normalized.cat.categories) == sorted(set(expected))
@@ -0,0 +1,105 @@
+import os
+import shutil
+
+import pytest
+
+from benchmarks.storage import start_stub
+from core.storage import GraphBackend, LocalBackend
+
+RELEASE = ("BRA", "BUDGET DEFINITION", "R1 2025")
+
+
+@pytest.fixture
+def drive(tmp_path):
+    """A local tree served by the Graph stub, with a backend paging its delta two items at a time."""
+    root = tmp_path / "sharepoint"
+    release = root.joinpath(*RELEASE)
+    (release / "sub").mkdir(parents=True)
+    for number in range(5):
+        (release / f"BRA_SKU_{number}.xlsx").write_bytes(os.urandom(1000 + number))
+    (release / "sub" / "BRA_SKU_9.xlsx").write_bytes(os.urandom(2000))
+
+    server = start_stub(root)
+    try:
+        backend = GraphBackend(server.base_url, token="test", page_size=2)
+        yield root, server, backend
+    finally:
+        server.shutdown()
+
+
+def names(backend, path) -> list[str]:
+    return [entry.name for entry in backend.list_dir(path)]
+
+
+def test_listing_matches_the_local_folder(drive):
+    root, server, backend = drive
+    local = LocalBackend(root)
+    for parts in [(), RELEASE[:1], RELEASE, RELEASE + ("sub",)]:
+        graph_entries = [(entry.name, entry.is_dir, entry.size) for entry in backend.list_dir(backend.root.joinpath(*parts))]
+        local_entries = [(entry.name, entry.is_dir, entry.size) for entry in local.list_dir(root.joinpath(*parts))]
+        assert graph_entries == local_entries
+    assert backend.stat(backend.root.joinpath(*RELEASE, "missing.xlsx")) is None
+    assert backend.list_dir(backend.root / "USA") == []
+
+
+def test_delta_listing_is_paged_then_incremental(drive):
+    root, server, backend = drive
+    backend.refresh()
+    # 11 items (root, 4 folders, 6 files) two per page
+    assert server.requests == 6
+
+    requests = server.requests
+    backend.refresh()
+    assert server.requests == requests + 1
+
+
+def test_delta_after_rename_and_delete(drive):
+    root, server, backend = drive
+    release = backend.root.joinpath(*RELEASE)
+    backend.refresh()
+
+    os.rename(root.joinpath(*RELEASE, "BRA_SKU_0.xlsx"), root.joinpath(*RELEASE, "UPLOADED_BRA_SKU_0.xlsx"))
+    shutil.rmtree(root.joinpath(*RELEASE, "sub"))
+    backend.refresh()
+
+    assert names(backend, release) == ["BRA_SKU_1.xlsx", "BRA_SKU_2.xlsx", "BRA_SKU_3.xlsx", "BRA_SKU_4.xlsx",
+                                       "UPLOADED_BRA_SKU_0.xlsx"]
+    assert backend.stat(release / "sub") is None
+    assert backend.stat(release / "sub" / "BRA_SKU_9.xlsx") is None
+
+
+def test_deleted_folder_drops_its_subtree(drive):
+    root, server, backend = drive
+    release = backend.root.joinpath(*RELEASE)
+    folder_id = backend._resolve(release)
+    file_id = backend._resolve(release / "sub" / "BRA_SKU_9.xlsx")
+
+    # Graph may report only the folder of a deleted subtree
+    backend._apply({"id": folder_id, "deleted": {}})
+
+    assert backend.list_dir(backend.root / "BRA" / "BUDGET DEFINITION") == []
+    assert folder_id not in backend._children
+    assert file_id not in backend._entries and file_id not in backend._parents
+
+
+def test_download_follows_the_redirect(drive, tmp_path):
+    root, server, backend = drive
+    source = root.joinpath(*RELEASE, "sub", "BRA_SKU_9.xlsx")
+    target = tmp_path / "staged.xlsx"
+
+    backend.download(backend.root.joinpath(*RELEASE, "sub", "BRA_SKU_9.xlsx"), target)
+    assert target.read_bytes() == source.read_bytes()
+    with pytest.raises(FileNotFoundError):
+        backend.download(backend.root.joinpath(*RELEASE, "missing.xlsx"), target)
+
+
+def test_rename_updates_the_listing(drive):
+    root, server, backend = drive
+    release = backend.root.joinpath(*RELEASE)
+
+    backend.rename(release / "BRA_SKU_1.xlsx", release / "UPLOADED_BRA_SKU_1.xlsx")
+    assert root.joinpath(*RELEASE, "UPLOADED_BRA_SKU_1.xlsx").exists()
+    assert "UPLOADED_BRA_SKU_1.xlsx" in names(backend, release)
+    assert "BRA_SKU_1.xlsx" not in names(backend, release)
+    with pytest.raises(FileExistsError):
+        backend.rename(release / "BRA_SKU_2.xlsx", release / "UPLOADED_BRA_SKU_1.xlsx")